@@ -3,16 +3,57 @@ from django.contrib.sites.models import RequestSite
 from django.contrib.sites.models import Site
 from django.utils.translation import ugettext_lazy as _
 
+from registration.models import OutboxEmail
 from registration.models import RegistrationProfile
+from registration.models import RegistrationQuerySet
+
+
+class StateListFilter(admin.SimpleListFilter):
+    """
+    Filters the profiles by activation state, using the
+    ``RegistrationQuerySet`` filters, which compare the indexed ``status``
+    and ``expires_at`` columns.
+    """
+    title = _("state")
+    parameter_name = 'state'
+
+    def lookups(self, request, model_admin):
+        return ((RegistrationQuerySet.PENDING, _("pending")),
+                (RegistrationQuerySet.EXPIRED, _("expired")),
+                (RegistrationQuerySet.ACTIVATED, _("activated")),
+                (RegistrationQuerySet.REVOKED, _("revoked")))
+
+    def queryset(self, request, queryset):
+        if self.value() in (RegistrationQuerySet.PENDING,
+                            RegistrationQuerySet.EXPIRED,
+                            RegistrationQuerySet.ACTIVATED,
+                            RegistrationQuerySet.REVOKED):
+            return getattr(queryset, self.value())()
+        return queryset
 
 
 class RegistrationAdmin(admin.ModelAdmin):
-    actions = ['resend_activation_email', 'delete_expired', 'delete_activated',
-            'clean']
-    list_display = ('email', 'activation_key_expired',
-            'activation_key_already_activated', 'activation_key_invalid')
-    search_fields = ('email',)
+    actions = ['resend_activation_email', 'revoke', 'delete_expired',
+            'delete_activated', 'clean']
+    list_display = ('email', 'reg_time', 'state')
+    list_filter = (StateListFilter,)
+    # Prefix search, which can use an index; use '=email' for exact search.
+    search_fields = ('^email',)
 
+    def queryset(self, request):
+        """
+        Annotates the profiles with their activation state, computed by the
+        database (see ``RegistrationQuerySet.with_state``), and counts
+        unfiltered changelists from the database statistics on big tables
+        (see ``RegistrationQuerySet.with_estimated_count``).
+        """
+        queryset = super(RegistrationAdmin, self).queryset(request)
+        return queryset.with_state().with_estimated_count()
+
+    def state(self, obj):
+        return obj.state
+    state.short_description = _("state")
+    state.admin_order_field = 'state'
 
     def resend_activation_email(self, request, queryset):
         """
@@ -21,28 +62,50 @@ class RegistrationAdmin(admin.ModelAdmin):
         Note that this will *only* send activation emails for users
         who are eligible to activate; emails will not be sent to users
         whose activation keys are invalid (expired or already activated).
+
+        Emails are sent in batches through a single connection, see
+        ``RegistrationManager.send_activation_emails``. The ineligible
+        profiles aren't counted, since counting a large selection would
+        cost a scan of the table.
         """
         if Site._meta.installed:
             site = Site.objects.get_current()
         else:
             site = RequestSite(request)
 
-        for profile in queryset:
-            if not profile.activation_key_invalid():
-                profile.send_activation_email(site)
+        profiles = RegistrationProfile.objects.iterate_chunks(
+            queryset.pending())
+        sent = RegistrationProfile.objects.send_activation_emails(site,
+                                                                  profiles)
+        self.message_user(request, _("%d activation email(s) sent to the "
+                                     "pending profiles selected.") % sent)
     resend_activation_email.short_description = _("Re-send activation emails")
 
+    def revoke(self, request, queryset):
+        """
+        Revokes the activation keys of the selected pending profiles.
+        """
+        revoked = queryset.pending().update(status=RegistrationProfile.REVOKED,
+                                           pending_email=None)
+        self.message_user(request, _("%d activation key(s) revoked.") %
+                          revoked)
+    revoke.short_description = _("Revoke activation keys")
+
     def delete_expired(self, request, queryset):
         """
         Deletes expired registration profiles.
         """
-        RegistrationProfile.objects.delete_expired(queryset)
+        deleted = RegistrationProfile.objects.delete_expired(queryset)
+        self.message_user(request, _("%d expired profile(s) deleted.") %
+                          deleted)
 
     def delete_activated(self, request, queryset):
         """
         Deletes already activated registration profiles.
         """
-        RegistrationProfile.objects.delete_activated(queryset)
+        deleted = RegistrationProfile.objects.delete_activated(queryset)
+        self.message_user(request, _("%d activated profile(s) deleted.") %
+                          deleted)
 
     def clean(self, request, queryset):
         """
@@ -52,3 +115,13 @@ class RegistrationAdmin(admin.ModelAdmin):
         self.delete_activated(request, queryset)
 
 admin.site.register(RegistrationProfile, RegistrationAdmin)
+
+
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('profile', 'status', 'attempts', 'next_attempt',
+                    'last_error')
+    list_filter = ('status',)
+    raw_id_fields = ('profile',)
+
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
+
@@ -1,5 +1,6 @@
 from django.core.exceptions import ImproperlyConfigured
 from django.conf import settings
+from django.test.signals import setting_changed
 
 # Python 2.7 has an importlib with import_module; for older Pythons,
 # Django's bundled copy provides it.
@@ -8,6 +9,9 @@ try: # pragma: no cover
 except ImportError: # pragma: no cover
     from django.utils.importlib import import_module # pragma: no cover
 
+# Resolved backends, see ``get_backend``.
+_backend_cache = {}
+
 def get_object(path):
     """
     Helper method in order to import an object, given the dotted Python
@@ -45,16 +49,53 @@ def get_backend(path, **kwargs):
     exists, or because the module does not contain a class of the
     appropriate name), ``django.core.exceptions.ImproperlyConfigured``
     is raised.
+
+    Resolved backends are cached per process, keyed on ``path``,
+    ``activation_method`` and the settings above, so repeated calls don't
+    import anything. When no extra ``kwargs`` are given the same backend
+    instance is returned every time, hence backends must not keep
+    per-request state. The cache is cleared by ``clear_backend_cache``,
+    which is called whenever Django's ``setting_changed`` signal is sent.
+    """
+    activation_method = kwargs.pop('activation_method', None)
+    key = (path, activation_method,
+           getattr(settings, 'ACTIVATION_METHOD', None),
+           getattr(settings, 'REGISTRATION_FORM', None),
+           getattr(settings, 'ACTIVATION_FORM', None))
+    try:
+        backend, backend_kwargs, instance = _backend_cache[key]
+    except KeyError:
+        backend, backend_kwargs = _resolve_backend(path, activation_method)
+        instance = backend(**backend_kwargs)
+        _backend_cache[key] = backend, backend_kwargs, instance
+    if not kwargs:
+        return instance
+    kwargs.update(backend_kwargs)
+    return backend(**kwargs)
+
+def _resolve_backend(path, activation_method=None):
+    """
+    Import the backend class at ``path`` and the objects configured in
+    settings, returning a two-tuple: the backend class and the keyword
+    arguments used to instantiate it.
     """
     backend = get_object(path)
     try:
-        activation_method = kwargs.get('activation_method', None) or\
+        activation_method = activation_method or\
             get_object(getattr(settings, 'ACTIVATION_METHOD'))
     except AttributeError:
         raise ImproperlyConfigured("You didn't provide an 'ACTIVATION_METHOD'")
     registration_form=get_object(getattr(settings, 'REGISTRATION_FORM', None))
     activation_form=get_object(getattr(settings, 'ACTIVATION_FORM', None))
-    # Adding required settings to kwargs
-    kwargs.update({'activation_method': activation_method, 'registration_form':
-        registration_form, 'activation_form': activation_form})
-    return backend(**kwargs)
+    return backend, {'activation_method': activation_method,
+                     'registration_form': registration_form,
+                     'activation_form': activation_form}
+
+def clear_backend_cache(**kwargs):
+    """
+    Empty the ``get_backend`` cache. Accepts any keyword arguments so that
+    it can be used as a signal receiver.
+    """
+    _backend_cache.clear()
+
+setting_changed.connect(clear_backend_cache)
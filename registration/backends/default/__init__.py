@@ -2,6 +2,8 @@ from django.conf import settings
 from django.contrib.sites.models import RequestSite
 from django.contrib.sites.models import Site
 
+from registration import ratelimit
+from registration.instrumentation import timer
 from registration.models import RegistrationProfile
 
 
@@ -59,12 +61,17 @@ class DefaultBackend(object):
         ``RegistrationProfile.send_activation_email()`` for
         information about these templates and the contexts provided to
         them.
+
+        When the setting ``REGISTRATION_UNIQUE_PENDING`` is ``True``,
+        registering an email again reuses its pending profile, see
+        ``RegistrationManager.register_profile()``.
         """
-        if Site._meta.installed:
-            site = Site.objects.get_current()
-        else:
-            site = RequestSite(request)
-        new_profile = RegistrationProfile.objects.create_profile(site,
+        with timer('register.site'):
+            if Site._meta.installed:
+                site = Site.objects.get_current()
+            else:
+                site = RequestSite(request)
+        new_profile = RegistrationProfile.objects.register_profile(site,
                 kwargs['email'])
         return new_profile
 
@@ -96,6 +103,23 @@ class DefaultBackend(object):
         """
         return getattr(settings, 'REGISTRATION_OPEN', True)
 
+    def registration_rate_allowed(self, request):
+        """
+        Indicate whether a registration form submission is within the
+        ``register_ip`` and ``register_email`` rate limits (see
+        ``registration.ratelimit``).
+
+        """
+        return ratelimit.registration_allowed(request)
+
+    def activation_allowed(self, request):
+        """
+        Indicate whether account activation is currently permitted, based
+        on the ``activate_ip`` rate limit (see ``registration.ratelimit``).
+
+        """
+        return ratelimit.activation_allowed(request)
+
     def get_form_class(self, request):
         """
         Return the default form class used for user registration.
@@ -11,15 +11,23 @@ for registration::
 If you'd like to customize the behavior (e.g., by passing extra
 arguments to the various views) or split up the URLs, feel free to set
 up your own URL patterns for these views instead.
+
+The backend is instantiated once, when this URLconf is loaded, and
+bound to the views for every request; settings changed afterwards, e.g.
+``ACTIVATION_METHOD``, aren't followed. Pass the dotted path of the
+backend to ``as_view()`` instead to have it resolved on each request.
 """
 
 
 from django.conf.urls.defaults import patterns, url
 from django.views.generic.simple import direct_to_template
 
-from registration.views import activate
-from registration.views import register
+from registration.backends import get_backend
+from registration.views import ActivateView
+from registration.views import RegisterView
+
 
+backend = get_backend('registration.backends.default.DefaultBackend')
 
 urlpatterns = patterns('',
     url(r'^activate/complete/$', direct_to_template,
@@ -29,11 +37,9 @@ urlpatterns = patterns('',
         # [a-fA-F0-9]{40} because a bad activation key should still get to the
         # view; that way it can return a sensible "invalid key" message instead
         # of a confusing 404.
-    url(r'^activate/(?P<activation_key>\w+)/$', activate,
-        {'backend': 'registration.backends.default.DefaultBackend'},
+    url(r'^activate/(?P<activation_key>\w+)/$', ActivateView.as_view(backend=backend),
         name='registration_activate'),
-    url(r'^register/$', register,
-        {'backend': 'registration.backends.default.DefaultBackend'},
+    url(r'^register/$', RegisterView.as_view(backend=backend),
         name='registration_register'),
     url(r'^register/complete/$', direct_to_template,
         {'template': 'registration/registration_complete.html'},
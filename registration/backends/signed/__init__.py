@@ -0,0 +1,60 @@
+from django.contrib.sites.models import RequestSite
+from django.contrib.sites.models import Site
+
+from registration import tokens
+from registration.backends.default import DefaultBackend
+from registration.models import ConsumedToken
+from registration.models import RegistrationProfile
+
+
+class SignedTokenBackend(DefaultBackend):
+    """
+    A registration backend following the same workflow as
+    ``registration.backends.default.DefaultBackend``, but which doesn't
+    store a ``RegistrationProfile`` for every registration.
+
+    Instead, the activation key sent by email is a token signed with the
+    ``SECRET_KEY`` setting, carrying the email address and the time of
+    registration (see ``registration.tokens``), so registering costs no
+    database write and activating costs a single insert. Expiration
+    (``ACCOUNT_ACTIVATION_DAYS``) is checked from the token itself, and
+    tokens are made single use by a ``registration.models.ConsumedToken``
+    row, which the ``cleanupregistration`` management command deletes
+    once the token has expired.
+
+    Tokens are longer than 40 characters and contain colons, so this
+    backend comes with its own URLconf,
+    ``registration.backends.signed.urls``. Changing ``SECRET_KEY``
+    invalidates every pending token.
+    """
+    def register(self, request, **kwargs):
+        """
+        Given an email address, send an activation email containing a signed
+        token to the supplied address. The email is rendered as described
+        in ``RegistrationProfile.send_activation_email()``.
+
+        Returns:
+            An unsaved ``RegistrationProfile`` instance holding the email and
+            the token as activation key.
+        """
+        if Site._meta.installed:
+            site = Site.objects.get_current()
+        else:
+            site = RequestSite(request)
+        profile = RegistrationProfile(email=kwargs['email'],
+            activation_key=tokens.make_token(kwargs['email']))
+        profile.send_activation_email(site)
+        return profile
+
+    def activate(self, request, **kwargs):
+        """
+        Given a signed token, the ``activate`` view request and any extra
+        keyword, will call ``ConsumedTokenManager.activate_token``
+        specifying a callback for user activation.
+
+        Returns:
+            ``ConsumedTokenManager.activate_token`` result (see models for
+            further information).
+        """
+        return ConsumedToken.objects.activate_token(
+                request, callback=self.activation_method, **kwargs)
@@ -0,0 +1,37 @@
+"""
+URLconf for registration and activation, using django-registration's
+signed token backend.
+
+Use it as the default backend's URLconf::
+
+    (r'^accounts/', include('registration.backends.signed.urls')),
+
+"""
+
+
+from django.conf.urls.defaults import patterns, url
+from django.views.generic.simple import direct_to_template
+
+from registration.views import activate
+from registration.views import register
+
+
+urlpatterns = patterns('',
+    url(r'^activate/complete/$', direct_to_template,
+        {'template': 'registration/activation_complete.html'},
+        name='registration_activation_complete'),
+        # Signed tokens are made of URL-safe base64, base 36 and
+        # hexadecimal parts separated by colons.
+    url(r'^activate/(?P<activation_key>[-:\w]+)/$', activate,
+        {'backend': 'registration.backends.signed.SignedTokenBackend'},
+        name='registration_activate'),
+    url(r'^register/$', register,
+        {'backend': 'registration.backends.signed.SignedTokenBackend'},
+        name='registration_register'),
+    url(r'^register/complete/$', direct_to_template,
+        {'template': 'registration/registration_complete.html'},
+        name='registration_complete'),
+    url(r'^register/closed/$', direct_to_template,
+        {'template': 'registration/registration_closed.html'},
+        name='registration_disallowed'),
+)
@@ -0,0 +1,60 @@
+"""
+Micro-benchmarks for django-pluggable-registration.
+
+Each benchmark is a callable returning a dictionary of measurements
+(seconds per call, unless stated otherwise). They are run by the
+``benchmarkregistration`` management command, which prints the results
+as JSON so that runs can be compared.
+
+The benchmarks in ``TABLE_BENCHMARKS`` run against profile tables of
+each of the given sizes (see ``registration.benchmarks.data``), in
+order: the purges come last, since they remove rows.
+
+"""
+from registration.benchmarks import backends
+from registration.benchmarks import data
+from registration.benchmarks import profiles
+from registration.benchmarks import views
+
+
+BENCHMARKS = (
+    ('get_backend', backends.bench_get_backend),
+    ('send_activation_email', profiles.bench_send_activation_email),
+)
+
+TABLE_BENCHMARKS = (
+    ('create_profile', profiles.bench_create_profile),
+    ('register_view', views.bench_register_view),
+    ('activate_view', views.bench_activate_view),
+    ('delete_expired', profiles.bench_delete_expired),
+    ('delete_activated', profiles.bench_delete_activated),
+)
+
+# Number of profiles in the tables ``TABLE_BENCHMARKS`` run against.
+SIZES = (10000, 100000, 1000000)
+
+
+def run(names=None, sizes=None, **options):
+    """
+    Run the benchmarks whose names are in ``names`` (all of them if
+    ``None``), passing ``options`` through, and return a dictionary
+    mapping benchmark names to their results. Results of
+    ``TABLE_BENCHMARKS`` are dictionaries mapping each of ``sizes``
+    (``SIZES`` by default) to the measurements.
+
+    The table benchmarks replace the contents of the profile table, so
+    they must only be run against a scratch database.
+    """
+    selected = lambda benchmarks: [(name, bench) for name, bench in benchmarks
+                                   if names is None or name in names]
+    results = dict((name, bench(**options))
+                   for name, bench in selected(BENCHMARKS))
+    table_benchmarks = selected(TABLE_BENCHMARKS)
+    if table_benchmarks:
+        for size in sizes or SIZES:
+            data.populate(size)
+            for name, bench in table_benchmarks:
+                results.setdefault(name, {})[str(size)] = bench(size=size,
+                                                                **options)
+        data.clear()
+    return results
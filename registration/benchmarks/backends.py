@@ -0,0 +1,26 @@
+"""
+Benchmarks for backend resolution.
+
+"""
+from registration import backends
+from registration.benchmarks.timing import measure
+
+
+DEFAULT_BACKEND = 'registration.backends.default.DefaultBackend'
+
+
+def bench_get_backend(iterations=10000, **options):
+    """
+    Compare resolving the default backend from scratch on every call, as
+    ``get_backend`` used to do, with the cached ``get_backend``.
+    """
+    def uncached():
+        backend, kwargs = backends._resolve_backend(DEFAULT_BACKEND)
+        backend(**kwargs)
+
+    def cached():
+        backends.get_backend(DEFAULT_BACKEND)
+
+    backends.clear_backend_cache()
+    return {'uncached': measure(uncached, iterations),
+            'cached': measure(cached, iterations)}
@@ -0,0 +1,57 @@
+"""
+Fixed-size profile tables the database benchmarks run against.
+
+"""
+import binascii
+import datetime
+import os
+
+from django.db import connections
+
+from registration.models import OutboxEmail
+from registration.models import RegistrationProfile
+
+
+# Share of the rows of a populated table which are expired, and which
+# are activated; the rest are pending.
+EXPIRED_RATIO = 0.1
+ACTIVATED_RATIO = 0.1
+
+
+def clear(using='default'):
+    """
+    Empty the profile and outbox tables with one statement each.
+    """
+    connection = connections[using]
+    cursor = connection.cursor()
+    for model in (OutboxEmail, RegistrationProfile):
+        cursor.execute('DELETE FROM %s' % connection.ops.quote_name(
+            model._meta.db_table))
+
+
+def populate(size, batch_size=10000, using='default'):
+    """
+    Replace the contents of the profile table with ``size`` profiles, of
+    which ``EXPIRED_RATIO`` are expired and ``ACTIVATED_RATIO`` are
+    activated, inserted ``batch_size`` rows per query.
+    """
+    clear(using)
+    now = datetime.datetime.now()
+    expired = int(size * EXPIRED_RATIO)
+    activated = expired + int(size * ACTIVATED_RATIO)
+    for start in xrange(0, size, batch_size):
+        count = min(batch_size, size - start)
+        entropy = binascii.hexlify(os.urandom(20 * count))
+        profiles = []
+        for i in xrange(count):
+            n = start + i
+            profile = RegistrationProfile(
+                email='user%d@example.com' % n,
+                activation_key=entropy[40 * i:40 * (i + 1)],
+                expires_at=now + datetime.timedelta(days=7))
+            if n < expired:
+                profile.expires_at = now - datetime.timedelta(days=1)
+            elif n < activated:
+                profile.status = RegistrationProfile.ACTIVATED
+            profiles.append(profile)
+        RegistrationProfile.objects.using(using).bulk_create(profiles)
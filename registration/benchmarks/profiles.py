@@ -0,0 +1,69 @@
+"""
+Benchmarks for profile creation, activation emails and purges.
+
+"""
+import itertools
+
+from django.contrib.sites.models import Site
+from django.core import mail
+from django.test.utils import override_settings
+
+from registration.benchmarks.timing import measure
+from registration.benchmarks.timing import measure_once
+from registration.models import RegistrationProfile
+from registration.models import expiration_date
+
+
+def bench_create_profile(size, iterations=100, **options):
+    """
+    Time ``create_profile``, without sending the activation email, on a
+    table of ``size`` profiles.
+    """
+    site = Site.objects.get_current()
+    counter = itertools.count()
+
+    def create():
+        RegistrationProfile.objects.create_profile(
+            site, 'new%d@example.com' % counter.next(), send_email=False)
+
+    return {'seconds': measure(create, iterations)}
+
+
+def bench_send_activation_email(iterations=1000, **options):
+    """
+    Time rendering and sending an activation email to the locmem email
+    backend.
+    """
+    site = Site.objects.get_current()
+    profile = RegistrationProfile(email='alice@example.com',
+                                  activation_key='a' * 40,
+                                  expires_at=expiration_date())
+
+    def send():
+        profile.send_activation_email(site)
+        del mail.outbox[:]
+
+    backend = 'django.core.mail.backends.locmem.EmailBackend'
+    with override_settings(EMAIL_BACKEND=backend):
+        mail.outbox = []
+        return {'seconds': measure(send, iterations)}
+
+
+def bench_delete_expired(size, **options):
+    """
+    Time a single ``delete_expired`` call on a table of ``size``
+    profiles.
+    """
+    seconds, deleted = measure_once(
+        RegistrationProfile.objects.delete_expired)
+    return {'seconds': seconds, 'deleted': deleted}
+
+
+def bench_delete_activated(size, **options):
+    """
+    Time a single ``delete_activated`` call on a table of ``size``
+    profiles.
+    """
+    seconds, deleted = measure_once(
+        RegistrationProfile.objects.delete_activated)
+    return {'seconds': seconds, 'deleted': deleted}
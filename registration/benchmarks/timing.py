@@ -0,0 +1,23 @@
+"""
+Timing helpers shared by the benchmarks.
+
+"""
+import timeit
+
+
+def measure(func, number):
+    """
+    Return the best time per call of ``func`` over three runs of
+    ``number`` calls each.
+    """
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def measure_once(func):
+    """
+    Return the time taken by a single call of ``func`` along with its
+    result, for operations which can't be repeated on the same data.
+    """
+    started = timeit.default_timer()
+    result = func()
+    return timeit.default_timer() - started, result
@@ -0,0 +1,11 @@
+"""
+URLconf used by the view benchmarks.
+
+"""
+from django.conf.urls.defaults import include
+from django.conf.urls.defaults import patterns
+
+
+urlpatterns = patterns('',
+    (r'^', include('registration.backends.default.urls')),
+)
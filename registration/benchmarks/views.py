@@ -0,0 +1,82 @@
+"""
+Benchmarks for the ``register`` and ``activate`` views, requested
+through the test client.
+
+The views run with the default backend, with rate limits disabled, a
+registration form accepting any valid email and an activation callback
+which only returns the profile's email, so that the numbers don't depend
+on the project's forms and account model.
+
+"""
+import itertools
+
+from django import forms
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+from django.test.utils import override_settings
+
+from registration.benchmarks.timing import measure
+from registration.forms import RegistrationForm
+from registration.models import RegistrationProfile
+
+
+class BenchmarkRegistrationForm(RegistrationForm):
+
+    def clean_email(self):
+        return self.cleaned_data['email']
+
+
+def activate(request, profile, form=None):
+    return profile.email, None
+
+
+SETTINGS = {
+    'ROOT_URLCONF': 'registration.benchmarks.urls',
+    'REGISTRATION_OPEN': True,
+    'REGISTRATION_RATE_LIMITS': {},
+    'REGISTRATION_EMAIL_OUTBOX': False,
+    'REGISTRATION_FORM':
+        'registration.benchmarks.views.BenchmarkRegistrationForm',
+    'ACTIVATION_FORM': None,
+    'ACTIVATION_METHOD': 'registration.benchmarks.views.activate',
+    'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+}
+
+
+def bench_register_view(size, iterations=100, **options):
+    """
+    Time a successful registration form submission, including sending
+    the activation email, on a table of ``size`` profiles.
+    """
+    client = Client()
+    counter = itertools.count()
+
+    def register():
+        response = client.post(url, {
+            'email': 'new%d@example.com' % counter.next()})
+        assert response.status_code == 302, response.status_code
+
+    with override_settings(**SETTINGS):
+        url = reverse('registration_register')
+        return {'seconds': measure(register, iterations)}
+
+
+def bench_activate_view(size, iterations=100, **options):
+    """
+    Time a successful activation on a table of ``size`` profiles. The
+    keys activated belong to profiles created beforehand.
+    """
+    client = Client()
+    keys = iter(profile.activation_key for profile in
+                RegistrationProfile.objects.bulk_create_profiles(
+                    None, ('activate%d@example.com' % i
+                           for i in xrange(3 * iterations)),
+                    send_email=False))
+
+    def activate():
+        response = client.post(reverse('registration_activate',
+                                       args=(keys.next(),)))
+        assert response.status_code == 302, response.status_code
+
+    with override_settings(**SETTINGS):
+        return {'seconds': measure(activate, iterations)}
@@ -0,0 +1,367 @@
+"""
+Bloom filters of the values taken in model fields, e.g. ``User.email``,
+consulted by ``registration.forms.UniquenessChecker.might_be_taken`` so
+that availability hints for values which are definitely free, most of
+those checked at signup, don't cost a database query. Their answers may
+be stale, so they never replace the database lookups validating forms.
+
+The filters are configured by the ``REGISTRATION_BLOOM_FILTER`` setting,
+a dictionary with the following optional keys; if it isn't defined, no
+filter is used:
+
+``fields``
+    The fields filtered, as ``'app_label.ModelName.field'`` strings;
+    ``DEFAULT_FIELDS`` by default.
+
+``capacity``, ``error_rate``
+    Number of values each filter is sized for, and its false positive
+    rate at that size (``DEFAULT_CAPACITY`` and ``DEFAULT_ERROR_RATE``).
+    Beyond its capacity, a filter's false positive rate grows.
+
+``max_bytes``
+    Upper bound on the size of each filter, at the expense of its false
+    positive rate; ``DEFAULT_MAX_BYTES``, which fits in a memcached item,
+    by default. With the default capacity and error rate, the filters are
+    capped to it, raising their false positive rate to about 2%.
+
+``cache``
+    Name of a cache defined in the ``CACHES`` setting, shared by every
+    process. Required: ``ImproperlyConfigured`` is raised without it.
+
+``timeout``
+    Maximum age, in seconds, of a filter (``DEFAULT_TIMEOUT``), after
+    which it isn't used any longer.
+
+The filters are only built by the ``rebuildbloomfilters`` management
+command, which streams the values of each field and stores the filters
+in the cache; run it more often than ``timeout``, e.g. from cron. Each
+process loads the filters from the cache into memory when first needed,
+and switches to new ones once rebuilt. Until a filter is available every
+value is looked up in the database, so requests never stream a table.
+
+Values are normalised like emails (see
+``registration.models.normalize_email``). Whenever an instance of a
+filtered model is saved, its values are added to the process' filters
+and recorded in the cache, so that a value missing from a process'
+filter is only reported free once the cache, in one round trip, confirms
+no other process saved it. Values written without saving an instance,
+e.g. by ``bulk_create``, ``update`` or raw SQL, or whose record the
+cache evicted, are reported free until the filter is rebuilt. Values are
+never removed from a filter, so deleting rows only raises the false
+positive rate until the filter is rebuilt.
+
+"""
+import math
+import struct
+import time
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import get_model
+from django.db.models import signals
+from django.test.signals import setting_changed
+from django.utils.hashcompat import md5_constructor
+from django.utils.hashcompat import sha_constructor
+
+
+KEY_PREFIX = 'registration.bloom:'
+DEFAULT_FIELDS = ('auth.User.email', 'auth.User.username')
+DEFAULT_CAPACITY = 1000000
+DEFAULT_ERROR_RATE = 0.01
+DEFAULT_TIMEOUT = 24 * 60 * 60
+# Fits in a memcached item, 1 MB by default, with the key and pickling
+# overhead.
+DEFAULT_MAX_BYTES = 1000000
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+class BloomFilter(object):
+    """
+    A Bloom filter sized for ``capacity`` values with a false positive
+    rate of ``error_rate``, or using at most ``max_bytes`` bytes.
+    """
+    def __init__(self, capacity, error_rate=DEFAULT_ERROR_RATE,
+                 max_bytes=None):
+        size = int(math.ceil(-capacity * math.log(error_rate) /
+                             math.log(2) ** 2))
+        if max_bytes:
+            size = min(size, max_bytes * 8)
+        self.size = max(size, 8)
+        self.hashes = max(int(round(self.size * math.log(2) / capacity)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.built_at = time.time()
+
+    def __getstate__(self):
+        # Python 2 pickles a bytearray as a latin-1 decoded unicode string,
+        # half as big again once UTF-8 encoded.
+        state = self.__dict__.copy()
+        state['bits'] = str(self.bits)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.bits = bytearray(self.bits)
+
+    def _positions(self, value):
+        # Double hashing: the positions are derived from two 64 bits
+        # halves of a single digest.
+        first, second = struct.unpack('<QQ', sha_constructor(
+            _encode(value)).digest()[:16])
+        return [(first + i * second) % self.size
+                for i in xrange(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        for position in self._positions(value):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+def get_options():
+    """
+    Returns the ``REGISTRATION_BLOOM_FILTER`` setting, or ``None`` if Bloom
+    filters are disabled.
+    """
+    return getattr(settings, 'REGISTRATION_BLOOM_FILTER', None)
+
+
+def _normalize(value):
+    from registration.models import normalize_email
+    return normalize_email(value)
+
+
+class TakenValues(object):
+    """
+    The Bloom filter of the values of the field ``name``
+    (``'app_label.ModelName.field'``) kept by this process, loaded from the
+    cache.
+    """
+    def __init__(self, name, options):
+        self.name = name
+        self.options = options
+        self.cache = get_cache(options['cache'])
+        self.timeout = options.get('timeout', DEFAULT_TIMEOUT)
+        self.filter = None
+        self.generation = None
+
+    def _key(self, *parts):
+        return KEY_PREFIX + ':'.join((self.name,) + parts)
+
+    def _added_key(self, generation, value):
+        return self._key('added', str(generation),
+                         md5_constructor(_encode(value)).hexdigest())
+
+    def build(self):
+        """
+        Builds the filter by streaming the values of the field, and shares
+        it through the cache as a new generation. Only run by the
+        ``rebuildbloomfilters`` management command.
+
+        Raises ``ImproperlyConfigured`` if the cache doesn't keep the
+        filter, e.g. because it is over the size limit of its items.
+        """
+        app_label, model_name, field = self.name.split('.')
+        bloom = BloomFilter(self.options.get('capacity', DEFAULT_CAPACITY),
+                            self.options.get('error_rate', DEFAULT_ERROR_RATE),
+                            self.options.get('max_bytes', DEFAULT_MAX_BYTES))
+        values = get_model(app_label, model_name)._default_manager.exclude(
+            **{field: None}).values_list(field, flat=True).iterator()
+        for value in values:
+            if value:
+                bloom.add(_normalize(value))
+        generation = (self.cache.get(self._key('generation')) or 0) + 1
+        filter_key = self._key('filter', str(generation))
+        self.cache.set(filter_key, bloom, self.timeout)
+        # Caches silently drop the values they can't store, so the new
+        # generation is only published once its filter is known to be
+        # there.
+        if self.cache.get(filter_key) is None:
+            raise ImproperlyConfigured(
+                "The cache %r didn't store the %d bytes Bloom filter of %s; "
+                "lower its 'max_bytes'." % (self.options['cache'],
+                                            len(bloom.bits), self.name))
+        # Outlives the filters, so that generations keep increasing.
+        self.cache.set(self._key('generation'), generation, self.timeout * 2)
+        self._use(bloom, generation)
+        return bloom
+
+    def load(self):
+        """
+        Loads the current filter from the cache, unless it is the one in
+        use. Without a current filter, ``filter`` is ``None``.
+        """
+        generation = self.cache.get(self._key('generation'))
+        if generation is None:
+            self.filter = None
+        elif generation != self.generation or self.filter is None:
+            # A filter of another generation would miss the values saved
+            # since, which are recorded under the current one.
+            bloom = self.cache.get(self._key('filter', str(generation)))
+            if bloom is None:
+                self.filter = None
+            else:
+                self._use(bloom, generation)
+        if self.filter is not None and time.time() > self.expires:
+            self.filter = None
+
+    def _use(self, bloom, generation):
+        self.filter = bloom
+        self.generation = generation
+        # Values recorded in the cache expire after ``timeout`` seconds
+        # too, so the filter mustn't be used any longer.
+        self.expires = bloom.built_at + self.timeout
+
+    def might_be_taken(self, value):
+        """
+        Returns ``False`` if the normalised ``value`` is definitely free,
+        ``True`` if it may be taken, or if no current filter is available.
+        """
+        if self.filter is None or time.time() > self.expires:
+            self.load()
+            if self.filter is None:
+                return True
+        if value in self.filter:
+            return True
+        # Values saved by other processes are recorded under the generation
+        # current when they were saved, which may be the one preceding a
+        # rebuild.
+        generation_key = self._key('generation')
+        keys = [self._added_key(self.generation, value),
+                self._added_key(self.generation - 1, value)]
+        found = self.cache.get_many([generation_key] + keys)
+        if any(key in found for key in keys):
+            self.filter.add(value)
+            return True
+        if found.get(generation_key) != self.generation:
+            # Rebuilt since loaded.
+            self.load()
+            return self.filter is None or value in self.filter
+        return False
+
+    def add(self, value):
+        """
+        Adds the normalised ``value`` to the filter, and records it for the
+        other processes.
+        """
+        if self.filter is not None:
+            self.filter.add(value)
+        generation = self.cache.get(self._key('generation')) or 0
+        self.cache.set(self._added_key(generation, value), 1, self.timeout)
+
+
+# The filters of this process, by field name: ``None`` until first used.
+_filters = None
+
+
+def get_filters():
+    """
+    Returns a dictionary of the ``TakenValues`` of every filtered field, by
+    name, empty if Bloom filters are disabled. Raises
+    ``ImproperlyConfigured`` if they are enabled without a cache.
+    """
+    global _filters
+    if _filters is None:
+        options = get_options()
+        filters = {}
+        if options is not None:
+            if not options.get('cache'):
+                raise ImproperlyConfigured(
+                    "REGISTRATION_BLOOM_FILTER must name a cache shared by "
+                    "every process.")
+            for name in options.get('fields', DEFAULT_FIELDS):
+                filters[name.lower()] = TakenValues(name, options)
+        _filters = filters
+    return _filters
+
+
+def get_filter(model, field):
+    """
+    Returns the ``TakenValues`` of ``field`` in ``model``, or ``None`` if it
+    isn't filtered.
+    """
+    return get_filters().get(('%s.%s.%s' % (
+        model._meta.app_label, model._meta.object_name, field)).lower())
+
+
+def _label(model):
+    return ('%s.%s' % (model._meta.app_label,
+                       model._meta.object_name)).lower()
+
+
+def record_saved(sender, instance, **kwargs):
+    """
+    ``post_save`` receiver adding the values of the filtered fields of the
+    saved instance, connected to the filtered models only.
+    """
+    prefix = _label(sender) + '.'
+    for name, taken in get_filters().iteritems():
+        if name.startswith(prefix):
+            value = getattr(instance, taken.name.split('.')[2], None)
+            if value:
+                taken.add(_normalize(value))
+
+
+# The models ``record_saved`` is connected to.
+_senders = []
+
+
+def _filtered_models():
+    options = get_options()
+    if options is None:
+        return set()
+    return set(name.lower().rsplit('.', 1)[0]
+               for name in options.get('fields', DEFAULT_FIELDS))
+
+
+def _connect(model):
+    signals.post_save.connect(record_saved, sender=model,
+                              dispatch_uid='registration.bloom')
+    _senders.append(model)
+
+
+def connect_prepared(sender, **kwargs):
+    """
+    ``class_prepared`` receiver connecting ``record_saved`` to the models
+    filtered but not loaded yet when the receivers were connected.
+    """
+    if _label(sender) in _filtered_models():
+        _connect(sender)
+
+
+def connect_receivers():
+    """
+    Connects ``record_saved`` to the ``post_save`` signal of each filtered
+    model already loaded, and disconnects it from the others.
+    """
+    while _senders:
+        signals.post_save.disconnect(sender=_senders.pop(),
+                                     dispatch_uid='registration.bloom')
+    for label in _filtered_models():
+        app_label, model_name = label.split('.')
+        model = get_model(app_label, model_name, seed_cache=False,
+                          only_installed=False)
+        if model is not None:
+            _connect(model)
+
+
+def reset(**kwargs):
+    """
+    Drops the filters of this process, so that they are set up again from
+    settings when next needed, and reconnects ``record_saved``. Accepts
+    any keyword arguments so that it can be used as a signal receiver.
+    """
+    global _filters
+    _filters = None
+    connect_receivers()
+
+setting_changed.connect(reset)
@@ -5,8 +5,27 @@ Forms and validation code for user registration.
 import abc
 
 from django import forms
+from django.core.cache import get_cache
+from django.db.models import get_model
+from django.utils.hashcompat import md5_constructor
 from django.utils.translation import ugettext_lazy as _
 
+from registration import bloom
+from registration.models import normalize_email
+
+
+# Default number of seconds ``UniquenessChecker`` results are cached for,
+# when caching is enabled.
+CHECK_CACHE_TIMEOUT = 10
+
+
+def normalize_username(username):
+    """
+    Normalise a username for comparison: surrounding whitespace is
+    removed, and its case is kept.
+    """
+    return username.strip()
+
 
 # I put this on all required fields, because it's easier to pick up
 # on them with CSS or JavaScript if they have a class of "required"
@@ -45,3 +64,151 @@ class ActivationForm(forms.Form):
     def clean(self):
         pass
     clean = abc.abstractmethod(clean)
+
+
+class UniquenessChecker(object):
+    """
+    Checks whether a value, e.g. an email or a username, is already taken
+    by a row of ``model``.
+
+    Values are normalised by ``normalize`` (``normalize_email`` by
+    default) and looked up case-insensitively on ``field``, since rows may
+    hold values of any case, with ``exists()``, so that the database stops
+    at the first match instead of counting. The lookups need indexes of
+    their own, e.g. ``UPPER`` expression indexes on PostgreSQL, which the
+    documentation recommends for ``auth_user``.
+
+    When ``model.field`` has a Bloom filter (see ``registration.bloom``),
+    ``might_be_taken`` answers availability hints without looking up the
+    values it reports free; ``is_taken``, which validates, always looks
+    them up.
+
+    If ``cache`` is the name of a cache defined in the ``CACHES`` setting,
+    results are kept there for ``timeout`` seconds
+    (``CHECK_CACHE_TIMEOUT`` by default): during that time a value taken
+    meanwhile may still be reported free, so keep it short, or call
+    ``forget`` once the value is taken.
+
+    Args:
+        ``model`` model class, or ``'app_label.ModelName'`` string resolved
+            on first use.
+        ``field`` name of the field holding the values.
+    """
+    def __init__(self, model, field, normalize=normalize_email, cache=None,
+                 timeout=None):
+        self._model = model
+        self.field = field
+        self.normalize = normalize
+        self.cache = cache
+        self.timeout = timeout or CHECK_CACHE_TIMEOUT
+
+    @property
+    def model(self):
+        if isinstance(self._model, basestring):
+            self._model = get_model(*self._model.split('.'))
+        return self._model
+
+    def cache_key(self, value):
+        """
+        Returns the cache key of the normalised ``value``, the same
+        whatever its case.
+        """
+        value = value.lower()
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        return 'registration-unique:%s.%s:%s' % (
+            self.model._meta.db_table, self.field,
+            md5_constructor(value).hexdigest())
+
+    def might_be_taken(self, value):
+        """
+        Returns ``False`` if the Bloom filter of the field reports
+        ``value`` definitely free, or whether it is taken otherwise. Meant
+        for hints, e.g. checking availability as the user types: values
+        written without saving an instance, e.g. by ``bulk_create``, may
+        be reported free until the filter is rebuilt, so use ``is_taken``
+        to validate.
+        """
+        taken_values = bloom.get_filter(self.model, self.field)
+        if taken_values is not None and not taken_values.might_be_taken(
+                normalize_email(self.normalize(value))):
+            return False
+        return self.is_taken(value)
+
+    def is_taken(self, value):
+        """
+        Returns ``True`` if ``value`` is already taken.
+        """
+        value = self.normalize(value)
+        if self.cache is None:
+            return self.lookup(value)
+        cache = get_cache(self.cache)
+        key = self.cache_key(value)
+        taken = cache.get(key)
+        if taken is None:
+            taken = self.lookup(value)
+            cache.set(key, taken, self.timeout)
+        return taken
+
+    def lookup(self, value):
+        """
+        Returns ``True`` if a row holds the normalised ``value``, whatever
+        its case, querying the database.
+        """
+        return self.model._default_manager.filter(
+            **{'%s__iexact' % self.field: value}).exists()
+
+    def forget(self, value):
+        """
+        Removes the cached result for ``value``, if any.
+        """
+        if self.cache is not None:
+            get_cache(self.cache).delete(self.cache_key(self.normalize(value)))
+
+
+class UniqueEmailRegistrationForm(RegistrationForm):
+    """
+    ``RegistrationForm`` rejecting the emails already used by a ``User``,
+    checked by ``email_checker``. The cleaned email is normalised.
+    """
+    email_checker = UniquenessChecker('auth.User', 'email')
+
+    def clean_email(self):
+        email = self.email_checker.normalize(self.cleaned_data['email'])
+        if self.email_checker.is_taken(email):
+            raise forms.ValidationError(_(u"This email address is already in "
+                "use. Please supply a different email address."))
+        return email
+
+
+class UniqueUsernameActivationForm(ActivationForm):
+    """
+    ``ActivationForm`` asking for a username, rejecting the ones already
+    used by a ``User``, checked by ``username_checker``, and checking that
+    both passwords match. Usernames only differing by case from a taken
+    one are rejected; the cleaned username keeps its case.
+    """
+    username = forms.RegexField(regex=r'^[\w.@+-]+$', max_length=30,
+            widget=forms.TextInput(attrs=attrs_dict),
+            label=_("Username"), error_messages={'invalid': _("This value "
+            "must contain only letters, numbers and underscores.")})
+
+    username_checker = UniquenessChecker('auth.User', 'username',
+                                         normalize=normalize_username)
+
+    def clean_username(self):
+        username = self.username_checker.normalize(
+            self.cleaned_data['username'])
+        if self.username_checker.is_taken(username):
+            raise forms.ValidationError(_("A user with that username already "
+                                          "exists."))
+        return username
+
+    def clean(self):
+        if 'password1' in self.cleaned_data and \
+                'password2' in self.cleaned_data:
+            if self.cleaned_data['password1'] != \
+                    self.cleaned_data['password2']:
+                raise forms.ValidationError(_("The two password fields didn't"
+                                              " match."))
+        return self.cleaned_data
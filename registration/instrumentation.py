@@ -0,0 +1,153 @@
+"""
+Timing instrumentation of the registration and activation phases.
+
+The views, ``DefaultBackend`` and ``RegistrationProfile`` wrap each
+phase of a registration or an activation in ``timer(name)``, which
+reports the time it took, in seconds, to the configured sink. The
+phases are:
+
+``register.allowed``, ``activate.allowed``
+    ``registration_allowed``/``activation_allowed`` backend checks.
+
+``register.form``, ``activate.form``
+    Form validation.
+
+``register.backend``, ``activate.backend``
+    The backend's ``register``/``activate`` methods, which include the
+    phases below.
+
+``register.site``
+    Current ``Site`` lookup.
+
+``email.render``, ``email.send``
+    Rendering an activation email, and handing it (or a batch of them)
+    to the email backend, e.g. the SMTP round trips.
+
+``activate.callback``
+    The activation callback (``ACTIVATION_METHOD``).
+
+The sink is configured by the ``REGISTRATION_TIMING_SINK`` setting, the
+dotted Python path of a class instantiated without arguments, or of any
+callable returning an object with a ``timing(name, seconds)`` method. If
+it isn't defined, timings are discarded: ``timer`` then returns a shared
+do-nothing context manager without even reading the clock.
+
+"""
+import logging
+import socket
+import time
+
+from django.conf import settings
+from django.test.signals import setting_changed
+
+from registration.backends import get_object
+
+
+class NullSink(object):
+    """
+    Sink discarding every timing.
+    """
+    def timing(self, name, seconds):
+        pass
+
+
+class LoggingSink(object):
+    """
+    Sink logging every timing at ``DEBUG`` level to the
+    ``registration.timing`` logger.
+    """
+    logger = logging.getLogger('registration.timing')
+
+    def timing(self, name, seconds):
+        self.logger.debug("%s took %.3fms", name, seconds * 1000)
+
+
+class StatsdSink(object):
+    """
+    Sink sending every timing as a statsd timer (``<prefix>.<name>:<ms>|ms``)
+    in a UDP datagram. Sending is fire and forget: errors are ignored.
+
+    The server address and the prefix are taken from the settings
+    ``REGISTRATION_STATSD_HOST`` (``'localhost'`` by default),
+    ``REGISTRATION_STATSD_PORT`` (``8125``) and
+    ``REGISTRATION_STATSD_PREFIX`` (``'registration'``).
+    """
+    def __init__(self, host=None, port=None, prefix=None):
+        self.address = (
+            host or getattr(settings, 'REGISTRATION_STATSD_HOST', 'localhost'),
+            port or getattr(settings, 'REGISTRATION_STATSD_PORT', 8125))
+        self.prefix = prefix or getattr(settings, 'REGISTRATION_STATSD_PREFIX',
+                                        'registration')
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def timing(self, name, seconds):
+        try:
+            self.socket.sendto('%s.%s:%d|ms' % (self.prefix, name,
+                                                round(seconds * 1000)),
+                               self.address)
+        except socket.error:
+            pass
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class _Timer(object):
+
+    def __init__(self, sink, name):
+        self.sink = sink
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.sink.timing(self.name, time.time() - self.started)
+        return False
+
+
+_null_timer = _NullTimer()
+
+# The sink in use: ``None`` until first used, ``False`` if none is set.
+_sink = None
+
+
+def get_sink():
+    """
+    Returns the configured sink, or ``None`` if timings are discarded.
+    """
+    global _sink
+    if _sink is None:
+        path = getattr(settings, 'REGISTRATION_TIMING_SINK', None)
+        _sink = path and get_object(path)() or False
+    return _sink or None
+
+
+def timer(name):
+    """
+    Returns a context manager reporting the time spent in its block to
+    the configured sink as phase ``name``.
+    """
+    sink = get_sink()
+    if sink is None:
+        return _null_timer
+    return _Timer(sink, name)
+
+
+def reset(**kwargs):
+    """
+    Forgets the configured sink, so that it is set up again from the
+    settings on next use. Connected to Django's ``setting_changed`` signal.
+    """
+    global _sink
+    _sink = None
+
+
+setting_changed.connect(reset)
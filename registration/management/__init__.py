@@ -0,0 +1,42 @@
+"""
+Creates the unique index on the activation keys of pending profiles
+(see ``registration.schema``) when ``syncdb`` creates the
+``RegistrationProfile`` table, since the model can't describe it.
+
+"""
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connections
+from django.db import transaction
+from django.db.models.signals import post_syncdb
+
+from registration import models as registration_models
+from registration import schema
+
+
+def create_pending_key_index(sender, created_models, **kwargs):
+    """
+    ``post_syncdb`` receiver creating the index, unless the migrations
+    create it: South sends the signal too once the migrations it ran are
+    done, whether the index exists already or the table is still
+    missing the ``status`` column.
+    """
+    model = registration_models.RegistrationProfile
+    if model not in created_models:
+        return
+    using = kwargs.get('db', DEFAULT_DB_ALIAS)
+    connection = connections[using]
+    table = model._meta.db_table
+    columns = [row[0] for row in connection.introspection.
+               get_table_description(connection.cursor(), table)]
+    if 'status' not in columns:
+        return
+    # ``None`` on databases ``index_exists`` doesn't know, left alone.
+    if schema.index_exists(connection, table,
+                           schema.PENDING_KEY_INDEX) is not False:
+        return
+    connection.cursor().execute(
+        schema.pending_key_index_sql(connection, table))
+    transaction.commit_unless_managed(using=using)
+
+
+post_syncdb.connect(create_pending_key_index, sender=registration_models)
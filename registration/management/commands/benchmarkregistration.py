@@ -0,0 +1,61 @@
+"""
+A management command which runs the benchmarks in
+``registration.benchmarks`` and prints their results as JSON.
+
+The benchmarks run against a test database, created and destroyed like
+the test runner does, so existing data is never touched. Using SQLite,
+which Django creates in memory for tests, the benchmarks run offline.
+
+"""
+import json
+import platform
+from optparse import make_option
+
+import django
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment
+from django.test.utils import teardown_test_environment
+
+from registration import benchmarks
+
+
+class Command(BaseCommand):
+    args = '[benchmark ...]'
+    help = "Run registration micro-benchmarks and print the results as JSON"
+    option_list = BaseCommand.option_list + (
+        make_option('--iterations', action='store', type='int',
+                    dest='iterations', default=None,
+                    help='Number of calls timed per measurement; each '
+                         'benchmark has its own default.'),
+        make_option('--sizes', action='store', dest='sizes',
+                    default=','.join(str(size) for size in benchmarks.SIZES),
+                    help='Comma-separated sizes of the profile tables the '
+                         'database benchmarks run against.'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--sizes must be a comma-separated list of "
+                               "integers.")
+        kwargs = {}
+        if options['iterations'] is not None:
+            kwargs['iterations'] = options['iterations']
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            results = benchmarks.run(args or None, sizes=sizes, **kwargs)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = {'environment': {'database': connection.vendor,
+                                  'django': django.get_version(),
+                                  'python': platform.python_version()},
+                  'results': results}
+        self.stdout.write(json.dumps(output, indent=2, sort_keys=True))
+        self.stdout.write('\n')
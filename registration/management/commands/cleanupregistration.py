@@ -1,20 +1,141 @@
 """
 A management command which deletes expired accounts (e.g.,
-accounts which signed up but never activated) from the database.
+accounts which signed up but never activated) and already activated
+accounts from the database, as well as the markers of consumed signed
+tokens which have expired.
 
-Calls ``RegistrationProfile.objects.delete_expired_users()``, which
-contains the actual logic for determining which accounts are deleted.
+Rows are deleted in batches (see ``ChunkedManager.delete_chunks()``),
+each batch being committed on its own, so the command can be throttled,
+stopped after a given runtime and resumed later from a checkpoint file.
 
 """
+import json
+import os
+import time
+from optparse import make_option
 
-from django.core.management.base import NoArgsCommand
+from django.core.management.base import BaseCommand
 
+from registration.models import DELETE_CHUNK_SIZE
+from registration.models import ConsumedToken
 from registration.models import RegistrationProfile
 
 
-class Command(NoArgsCommand):
+class Command(BaseCommand):
     help = "Delete expired user registrations from the database"
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', action='store', type='int',
+                    dest='batch_size', default=DELETE_CHUNK_SIZE,
+                    help='Maximum number of profiles deleted per batch.'),
+        make_option('--max-runtime', action='store', type='float',
+                    dest='max_runtime', default=None,
+                    help='Stop after this many seconds; use --checkpoint to '
+                         'resume later.'),
+        make_option('--sleep', action='store', type='float', dest='sleep',
+                    default=0,
+                    help='Seconds to sleep between batches, e.g. to let '
+                         'replicas catch up.'),
+        make_option('--dry-run', action='store_true', dest='dry_run',
+                    default=False,
+                    help='Only count the profiles which would be deleted.'),
+        make_option('--checkpoint', action='store', dest='checkpoint',
+                    default=None,
+                    help='File storing the progress of the purge; an '
+                         'interrupted run resumes from it.'),
+    )
 
-    def handle_noargs(self, **options):
-        RegistrationProfile.objects.delete_expired()
-        RegistrationProfile.objects.delete_activated()
+    # Phase name, manager and manager method returning the rows to be
+    # deleted, in execution order.
+    phases = (('expired', RegistrationProfile.objects, 'expired'),
+              ('activated', RegistrationProfile.objects, 'activated'),
+              ('consumed tokens', ConsumedToken.objects, 'expired'))
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options.get('verbosity', 1))
+        checkpoint = options.get('checkpoint')
+        state = self.load_checkpoint(checkpoint)
+        deadline = None
+        if options.get('max_runtime') is not None:
+            deadline = time.time() + options['max_runtime']
+
+        finished = True
+        for name, manager, method in self.phases:
+            phase = state.setdefault(name, {'last_pk': None, 'done': False})
+            if phase['done']:
+                continue
+            queryset = getattr(manager, method)()
+            started = time.time()
+            if options.get('dry_run'):
+                if phase['last_pk'] is not None:
+                    queryset = queryset.filter(pk__gt=phase['last_pk'])
+                self.report(name, "%d to delete" % queryset.count(),
+                            started)
+                continue
+            finished, deleted = self.purge(manager, queryset, phase,
+                                           checkpoint, state, deadline,
+                                           options)
+            self.report(name, "%d deleted" % deleted, started)
+            if not finished:
+                self.report_stopped(name, phase['last_pk'], checkpoint,
+                                    options)
+                break
+
+        if finished and checkpoint and not options.get('dry_run'):
+            if os.path.exists(checkpoint):
+                os.remove(checkpoint)
+
+    def purge(self, manager, queryset, phase, checkpoint, state, deadline,
+              options):
+        """
+        Deletes ``queryset`` in batches, recording the progress in
+        ``phase``. Returns a two-tuple: ``False`` if the runtime limit was
+        reached before the phase was completed (``True`` otherwise) and the
+        number of deleted rows.
+        """
+        total = 0
+        chunks = manager.delete_chunks(
+            queryset, options['batch_size'], phase['last_pk'])
+        for last_pk, deleted in chunks:
+            phase['last_pk'] = last_pk
+            total += deleted
+            self.save_checkpoint(checkpoint, state)
+            if deadline is not None and time.time() >= deadline:
+                return False, total
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        phase['done'] = True
+        self.save_checkpoint(checkpoint, state)
+        return True, total
+
+    def report(self, name, result, started):
+        if self.verbosity:
+            self.stdout.write("%s: %s in %.2fs\n" %
+                              (name, result, time.time() - started))
+
+    def report_stopped(self, name, last_pk, checkpoint, options):
+        """
+        Reports where a run stopped by ``--max-runtime`` stopped, and how to
+        carry on.
+        """
+        if not self.verbosity:
+            return
+        self.stdout.write("Stopped after %s seconds in the %s phase, after "
+                          "primary key %s; " %
+                          (options['max_runtime'], name, last_pk))
+        if checkpoint:
+            self.stdout.write("run again with --checkpoint=%s to resume.\n"
+                              % checkpoint)
+        else:
+            self.stdout.write("the remaining rows will be deleted by the "
+                              "next run.\n")
+
+    def load_checkpoint(self, checkpoint):
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                return json.load(f)
+        return {}
+
+    def save_checkpoint(self, checkpoint, state):
+        if checkpoint:
+            with open(checkpoint, 'w') as f:
+                json.dump(state, f)
@@ -0,0 +1,96 @@
+"""
+A management command which invites the email addresses read from a CSV
+file, or from the standard input, creating a registration profile and
+sending an activation email for each of them.
+
+The input is read as a stream and handed to
+``RegistrationManager.bulk_create_profiles()`` in fixed-size chunks, so
+memory use doesn't grow with the size of the file. Emails which already
+have a pending profile don't get another one, and are only sent their
+activation email if they were never sent one, so an import interrupted,
+or whose emails failed to be sent, can simply be run again.
+
+"""
+import csv
+import itertools
+import sys
+from optparse import make_option
+
+from django.contrib.sites.models import Site
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from registration.forms import RegistrationForm
+from registration.models import BULK_BATCH_SIZE
+from registration.models import RegistrationProfile
+from registration.models import normalize_email
+
+
+class Command(BaseCommand):
+    args = '[file]'
+    help = ("Invite the email addresses read from a CSV file, or from the "
+            "standard input if no file (or '-') is given")
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', action='store', type='int',
+                    dest='batch_size', default=BULK_BATCH_SIZE,
+                    help='Number of emails read and invited at a time.'),
+        make_option('--column', action='store', type='int', dest='column',
+                    default=0,
+                    help='Index of the CSV column holding the emails.'),
+        make_option('--no-email', action='store_false', dest='send_email',
+                    default=True,
+                    help="Create the profiles without sending activation "
+                         "emails."),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) > 1:
+            raise CommandError("Only one input file can be given.")
+        if not args or args[0] == '-':
+            self.import_stream(sys.stdin, **options)
+        else:
+            try:
+                stream = open(args[0], 'rb')
+            except IOError, e:
+                raise CommandError("Can't open %s: %s" % (args[0], e))
+            try:
+                self.import_stream(stream, **options)
+            finally:
+                stream.close()
+
+    def import_stream(self, stream, **options):
+        verbosity = int(options.get('verbosity', 1))
+        site = Site.objects.get_current()
+        emails = self.valid_emails(csv.reader(stream), options['column'])
+        self.read = self.invalid = created = 0
+        while True:
+            chunk = list(itertools.islice(emails, options['batch_size']))
+            if not chunk:
+                break
+            created += len(RegistrationProfile.objects.bulk_create_profiles(
+                site, chunk, send_email=options['send_email'],
+                batch_size=options['batch_size']))
+            if verbosity:
+                self.stdout.write("%d read, %d invited, %d invalid\n" % (
+                    self.read, created, self.invalid))
+
+    def valid_emails(self, rows, column):
+        """
+        Yield the normalised emails found in ``column`` of ``rows`` which
+        pass the validation of ``RegistrationForm``'s email field, keeping
+        count of the rows read and of the invalid ones.
+
+        """
+        field = RegistrationForm.base_fields['email']
+        max_length = RegistrationProfile._meta.get_field('email').max_length
+        for row in rows:
+            self.read += 1
+            try:
+                email = field.clean(normalize_email(row[column]))
+            except (IndexError, ValidationError):
+                email = None
+            if not email or len(email) > max_length:
+                self.invalid += 1
+                continue
+            yield email
@@ -0,0 +1,35 @@
+"""
+A management command which builds the Bloom filters of the values taken
+in the fields listed by the ``REGISTRATION_BLOOM_FILTER`` setting, and
+shares them through its cache (see ``registration.bloom``).
+
+It is the only place filters are built: run it at deployment and then
+more often than their ``timeout``, e.g. from cron, and after deleting
+many rows to get rid of their values. Running processes switch to the
+new filters the next time they find a value missing from theirs.
+
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from registration import bloom
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Bloom filters of taken emails and usernames"
+
+    def handle(self, *args, **options):
+        if bloom.get_options() is None:
+            raise CommandError("REGISTRATION_BLOOM_FILTER isn't set.")
+        try:
+            filters = bloom.get_filters()
+            verbosity = int(options.get('verbosity', 1))
+            for name, taken_values in sorted(filters.items()):
+                bloom_filter = taken_values.build()
+                if verbosity:
+                    self.stdout.write("%s: %d bytes, %d hashes\n" % (
+                        taken_values.name, len(bloom_filter.bits),
+                        bloom_filter.hashes))
+        except ImproperlyConfigured, e:
+            raise CommandError(str(e))
@@ -0,0 +1,44 @@
+"""
+A management command which sends the activation emails queued in the
+outbox (see ``registration.models.OutboxEmail``), through a single
+email backend connection.
+
+Calls ``OutboxEmail.objects.send_due()``, which contains the actual
+logic for sending and retrying emails.
+
+"""
+from optparse import make_option
+
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand
+
+from registration.models import OUTBOX_BACKOFF
+from registration.models import OUTBOX_BATCH_SIZE
+from registration.models import OUTBOX_MAX_ATTEMPTS
+from registration.models import OutboxEmail
+
+
+class Command(BaseCommand):
+    help = "Send the activation emails queued in the registration outbox"
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', action='store', type='int',
+                    dest='batch_size', default=OUTBOX_BATCH_SIZE,
+                    help='Number of queued emails loaded per query.'),
+        make_option('--max-attempts', action='store', type='int',
+                    dest='max_attempts', default=OUTBOX_MAX_ATTEMPTS,
+                    help='Failed attempts after which an email is marked '
+                         'as dead.'),
+        make_option('--backoff', action='store', type='int', dest='backoff',
+                    default=OUTBOX_BACKOFF,
+                    help='Seconds before the first retry of a failed email; '
+                         'doubled after each further failure.'),
+    )
+
+    def handle(self, *args, **options):
+        sent, failed = OutboxEmail.objects.send_due(
+            Site.objects.get_current(),
+            batch_size=options['batch_size'],
+            max_attempts=options['max_attempts'],
+            backoff=options['backoff'])
+        if int(options.get('verbosity', 1)):
+            self.stdout.write("%d sent, %d failed\n" % (sent, failed))
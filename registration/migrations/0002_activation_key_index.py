@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Adds an index on ``RegistrationProfile.activation_key``, built by
+``registration.schema.create_indexes``.
+
+"""
+from south.db import db
+from south.v2 import SchemaMigration
+
+from registration import schema
+
+
+class Migration(SchemaMigration):
+
+    # See ``registration.schema.create_indexes``.
+    no_dry_run = True
+
+    table = 'registration_registrationprofile'
+    columns = ['activation_key']
+
+    def forwards(self, orm):
+        schema.create_indexes(db, [db.create_index_sql(self.table,
+                                                       self.columns)])
+
+    def backwards(self, orm):
+        db.delete_index(self.table, self.columns)
+
+    models = {
+        'registration.registrationprofile': {
+            'Meta': {'object_name': 'RegistrationProfile'},
+            'activation_key': ('django.db.models.fields.CharField', [], {'max_length': '40', 'db_index': 'True'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'reg_time': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['registration']
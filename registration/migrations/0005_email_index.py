@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Adds an index on ``RegistrationProfile.email``, used by
+``RegistrationManager.bulk_create_profiles`` to skip emails which
+already have a pending profile. It is built by
+``registration.schema.create_indexes``.
+
+"""
+from south.db import db
+from south.v2 import SchemaMigration
+
+from registration import schema
+
+
+class Migration(SchemaMigration):
+
+    # See ``registration.schema.create_indexes``.
+    no_dry_run = True
+
+    table = 'registration_registrationprofile'
+    columns = ['email']
+
+    def forwards(self, orm):
+        schema.create_indexes(db, [db.create_index_sql(self.table,
+                                                       self.columns)])
+
+    def backwards(self, orm):
+        db.delete_index(self.table, self.columns)
+
+    models = {
+        'registration.consumedtoken': {
+            'Meta': {'object_name': 'ConsumedToken'},
+            'consumed_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'token_hash': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'})
+        },
+        'registration.outboxemail': {
+            'Meta': {'object_name': 'OutboxEmail'},
+            'attempts': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'next_attempt': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True'}),
+            'profile': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'outbox'", 'to': "orm['registration.RegistrationProfile']"}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'})
+        },
+        'registration.registrationprofile': {
+            'Meta': {'object_name': 'RegistrationProfile'},
+            'activation_key': ('django.db.models.fields.CharField', [], {'max_length': '40', 'db_index': 'True'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'reg_time': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['registration']
\ No newline at end of file
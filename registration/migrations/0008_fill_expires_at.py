@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Fills ``RegistrationProfile.expires_at`` in for existing profiles, as
+their registration time plus ``ACCOUNT_ACTIVATION_DAYS`` days, with one
+``UPDATE`` statement per ``CHUNK_SIZE`` primary keys so that big tables
+aren't locked as a whole.
+
+"""
+import datetime
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models import Max
+from south.v2 import DataMigration
+
+
+class Migration(DataMigration):
+
+    CHUNK_SIZE = 10000
+
+    def forwards(self, orm):
+        profiles = orm['registration.RegistrationProfile'].objects
+        last_pk = profiles.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        expiration = datetime.timedelta(days=settings.ACCOUNT_ACTIVATION_DAYS)
+        for start in xrange(0, last_pk, self.CHUNK_SIZE):
+            profiles.filter(pk__gt=start, pk__lte=start + self.CHUNK_SIZE,
+                            expires_at__isnull=True).update(
+                expires_at=F('reg_time') + expiration)
+
+    def backwards(self, orm):
+        pass
+
+    models = {
+        'registration.consumedtoken': {
+            'Meta': {'object_name': 'ConsumedToken'},
+            'consumed_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'token_hash': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'})
+        },
+        'registration.outboxemail': {
+            'Meta': {'object_name': 'OutboxEmail'},
+            'attempts': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'next_attempt': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True'}),
+            'profile': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'outbox'", 'to': "orm['registration.RegistrationProfile']"}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'})
+        },
+        'registration.registrationprofile': {
+            'Meta': {'object_name': 'RegistrationProfile'},
+            'activation_key': ('django.db.models.fields.CharField', [], {'max_length': '40', 'db_index': 'True'}),
+            'expires_at': ('django.db.models.fields.DateTimeField', [], {'null': 'True'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'reg_time': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['registration']
+    symmetrical = True
\ No newline at end of file
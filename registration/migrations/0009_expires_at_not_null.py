@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Makes ``RegistrationProfile.expires_at`` mandatory and indexes it, so
+that expiry checks are index range scans.
+
+On PostgreSQL ``SET NOT NULL`` would hold an ``ACCESS EXCLUSIVE`` lock
+on the table while scanning it, so the column stays nullable and a
+``CHECK (expires_at IS NOT NULL)`` constraint is added ``NOT VALID``
+instead, which only takes the lock briefly, then validated, which scans
+the table without blocking writes. The index is built by
+``registration.schema.create_indexes``.
+
+"""
+from south.db import db
+from south.v2 import SchemaMigration
+
+from registration import schema
+
+
+class Migration(SchemaMigration):
+
+    # See ``registration.schema.create_indexes``.
+    no_dry_run = True
+
+    table = 'registration_registrationprofile'
+    columns = ['expires_at']
+    constraint = 'registration_registrationprofile_expires_at_not_null'
+
+    def forwards(self, orm):
+        if db.backend_name == 'postgres':
+            db.execute('ALTER TABLE %s ADD CONSTRAINT %s '
+                       'CHECK (%s IS NOT NULL) NOT VALID' % (
+                db.quote_name(self.table), db.quote_name(self.constraint),
+                db.quote_name(self.columns[0])))
+            # Committed first, so that the validation scan doesn't run
+            # under the lock taken by ``ADD CONSTRAINT``.
+            db.commit_transaction()
+            db.start_transaction()
+            db.execute('ALTER TABLE %s VALIDATE CONSTRAINT %s' % (
+                db.quote_name(self.table), db.quote_name(self.constraint)))
+        else:
+            db.alter_column(self.table, 'expires_at',
+                            self.gf('django.db.models.fields.DateTimeField')())
+        schema.create_indexes(db, [db.create_index_sql(self.table,
+                                                       self.columns)])
+
+    def backwards(self, orm):
+        db.delete_index(self.table, self.columns)
+        if db.backend_name == 'postgres':
+            db.execute('ALTER TABLE %s DROP CONSTRAINT %s' % (
+                db.quote_name(self.table), db.quote_name(self.constraint)))
+        else:
+            db.alter_column(self.table, 'expires_at',
+                            self.gf('django.db.models.fields.DateTimeField')(
+                                null=True))
+
+    models = {
+        'registration.consumedtoken': {
+            'Meta': {'object_name': 'ConsumedToken'},
+            'consumed_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'token_hash': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'})
+        },
+        'registration.outboxemail': {
+            'Meta': {'object_name': 'OutboxEmail'},
+            'attempts': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'next_attempt': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True'}),
+            'profile': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'outbox'", 'to': "orm['registration.RegistrationProfile']"}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'})
+        },
+        'registration.registrationprofile': {
+            'Meta': {'object_name': 'RegistrationProfile'},
+            'activation_key': ('django.db.models.fields.CharField', [], {'max_length': '40', 'db_index': 'True'}),
+            'expires_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'reg_time': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['registration']
\ No newline at end of file
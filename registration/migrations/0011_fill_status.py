@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Marks the profiles whose activation key is the ``ALREADY_ACTIVATED``
+sentinel as activated, with one ``UPDATE`` statement per ``CHUNK_SIZE``
+primary keys so that big tables aren't locked as a whole. The sentinel
+is left in place; those profiles are purged by ``cleanupregistration``
+like any other activated profile.
+
+Going backwards, activated profiles get the sentinel back.
+
+"""
+from django.db.models import Max
+from south.v2 import DataMigration
+
+
+class Migration(DataMigration):
+
+    CHUNK_SIZE = 10000
+    SENTINEL = u"ALREADY_ACTIVATED"
+    ACTIVATED = 1
+
+    def forwards(self, orm):
+        self.convert(orm, {'activation_key': self.SENTINEL},
+                     {'status': self.ACTIVATED})
+
+    def backwards(self, orm):
+        self.convert(orm, {'status': self.ACTIVATED},
+                     {'activation_key': self.SENTINEL})
+
+    def convert(self, orm, lookup, values):
+        profiles = orm['registration.RegistrationProfile'].objects
+        last_pk = profiles.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        for start in xrange(0, last_pk, self.CHUNK_SIZE):
+            profiles.filter(pk__gt=start, pk__lte=start + self.CHUNK_SIZE,
+                            **lookup).update(**values)
+
+    models = {
+        'registration.consumedtoken': {
+            'Meta': {'object_name': 'ConsumedToken'},
+            'consumed_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'token_hash': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'})
+        },
+        'registration.outboxemail': {
+            'Meta': {'object_name': 'OutboxEmail'},
+            'attempts': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'next_attempt': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True'}),
+            'profile': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'outbox'", 'to': "orm['registration.RegistrationProfile']"}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'})
+        },
+        'registration.registrationprofile': {
+            'Meta': {'object_name': 'RegistrationProfile'},
+            'activation_key': ('django.db.models.fields.CharField', [], {'max_length': '40', 'db_index': 'True'}),
+            'expires_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'reg_time': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['registration']
+    symmetrical = True
\ No newline at end of file
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Indexes the pending profiles (``status = 0``), so that activation key
+lookups, ``RegistrationQuerySet.pending()`` and purges only go through
+live rows.
+
+On PostgreSQL and SQLite these are partial indexes on
+``activation_key`` and ``expires_at`` restricted to the pending rows.
+Databases without partial indexes get a composite
+``(status, expires_at)`` index instead. The indexes are built by
+``registration.schema.create_indexes``.
+
+"""
+from south.db import db
+from south.v2 import SchemaMigration
+
+from registration import schema
+
+
+class Migration(SchemaMigration):
+
+    # See ``registration.schema.create_indexes``.
+    no_dry_run = True
+
+    table = 'registration_registrationprofile'
+    partial_indexes = (
+        ('registration_registrationprofile_pending_key', 'activation_key'),
+        ('registration_registrationprofile_pending_expires', 'expires_at'),
+    )
+    columns = ['status', 'expires_at']
+
+    def forwards(self, orm):
+        if db.backend_name in ('postgres', 'sqlite3'):
+            statements = [
+                'CREATE INDEX %s ON %s (%s) WHERE %s = 0' % (
+                    db.quote_name(name), db.quote_name(self.table),
+                    db.quote_name(column), db.quote_name('status'))
+                for name, column in self.partial_indexes]
+        else:
+            statements = [db.create_index_sql(self.table, self.columns)]
+        schema.create_indexes(db, statements)
+
+    def backwards(self, orm):
+        if db.backend_name in ('postgres', 'sqlite3'):
+            for name, column in self.partial_indexes:
+                db.execute('DROP INDEX %s' % db.quote_name(name))
+        else:
+            db.delete_index(self.table, self.columns)
+
+    models = {
+        'registration.consumedtoken': {
+            'Meta': {'object_name': 'ConsumedToken'},
+            'consumed_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'token_hash': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'})
+        },
+        'registration.outboxemail': {
+            'Meta': {'object_name': 'OutboxEmail'},
+            'attempts': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'next_attempt': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True'}),
+            'profile': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'outbox'", 'to': "orm['registration.RegistrationProfile']"}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'})
+        },
+        'registration.registrationprofile': {
+            'Meta': {'object_name': 'RegistrationProfile'},
+            'activation_key': ('django.db.models.fields.CharField', [], {'max_length': '40', 'db_index': 'True'}),
+            'expires_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'reg_time': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['registration']
\ No newline at end of file
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Adds ``RegistrationProfile.pending_email`` and ``last_sent_at``, used by
+``RegistrationManager.register_profile`` to keep a single pending profile
+per email.
+
+Both columns are nullable, so adding them doesn't rewrite the table. The
+unique index on ``pending_email`` is built separately, on PostgreSQL by
+``registration.schema.create_indexes``.
+
+SQLite can't add a column without rebuilding the table, which recreates
+its indexes without their ``WHERE`` clause, so the partial indexes of
+migration 0012 are recreated afterwards, either way.
+
+"""
+from south.db import db
+from south.v2 import SchemaMigration
+
+from registration import schema
+
+
+class Migration(SchemaMigration):
+
+    # See ``registration.schema.create_indexes``.
+    no_dry_run = True
+
+    table = 'registration_registrationprofile'
+    index = 'registration_registrationprofile_pending_email_uniq'
+    partial_indexes = (
+        ('registration_registrationprofile_pending_key', 'activation_key'),
+        ('registration_registrationprofile_pending_expires', 'expires_at'),
+    )
+
+    def forwards(self, orm):
+        db.add_column(self.table, 'pending_email',
+                      self.gf('django.db.models.fields.EmailField')(
+                          max_length=75, null=True),
+                      keep_default=False)
+        db.add_column(self.table, 'last_sent_at',
+                      self.gf('django.db.models.fields.DateTimeField')(
+                          null=True),
+                      keep_default=False)
+        if db.backend_name == 'postgres':
+            schema.create_indexes(db, [
+                'CREATE UNIQUE INDEX %s ON %s (%s)' % (
+                    db.quote_name(self.index), db.quote_name(self.table),
+                    db.quote_name('pending_email'))])
+        else:
+            db.create_unique(self.table, ['pending_email'])
+        self.restore_partial_indexes()
+
+    def restore_partial_indexes(self):
+        if db.backend_name == 'sqlite3':
+            for name, column in self.partial_indexes:
+                db.execute('DROP INDEX IF EXISTS %s' % db.quote_name(name))
+                db.execute('CREATE INDEX %s ON %s (%s) WHERE %s = 0' % (
+                    db.quote_name(name), db.quote_name(self.table),
+                    db.quote_name(column), db.quote_name('status')))
+
+    def backwards(self, orm):
+        if db.backend_name == 'postgres':
+            db.execute('DROP INDEX %s' % db.quote_name(self.index))
+        else:
+            db.delete_unique(self.table, ['pending_email'])
+        db.delete_column(self.table, 'last_sent_at')
+        db.delete_column(self.table, 'pending_email')
+        self.restore_partial_indexes()
+
+    models = {
+        'registration.consumedtoken': {
+            'Meta': {'object_name': 'ConsumedToken'},
+            'consumed_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'token_hash': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'})
+        },
+        'registration.outboxemail': {
+            'Meta': {'object_name': 'OutboxEmail'},
+            'attempts': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'next_attempt': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True'}),
+            'profile': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'outbox'", 'to': "orm['registration.RegistrationProfile']"}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'})
+        },
+        'registration.registrationprofile': {
+            'Meta': {'object_name': 'RegistrationProfile'},
+            'activation_key': ('django.db.models.fields.CharField', [], {'max_length': '40', 'db_index': 'True'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'db_index': 'True'}),
+            'expires_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_sent_at': ('django.db.models.fields.DateTimeField', [], {'null': 'True'}),
+            'pending_email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'unique': 'True', 'null': 'True'}),
+            'reg_time': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'})
+        }
+    }
+
+    complete_apps = ['registration']
\ No newline at end of file
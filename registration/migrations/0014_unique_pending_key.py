@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Makes activation keys unique among the pending profiles, so that a key
+always designates a single profile (see ``registration.schema``).
+
+Pending profiles sharing a key, if any, first get new random keys, all
+but the oldest one of each key. On PostgreSQL and SQLite the unique
+index is partial, restricted to the pending rows (``status = 0``), and
+replaces the partial index on ``activation_key`` of migration 0012; on
+PostgreSQL it also replaces the index on every ``activation_key`` of
+migration 0002. Databases without partial indexes get a unique
+``(activation_key, status)`` index instead. The indexes are built by
+``registration.schema.create_indexes``, and databases created by
+``syncdb`` already have the unique one.
+
+"""
+import binascii
+import os
+
+from django.db import connections
+from django.db.models import Count
+from south.db import db
+from south.v2 import SchemaMigration
+
+from registration import schema
+
+
+class Migration(SchemaMigration):
+
+    # See ``registration.schema.create_indexes``.
+    no_dry_run = True
+
+    table = 'registration_registrationprofile'
+    partial_index = 'registration_registrationprofile_pending_key'
+    columns = ['activation_key', 'status']
+
+    def forwards(self, orm):
+        partial = db.backend_name in ('postgres', 'sqlite3')
+        profiles = orm['registration.RegistrationProfile'].objects
+        if partial:
+            profiles = profiles.filter(status=0)
+        shared = profiles.values(*self.columns).annotate(
+            count=Count('pk')).filter(count__gt=1)
+        for row in shared:
+            pks = profiles.filter(**dict(
+                (column, row[column]) for column in self.columns)
+                ).order_by('pk').values_list('pk', flat=True)
+            for pk in list(pks)[1:]:
+                profiles.filter(pk=pk).update(
+                    activation_key=binascii.hexlify(os.urandom(20)))
+
+        connection = connections[db.db_alias]
+        if not schema.index_exists(connection, self.table,
+                                   schema.PENDING_KEY_INDEX):
+            schema.create_indexes(db, [
+                schema.pending_key_index_sql(connection, self.table)])
+        if partial:
+            db.execute('DROP INDEX %s' % db.quote_name(self.partial_index))
+        if db.backend_name == 'postgres':
+            db.delete_index(self.table, ['activation_key'])
+
+    def backwards(self, orm):
+        statements = []
+        if db.backend_name == 'postgres':
+            statements.append(db.create_index_sql(self.table,
+                                                  ['activation_key']))
+        if db.backend_name in ('postgres', 'sqlite3'):
+            statements.append('CREATE INDEX %s ON %s (%s) WHERE %s = 0' % (
+                db.quote_name(self.partial_index), db.quote_name(self.table),
+                db.quote_name('activation_key'), db.quote_name('status')))
+        schema.create_indexes(db, statements)
+        if db.backend_name in ('postgres', 'sqlite3'):
+            db.execute('DROP INDEX %s' % db.quote_name(
+                schema.PENDING_KEY_INDEX))
+        else:
+            db.execute('DROP INDEX %s ON %s' % (
+                db.quote_name(schema.PENDING_KEY_INDEX),
+                db.quote_name(self.table)))
+
+    models = {
+        'registration.consumedtoken': {
+            'Meta': {'object_name': 'ConsumedToken'},
+            'consumed_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'token_hash': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'})
+        },
+        'registration.outboxemail': {
+            'Meta': {'object_name': 'OutboxEmail'},
+            'attempts': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'next_attempt': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True'}),
+            'profile': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'outbox'", 'to': "orm['registration.RegistrationProfile']"}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'})
+        },
+        'registration.registrationprofile': {
+            'Meta': {'object_name': 'RegistrationProfile'},
+            'activation_key': ('django.db.models.fields.CharField', [], {'max_length': '40', 'db_index': 'True'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'db_index': 'True'}),
+            'expires_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_sent_at': ('django.db.models.fields.DateTimeField', [], {'null': 'True'}),
+            'pending_email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'unique': 'True', 'null': 'True'}),
+            'reg_time': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'})
+        }
+    }
+
+    complete_apps = ['registration']
\ No newline at end of file
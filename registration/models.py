@@ -1,20 +1,376 @@
+import binascii
 import datetime
+import os
 import random
 import re
 
 from django.conf import settings
+from django.db import IntegrityError
+from django.db import connections
 from django.db import models
-from django.template.loader import render_to_string
+from django.db import transaction
+from django.db.models.query import QuerySet
+from django.db.models.sql.subqueries import DeleteQuery
+from django.dispatch.dispatcher import _make_id
+from django.template import Context
+from django.template.loader import get_template
+from django.test.signals import setting_changed
 from django.utils.hashcompat import sha_constructor
 from django.utils.translation import ugettext_lazy as _
+from django.core.mail import EmailMessage
 from django.core.mail import EmailMultiAlternatives
-from django.core.mail import send_mail
+from django.core.mail import get_connection
+
+from registration import bloom
+from registration import negative_cache
+from registration.instrumentation import timer
+from registration import tokens
 
 
 SHA1_RE = re.compile('^[a-f0-9]{40}$')
 
+INVALID_KEY_MESSAGE = _('Your activation key is not valid')
+
+# Maximum number of rows removed by a single ``DELETE`` statement when
+# purging profiles.
+DELETE_CHUNK_SIZE = 1000
+
+# Tables estimated to hold at least this many rows are counted from the
+# database statistics by ``RegistrationQuerySet.with_estimated_count``.
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+# Number of profiles inserted per query by ``bulk_create_profiles``.
+BULK_BATCH_SIZE = 500
+
+# Maximum number of messages handed at once to the email backend when
+# sending activation emails in bulk.
+EMAIL_BATCH_SIZE = 100
+
+# Outbox defaults, see ``OutboxEmail``: rows loaded per query, attempts
+# before an email is marked as dead, delay (in seconds) before the first
+# retry and delay (in seconds) after which an email claimed by a run
+# which didn't finish sending it is due again.
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_BACKOFF = 60
+OUTBOX_LEASE = 10 * 60
+
+# Minimum delay, in seconds, between two activation emails sent for the
+# same pending profile when registering again, see ``register_profile``.
+RESEND_COOLDOWN = 300
+
+def normalize_email(email):
+    """
+    Normalise an email address for storage and comparison: surrounding
+    whitespace is removed and the address is lower-cased.
+    """
+    return email.strip().lower()
+
+
+class EmailTemplates(object):
+    """
+    The templates used for activation emails, loaded and compiled once per
+    process instead of once per email.
+
+    Templates are not cached while ``TEMPLATE_DEBUG`` is ``True``, so that
+    changes to them are picked up during development, and the cache is
+    cleared whenever Django's ``setting_changed`` signal is sent.
+
+    """
+    names = {'subject': 'registration/activation_email_subject.txt',
+             'text': 'registration/activation_email.txt',
+             'html': 'registration/activation_email.html'}
+
+    def __init__(self):
+        self._templates = {}
+
+    def get(self, kind):
+        """
+        Returns the compiled template for ``kind``, one of the keys of
+        ``names``.
+        """
+        try:
+            return self._templates[kind]
+        except KeyError:
+            template = get_template(self.names[kind])
+            if not settings.TEMPLATE_DEBUG:
+                self._templates[kind] = template
+            return template
+
+    def render(self, kind, context):
+        """
+        Renders the template for ``kind`` with the dictionary ``context``.
+        """
+        return self.get(kind).render(Context(context))
+
+    def clear(self, **kwargs):
+        """
+        Empties the cache. Accepts any keyword arguments so that it can be
+        used as a signal receiver.
+        """
+        self._templates.clear()
+
+
+def _has_delete_receivers(model):
+    """
+    Returns whether deleting instances of ``model`` sends the
+    ``pre_delete`` or ``post_delete`` signal to any receiver.
+    """
+    # ``Signal.has_listeners`` only appeared in Django 1.5.
+    return any(signal._live_receivers(_make_id(model)) for signal in
+               (models.signals.pre_delete, models.signals.post_delete))
+
+
+class ChunkedManager(models.Manager):
+    """
+    Manager base class providing helpers to walk through and delete large
+    querysets in bounded chunks.
+
+    """
+    def iterate_chunks(self, queryset, chunk_size=None):
+        """
+        Generator iterating over ``queryset`` in primary key order, loading
+        at most ``chunk_size`` objects per query.
+
+        Args:
+            ``queryset`` objects to iterate over.
+            ``chunk_size`` Default value is ``DELETE_CHUNK_SIZE``.
+        """
+        chunk_size = chunk_size or DELETE_CHUNK_SIZE
+        queryset = queryset.order_by('pk')
+        last_pk = None
+        while True:
+            chunk = queryset
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            objects = list(chunk[:chunk_size])
+            if not objects:
+                return
+            for obj in objects:
+                yield obj
+            last_pk = objects[-1].pk
+
+    def delete_chunks(self, queryset, chunk_size=None, start_pk=None):
+        """
+        Generator deleting the objects in ``queryset`` in primary key order,
+        ``chunk_size`` rows at a time.
+
+        Each chunk is deleted in its own transaction, which first selects
+        the primary keys of the chunk ``FOR UPDATE``, so that the rows
+        matching ``queryset`` can't change before they are deleted. Only
+        primary keys are loaded into memory when every model referencing
+        this one cascades and isn't referenced itself, and no receiver
+        listens to the deletions (see ``fast_delete_fields``): the
+        referencing rows, then the objects, are deleted by ``DELETE ...
+        WHERE ... IN`` statements on those keys. Otherwise each chunk goes
+        through Django's deletion collector, which loads the objects and
+        the related ones, and sends the ``pre_delete`` and
+        ``post_delete`` signals.
+
+        Args:
+            ``queryset`` objects to be deleted.
+            ``chunk_size`` maximum number of rows deleted per statement.
+                Default value is ``DELETE_CHUNK_SIZE``.
+            ``start_pk`` if given, only objects whose primary key is greater
+                than this value are deleted, which allows resuming an
+                interrupted purge.
+        Yields:
+            Two-tuple containing the last deleted primary key and the number
+            of rows deleted, for each chunk.
+        """
+        chunk_size = chunk_size or DELETE_CHUNK_SIZE
+        queryset = queryset.order_by('pk')
+        fields = self.fast_delete_fields()
+        while True:
+            chunk = queryset
+            if start_pk is not None:
+                chunk = chunk.filter(pk__gt=start_pk)
+            with transaction.commit_on_success(using=self.db):
+                pks = list(chunk.select_for_update().values_list(
+                    'pk', flat=True)[:chunk_size])
+                if not pks:
+                    return
+                if fields is None:
+                    queryset.filter(pk__in=pks).delete()
+                else:
+                    for field in fields:
+                        DeleteQuery(field.model).delete_batch(pks, self.db,
+                                                              field=field)
+                    DeleteQuery(self.model).delete_batch(pks, self.db)
+            start_pk = pks[-1]
+            yield start_pk, len(pks)
+
+    def fast_delete_fields(self):
+        """
+        Returns the foreign keys referencing this model, if their rows can
+        be deleted by the keys they reference: they all cascade, and no
+        model references theirs, nor has many-to-many relations. Returns
+        ``None`` otherwise, or if deleting this model or the referencing
+        ones sends signals to receivers.
+        """
+        opts = self.model._meta
+        if opts.many_to_many or opts.get_all_related_many_to_many_objects() \
+                or _has_delete_receivers(self.model):
+            return None
+        fields = []
+        for related in opts.get_all_related_objects(include_hidden=True):
+            related_opts = related.model._meta
+            if related.field.rel.on_delete is not models.CASCADE or \
+                    related_opts.many_to_many or \
+                    related_opts.get_all_related_objects(include_hidden=True) \
+                    or related_opts.get_all_related_many_to_many_objects() \
+                    or _has_delete_receivers(related.model):
+                return None
+            fields.append(related.field)
+        return fields
+
+    def _delete_all(self, queryset, chunk_size):
+        return sum(deleted for last_pk, deleted in
+                   self.delete_chunks(queryset, chunk_size))
+
+
+def expiration_date(expiration_days=None):
+    """
+    Returns the time at which an activation key created now expires.
+
+    Args:
+        ``expiration_days`` number of days the key is valid for. Default
+            value is setting ``ACCOUNT_ACTIVATION_DAYS``.
+    """
+    if expiration_days is None:
+        expiration_days = settings.ACCOUNT_ACTIVATION_DAYS
+    return datetime.datetime.now() + datetime.timedelta(days=expiration_days)
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Returns the number of rows of ``model``'s table according to the
+    statistics kept by the database, which is much cheaper than a
+    ``COUNT(*)`` on big tables but only approximate. Only PostgreSQL and
+    MySQL are supported.
+
+    Args:
+        ``model`` model class whose table is counted.
+        ``using`` database alias.
+    Returns:
+        Estimated number of rows or ``None`` if the database doesn't
+        provide an estimate.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = "SELECT reltuples FROM pg_class WHERE oid = %s::regclass"
+        params = [connection.ops.quote_name(table)]
+    elif connection.vendor == 'mysql':
+        sql = ("SELECT table_rows FROM information_schema.tables "
+               "WHERE table_schema = DATABASE() AND table_name = %s")
+        params = [table]
+    else:
+        return None
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    return int(row[0])
+
+
+class RegistrationQuerySet(QuerySet):
+    """
+    ``QuerySet`` of ``RegistrationProfile`` objects filtering and annotating
+    them by activation state. Expiry is a comparison of the indexed
+    ``expires_at`` column with the current time, done by the database, so
+    no profile needs to be loaded to know its state.
 
-class RegistrationManager(models.Manager):
+    """
+    PENDING = 'pending'
+    EXPIRED = 'expired'
+    ACTIVATED = 'activated'
+    REVOKED = 'revoked'
+
+    _estimate_count = False
+
+    def _clone(self, klass=None, setup=False, **kwargs):
+        kwargs.setdefault('_estimate_count', self._estimate_count)
+        return super(RegistrationQuerySet, self)._clone(klass, setup,
+                                                        **kwargs)
+
+    def with_estimated_count(self):
+        """
+        Returns a copy of this queryset whose ``count()``, as long as no
+        filter is applied, is taken from the database statistics (see
+        ``estimated_row_count``) when the table holds at least
+        ``ESTIMATED_COUNT_THRESHOLD`` rows. Filtered querysets and small
+        tables are counted exactly.
+        """
+        return self._clone(_estimate_count=True)
+
+    def count(self):
+        if self._estimate_count and not self.query.where and \
+                self._result_cache is None:
+            estimate = estimated_row_count(self.model, self.db)
+            if estimate is not None and \
+                    estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super(RegistrationQuerySet, self).count()
+
+    def pending(self):
+        """
+        Profiles which can still be activated, i.e. neither expired nor
+        activated nor revoked.
+        """
+        return self.filter(status=self.model.PENDING,
+                           expires_at__gt=datetime.datetime.now())
+
+    def expired(self):
+        """
+        Profiles whose activation key has expired, whether they have been
+        activated or not.
+        """
+        return self.filter(expires_at__lte=datetime.datetime.now())
+
+    def activated(self):
+        """
+        Profiles whose status is ``ACTIVATED``.
+        """
+        return self.filter(status=self.model.ACTIVATED)
+
+    def revoked(self):
+        """
+        Profiles whose status is ``REVOKED``.
+        """
+        return self.filter(status=self.model.REVOKED)
+
+    def with_state(self):
+        """
+        Annotates every profile with a ``state`` attribute, one of
+        ``ACTIVATED``, ``REVOKED``, ``EXPIRED`` or ``PENDING``, in that order
+        of precedence, computed by a ``CASE`` expression.
+        """
+        ops = connections[self.db].ops
+        opts = self.model._meta
+        column = lambda name: '%s.%s' % (
+            ops.quote_name(opts.db_table),
+            ops.quote_name(opts.get_field(name).column))
+        sql = ("CASE WHEN %s = %%s THEN %%s WHEN %s = %%s THEN %%s "
+               "WHEN %s <= %%s THEN %%s ELSE %%s END" % (
+                   column('status'), column('status'), column('expires_at')))
+        params = (self.model.ACTIVATED, self.ACTIVATED,
+                  self.model.REVOKED, self.REVOKED,
+                  ops.value_to_db_datetime(datetime.datetime.now()),
+                  self.EXPIRED, self.PENDING)
+        return self.extra(select={'state': sql}, select_params=params)
+
+
+class _ActivationFailed(Exception):
+    # Raised to roll back the claim of a key when the activation callback
+    # fails, carrying its result, or ``None`` when the claim was lost.
+    def __init__(self, result):
+        Exception.__init__(self, result)
+        self.result = result
+
+
+class RegistrationManager(ChunkedManager):
     """
     Custom manager for the ``RegistrationProfile`` model.
     
@@ -23,6 +379,31 @@ class RegistrationManager(models.Manager):
     keys), and for cleaning out expired/already activated profiles.
     
     """
+    def get_query_set(self):
+        return RegistrationQuerySet(self.model, using=self._db)
+
+    def pending(self):
+        return self.get_query_set().pending()
+
+    def expired(self):
+        return self.get_query_set().expired()
+
+    def activated(self):
+        return self.get_query_set().activated()
+
+    def revoked(self):
+        return self.get_query_set().revoked()
+
+    def with_state(self):
+        return self.get_query_set().with_state()
+
+    def _state_queryset(self, queryset):
+        if queryset is None:
+            return self.get_query_set()
+        if not isinstance(queryset, RegistrationQuerySet):
+            queryset = queryset._clone(klass=RegistrationQuerySet)
+        return queryset
+
     def activate_user(self, request, activation_key, callback, **kwargs):
         """
         Validate an activation key and calls ``callback`` in order to activate
@@ -32,13 +413,17 @@ class RegistrationManager(models.Manager):
         If the key is valid, returns ``callback`` result two-tuple: (``User``
         instance, ``None``) on success or (falsy value, errors) on failure.
         
-        If the key is invalid (already activated or expired), returns a
-        two-tuple (``False``, 'Your activation key is not valid').
+        If the key is invalid (already activated, revoked or expired),
+        returns a two-tuple (``False``, 'Your activation key is not valid').
+
+        The pending profile of the key is claimed, i.e. marked as
+        activated, by a conditional ``UPDATE`` on its primary key, so two
+        concurrent requests can't activate it; the claim and ``callback``
+        run in a single transaction, rolled back if ``callback`` fails.
         
         To prevent reactivation of an account which has been
-        deactivated by site administrators, the activation key is
-        reset to the string constant ``RegistrationProfile.ACTIVATED``
-        after successful activation.
+        deactivated by site administrators, the profile status stays
+        ``RegistrationProfile.ACTIVATED`` after successful activation.
 
         Args:
             ``activation_key`` SHA1 hash string.
@@ -53,20 +438,57 @@ class RegistrationManager(models.Manager):
         # Make sure the key we're trying conforms to the pattern of a
         # SHA1 hash; if it doesn't, no point trying to look it up in
         # the database.
-        if SHA1_RE.search(activation_key):
+        # Keys already found to be invalid are remembered for a while, see
+        # ``registration.negative_cache``.
+        if SHA1_RE.search(activation_key) and \
+                not negative_cache.is_invalid(activation_key):
             try:
-                profile = self.get(activation_key=activation_key)
-            except self.model.DoesNotExist:
-                return False, _('Your activation key is not valid')
-            if not profile.activation_key_invalid():
-                account, errors = callback(request, profile, **kwargs)
-                if account:
-                    profile.activation_key = self.model.ACTIVATED
-                    profile.save()
+                with transaction.commit_on_success(using=self.db):
+                    account, errors = self._activate(
+                        request, activation_key, callback, **kwargs)
+            except _ActivationFailed, e:
+                # Concurrent attempts may have cached the key as invalid
+                # while it was claimed.
+                negative_cache.discard(activation_key)
+                return e.result or (False, INVALID_KEY_MESSAGE)
+            except:
+                negative_cache.discard(activation_key)
+                raise
+            negative_cache.mark_invalid(activation_key)
+            if account:
                 return account, errors
-        return False, _('Your activation key is not valid')
+        return False, INVALID_KEY_MESSAGE
+
+    def _activate(self, request, activation_key, callback, **kwargs):
+        # Returns ``(None, None)`` if there's no pending profile to claim,
+        # and raises ``_ActivationFailed`` if the claim is lost or
+        # ``callback`` fails, so that nothing is cached and the claim is
+        # rolled back.
+        profiles = list(self.pending().filter(
+            activation_key=activation_key)[:1])
+        if not profiles:
+            return None, None
+        profile = profiles[0]
+        # The claim only matches the profile while still pending and
+        # unexpired, so concurrent requests can't both activate it. The
+        # one which won may still fail, so losing doesn't make the key
+        # invalid for sure.
+        if not self.pending().filter(pk=profile.pk).update(
+                status=self.model.ACTIVATED):
+            raise _ActivationFailed(None)
+        profile.status = self.model.ACTIVATED
+        with timer('activate.callback'):
+            account, errors = callback(request, profile, **kwargs)
+        if not account:
+            raise _ActivationFailed((account, errors))
+        if profile.pending_email is not None:
+            # Frees the email for a new registration.
+            self.filter(pk=profile.pk).update(pending_email=None)
+            profile.pending_email = None
+        return account, errors
 
-    def create_profile(self, site, email, send_email=True):
+    def create_profile(self, site, email, send_email=True,
+                       expiration_days=None):
         """
         Create a ``RegistrationProfile`` for a given email, and return the
         ``RegistrationProfile``.
@@ -78,54 +500,363 @@ class RegistrationManager(models.Manager):
             ``site`` current site object, needed for sending activation email
             ``email`` string represeting email for the new profile
             ``send_email`` boolean value which determines whether email will be
-                sent or not. Default value is ``True``.
+                sent or not. Default value is ``True``. When the setting
+                ``REGISTRATION_EMAIL_OUTBOX`` is ``True`` the email is not
+                sent but queued in the outbox, in the same transaction as
+                the profile creation (see ``OutboxEmail``).
+            ``expiration_days`` number of days the activation key is valid
+                for, stored as ``expires_at``. Default value is setting
+                ``ACCOUNT_ACTIVATION_DAYS``.
         Returns:
-            The new ``RegistrationProfile`` instance.
+            The new ``RegistrationProfile`` instance, or the pending one of
+            ``email`` when the setting ``REGISTRATION_UNIQUE_PENDING`` is
+            ``True`` (see ``register_profile``).
         """
+        if getattr(settings, 'REGISTRATION_UNIQUE_PENDING', False):
+            return self.register_profile(site, email, send_email=send_email,
+                                         expiration_days=expiration_days)
         salt = sha_constructor(str(random.random())).hexdigest()[:5]
         if isinstance(email, unicode):
             email = email.encode('utf-8')
         activation_key = sha_constructor(salt+email).hexdigest()
-        profile = self.create(email=email, activation_key=activation_key)
+        expires_at = expiration_date(expiration_days)
+        last_sent_at = send_email and datetime.datetime.now() or None
+        if getattr(settings, 'REGISTRATION_EMAIL_OUTBOX', False):
+            with transaction.commit_on_success(using=self.db):
+                profile = self.create(email=email,
+                                      activation_key=activation_key,
+                                      expires_at=expires_at,
+                                      last_sent_at=last_sent_at)
+                if send_email:
+                    OutboxEmail.objects.create(profile=profile)
+            return profile
+        profile = self.create(email=email, activation_key=activation_key,
+                              expires_at=expires_at, last_sent_at=last_sent_at)
         if profile and send_email:
             profile.send_activation_email(site)
         return profile
 
-    @staticmethod
-    def delete_expired(queryset=None):
+    def register_profile(self, site, email, send_email=True,
+                         expiration_days=None, cooldown=None):
+        """
+        Create a ``RegistrationProfile`` for a given email, like
+        ``create_profile``, unless the setting
+        ``REGISTRATION_UNIQUE_PENDING`` is ``True``: then registering an
+        email again reuses its pending profile instead of adding another
+        one.
+
+        In that mode the normalised email (see ``normalize_email``) of a
+        pending profile is stored in ``pending_email``, whose unique
+        constraint makes concurrent registrations of an email end up with
+        the same profile. Registering again that email:
+
+        * doesn't send anything if the last activation email was sent less
+          than ``cooldown`` seconds ago,
+
+        * sends the activation email again, with the same key, otherwise,
+
+        * rotates the activation key in place and sends it if the key has
+          expired.
+
+        Each update is conditional on the values read, so that concurrent
+        registrations send a single email.
+
+        Args:
+            ``site``, ``email``, ``send_email``, ``expiration_days`` see
+                ``create_profile``.
+            ``cooldown`` Default value is setting
+                ``REGISTRATION_RESEND_COOLDOWN``, or ``RESEND_COOLDOWN``.
+        Returns:
+            The new or reused ``RegistrationProfile`` instance.
+        """
+        if not getattr(settings, 'REGISTRATION_UNIQUE_PENDING', False):
+            return self.create_profile(site, email, send_email=send_email,
+                                       expiration_days=expiration_days)
+        email = normalize_email(email)
+        now = datetime.datetime.now()
+        try:
+            profile = self.get(pending_email=email)
+        except self.model.DoesNotExist:
+            outbox = getattr(settings, 'REGISTRATION_EMAIL_OUTBOX', False)
+            try:
+                with transaction.commit_on_success(using=self.db):
+                    profile = self.create(
+                        email=email, pending_email=email,
+                        activation_key=binascii.hexlify(os.urandom(20)),
+                        expires_at=expiration_date(expiration_days),
+                        last_sent_at=send_email and now or None)
+                    if send_email and outbox:
+                        OutboxEmail.objects.create(profile=profile)
+            except IntegrityError:
+                # A concurrent registration of the same email won.
+                profile = self.get(pending_email=email)
+            else:
+                if send_email and not outbox:
+                    profile.send_activation_email(site)
+                return profile
+        if profile.status != self.model.PENDING or not send_email:
+            # Being activated, or nothing else to do.
+            return profile
+        if cooldown is None:
+            cooldown = getattr(settings, 'REGISTRATION_RESEND_COOLDOWN',
+                               RESEND_COOLDOWN)
+        claim = self.filter(pk=profile.pk, activation_key=profile.activation_key,
+                            last_sent_at=profile.last_sent_at)
+        if profile.activation_key_expired():
+            profile.activation_key = binascii.hexlify(os.urandom(20))
+            profile.expires_at = expiration_date(expiration_days)
+        elif profile.last_sent_at is not None and \
+                profile.last_sent_at > now - datetime.timedelta(
+                    seconds=cooldown):
+            return profile
+        if claim.update(activation_key=profile.activation_key,
+                        expires_at=profile.expires_at, last_sent_at=now):
+            profile.last_sent_at = now
+            self._send_or_queue(site, profile)
+        return profile
+
+    def _send_or_queue(self, site, profile):
+        if getattr(settings, 'REGISTRATION_EMAIL_OUTBOX', False):
+            OutboxEmail.objects.create(profile=profile)
+        else:
+            profile.send_activation_email(site)
+
+    def bulk_create_profiles(self, site, emails, send_email=True,
+                             batch_size=None, expiration_days=None):
+        """
+        Create ``RegistrationProfile`` objects for many emails at once, e.g.
+        to invite the members of an organisation.
+
+        Emails are normalised (see ``normalize_email``) and de-duplicated,
+        both among themselves and against the emails which already have a
+        pending profile (see ``pending_profiles``). Then, ``batch_size``
+        emails at a time, the profiles are inserted with a single
+        ``bulk_create`` query, in a transaction of their own, and their
+        activation emails are sent through a single connection (see
+        ``send_activation_emails``), or queued in the outbox when the
+        setting ``REGISTRATION_EMAIL_OUTBOX`` is ``True``.
+
+        ``last_sent_at`` records the emails sent, once sent, or queued.
+        When ``send_email`` is ``True``, the pending profiles of the emails
+        which were never sent one, e.g. because sending failed after the
+        profiles were committed, get theirs too, so running it again with
+        the same emails after a failure neither creates duplicates nor
+        leaves anyone uninvited. A failure while sending a batch may make
+        a run send some of its emails again.
+
+        When the setting ``REGISTRATION_UNIQUE_PENDING`` is ``True``, the
+        new profiles get their ``pending_email`` set, and the emails whose
+        pending profile has expired go through ``register_profile``, which
+        rotates its key, instead of getting another profile. A batch
+        racing a registration of one of its emails fails as a whole, on
+        the unique constraint of ``pending_email``.
+
+        Activation keys are 40 random hexadecimal digits, all of a batch
+        taken from a single ``os.urandom`` call.
+
+        Args:
+            ``site`` current site object, needed for sending activation email
+            ``emails`` iterable of email strings
+            ``send_email`` see ``create_profile``.
+            ``batch_size`` Default value is ``BULK_BATCH_SIZE``.
+            ``expiration_days`` see ``create_profile``.
+        Returns:
+            The list of new ``RegistrationProfile`` instances, each batch's
+            followed by the existing ones whose activation email was sent.
+        """
+        batch_size = batch_size or BULK_BATCH_SIZE
+        emails = list(emails)
+        created = []
+        seen = set()
+        for start in xrange(0, len(emails), batch_size):
+            batch = []
+            for email in emails[start:start + batch_size]:
+                email = normalize_email(email)
+                if email and email not in seen:
+                    seen.add(email)
+                    batch.append(email)
+            if batch:
+                created.extend(self._bulk_create_batch(site, batch,
+                                                       send_email,
+                                                       expiration_days))
+        return created
+
+    def _bulk_create_batch(self, site, emails, send_email, expiration_days):
+        outbox = getattr(settings, 'REGISTRATION_EMAIL_OUTBOX', False)
+        unique = getattr(settings, 'REGISTRATION_UNIQUE_PENDING', False)
+        lookup = unique and 'pending_email__in' or 'email__in'
+        now = datetime.datetime.now()
+        expired = []
+        unsent = []
+        with transaction.commit_on_success(using=self.db):
+            if unique:
+                # Pending profiles keep their ``pending_email`` once
+                # expired, until ``register_profile`` rotates their key.
+                taken = dict(self.filter(pending_email__in=emails).values_list(
+                    'pending_email', 'expires_at'))
+                pending = set(taken)
+                expired = [email for email, expires_at in taken.iteritems()
+                           if expires_at <= now]
+            else:
+                pending = set(self.pending().filter(
+                    email__in=emails).values_list('email', flat=True))
+            if send_email and pending:
+                unsent = list(self.pending().filter(
+                    last_sent_at=None, **{lookup: list(pending)}))
+            emails = [email for email in emails if email not in pending]
+            entropy = binascii.hexlify(os.urandom(20 * len(emails)))
+            expires_at = expiration_date(expiration_days)
+            profiles = [self.model(email=email,
+                                   pending_email=unique and email or None,
+                                   activation_key=entropy[40 * i:40 * (i + 1)],
+                                   expires_at=expires_at)
+                        for i, email in enumerate(emails)]
+            if profiles:
+                self.bulk_create(profiles)
+            # ``bulk_create`` doesn't set primary keys, so the new rows are
+            # looked up by activation key.
+            keys = [profile.activation_key for profile in profiles + unsent]
+            if keys and send_email and outbox:
+                sent = self.filter(activation_key__in=keys)
+                OutboxEmail.objects.bulk_create([
+                    OutboxEmail(profile_id=pk)
+                    for pk in sent.values_list('pk', flat=True)])
+                sent.update(last_sent_at=now)
+        if keys and send_email and not outbox:
+            self.send_activation_emails(site, profiles + unsent)
+        elif keys and send_email:
+            for profile in profiles + unsent:
+                profile.last_sent_at = now
+        for email in expired:
+            self.register_profile(site, email, send_email=send_email,
+                                  expiration_days=expiration_days)
+        return profiles + unsent
+
+    def send_activation_emails(self, site, profiles, batch_size=None,
+                               connection=None):
+        """
+        Sends the activation emails of ``profiles`` through a single email
+        backend connection, passing ``batch_size`` messages at a time to
+        its ``send_messages`` method, and records when they were sent in
+        ``last_sent_at``, so that ``register_profile`` doesn't send them
+        again too soon.
+
+        Args:
+            ``site`` see ``RegistrationProfile.send_activation_email``.
+            ``profiles`` iterable of ``RegistrationProfile`` instances.
+            ``batch_size`` Default value is ``EMAIL_BATCH_SIZE``.
+            ``connection`` email backend instance to use; a new one is
+                created by default.
+        Returns:
+            The number of sent emails.
+        """
+        batch_size = batch_size or EMAIL_BATCH_SIZE
+        connection = connection or get_connection()
+        sent = 0
+        messages = []
+        batch = []
+        connection.open()
+        try:
+            for profile in profiles:
+                with timer('email.render'):
+                    messages.append(profile.build_activation_email(site))
+                batch.append(profile)
+                if len(messages) >= batch_size:
+                    sent += self._send_batch(connection, messages, batch)
+                    messages = []
+                    batch = []
+            if messages:
+                sent += self._send_batch(connection, messages, batch)
+        finally:
+            connection.close()
+        return sent
+
+    def _send_batch(self, connection, messages, profiles):
+        with timer('email.send'):
+            sent = connection.send_messages(messages) or 0
+        if sent:
+            # Profiles created by ``bulk_create`` have no primary key, but
+            # the keys of pending profiles are unique.
+            now = datetime.datetime.now()
+            self.filter(status=self.model.PENDING, activation_key__in=[
+                profile.activation_key for profile in profiles]).update(
+                last_sent_at=now)
+            for profile in profiles:
+                profile.last_sent_at = now
+        return sent
+
+    def pending_profiles(self, queryset=None):
         """
-        Deletes expired ``RegistrationProfile`` objects based on settings
-        ``ACCOUNT_ACTIVATION_DAYS`` and current date.
+        Returns the profiles which can still be activated, i.e. neither
+        expired nor already activated. The filtering is done by the
+        database.
 
         Args:
             ``queryset`` If a queryset is provided then only profiles in the
                 given queryset will be tested, if no value is provided then all
                 profiles will be tested. Default value is ``None``.
         """
-        expiration_date = datetime.timedelta(days=settings.ACCOUNT_ACTIVATION_DAYS)
-        if queryset is None:
-            queryset = RegistrationProfile.objects.all()
-        for profile in queryset:
-            if (profile.reg_time + expiration_date) <= datetime.datetime.now():
-                profile.delete()
+        return self._state_queryset(queryset).pending()
 
-    @staticmethod
-    def delete_activated(queryset=None):
+    def expired_profiles(self, queryset=None):
         """
-        Deletes already activated ``RegistrationProfile`` objects based on
-        activation key and ``ACTIVATED`` value comparison.
+        Returns the expired profiles, based on settings
+        ``ACCOUNT_ACTIVATION_DAYS`` and current date. The expiration cutoff
+        is computed once and the filtering is done by the database.
 
         Args:
             ``queryset`` If a queryset is provided then only profiles in the
                 given queryset will be tested, if no value is provided then all
                 profiles will be tested. Default value is ``None``.
         """
-        if queryset is None:
-            queryset = RegistrationProfile.objects.all()
-        for profile in queryset:
-            if profile.activation_key == RegistrationProfile.ACTIVATED:
-                profile.delete()
+        return self._state_queryset(queryset).expired()
+
+    def activated_profiles(self, queryset=None):
+        """
+        Returns the already activated profiles, based on the profile status,
+        which is compared by the database.
+
+        Args:
+            ``queryset`` If a queryset is provided then only profiles in the
+                given queryset will be tested, if no value is provided then all
+                profiles will be tested. Default value is ``None``.
+        """
+        return self._state_queryset(queryset).activated()
+
+    def delete_expired(self, queryset=None, chunk_size=None):
+        """
+        Deletes expired ``RegistrationProfile`` objects (see
+        ``expired_profiles``). Matching rows are deleted in primary key
+        order, at most ``chunk_size`` rows per ``DELETE`` statement.
+
+        Args:
+            ``queryset`` If a queryset is provided then only profiles in the
+                given queryset will be tested, if no value is provided then all
+                profiles will be tested. Default value is ``None``.
+            ``chunk_size`` maximum number of rows deleted per statement.
+                Default value is ``DELETE_CHUNK_SIZE``.
+        Returns:
+            The number of deleted profiles.
+        """
+        return self._delete_all(self.expired_profiles(queryset), chunk_size)
+
+    def delete_activated(self, queryset=None, chunk_size=None):
+        """
+        Deletes already activated ``RegistrationProfile`` objects (see
+        ``activated_profiles``). Rows are deleted in chunks as in
+        ``delete_expired``.
 
+        Args:
+            ``queryset`` If a queryset is provided then only profiles in the
+                given queryset will be tested, if no value is provided then all
+                profiles will be tested. Default value is ``None``.
+            ``chunk_size`` maximum number of rows deleted per statement.
+                Default value is ``DELETE_CHUNK_SIZE``.
+        Returns:
+            The number of deleted profiles.
+        """
+        return self._delete_all(self.activated_profiles(queryset),
+                                chunk_size)
 
 class RegistrationProfile(models.Model):
     """
@@ -143,11 +874,31 @@ class RegistrationProfile(models.Model):
     account registration and activation.
     
     """
-    ACTIVATED = u"ALREADY_ACTIVATED"
+    PENDING = 0
+    ACTIVATED = 1
+    REVOKED = 2
+    STATUS_CHOICES = ((PENDING, _('pending')),
+                      (ACTIVATED, _('activated')),
+                      (REVOKED, _('revoked')))
+
+    email_templates = EmailTemplates()
     
-    email = models.EmailField()
-    activation_key = models.CharField(_('activation key'), max_length=40)
-    reg_time = models.DateTimeField(_('registration time'), auto_now_add=True)
+    email = models.EmailField(db_index=True)
+    # Unique among the pending profiles, see ``registration.schema``.
+    activation_key = models.CharField(_('activation key'), max_length=40,
+                                      db_index=True)
+    reg_time = models.DateTimeField(_('registration time'), auto_now_add=True,
+                                    db_index=True)
+    expires_at = models.DateTimeField(_('expiration time'), db_index=True)
+    status = models.PositiveSmallIntegerField(_('status'),
+                                              choices=STATUS_CHOICES,
+                                              default=PENDING)
+    # Only set by ``register_profile`` when pending profiles are unique per
+    # email, and cleared once activated or revoked.
+    pending_email = models.EmailField(_('pending email'), null=True,
+                                      unique=True, editable=False)
+    last_sent_at = models.DateTimeField(_('last activation email'), null=True,
+                                        editable=False)
     
     objects = RegistrationManager()
     
@@ -157,6 +908,11 @@ class RegistrationProfile(models.Model):
     
     def __unicode__(self):
         return u"Registration information for %s" % self.email
+
+    def save(self, *args, **kwargs):
+        if self.expires_at is None:
+            self.expires_at = expiration_date()
+        super(RegistrationProfile, self).save(*args, **kwargs)
     
     def activation_key_invalid(self):
         """
@@ -165,23 +921,22 @@ class RegistrationProfile(models.Model):
         
         Key expiration is determined by a two-step process:
         
-        1. If the user has already activated, the key will have been
-           reset to the string constant ``ACTIVATED``. Re-activating
+        1. If the user has already activated, or the key has been revoked,
+           the profile status is no longer ``PENDING``. Re-activating
            is not permitted, and so this method returns ``True`` in
            this case.
 
-        2. Otherwise, the date the user signed up is incremented by
-           the number of days specified in the setting
-           ``ACCOUNT_ACTIVATION_DAYS`` (which should be the number of
-           days after signup during which a user is allowed to
-           activate their account); if the result is less than or
-           equal to the current date, the key has expired and this
-           method returns ``True``.
+        2. Otherwise, the expiration time stored in ``expires_at`` (by
+           default, the signup date incremented by the number of days
+           specified in the setting ``ACCOUNT_ACTIVATION_DAYS``) is
+           compared to the current date; if it is less than or equal to
+           the current date, the key has expired and this method
+           returns ``True``.
 
         Returns:
             Boolean value.
         """
-        return self.activation_key_already_activated() or \
+        return self.status != self.PENDING or \
             self.activation_key_expired() or False
     activation_key_invalid.boolean = True
 
@@ -193,7 +948,7 @@ class RegistrationProfile(models.Model):
         Returns:
             Boolean value.
         """
-        return self.activation_key == self.ACTIVATED
+        return self.status == self.ACTIVATED
     activation_key_already_activated.boolean = True
 
     def activation_key_expired(self):
@@ -204,10 +959,22 @@ class RegistrationProfile(models.Model):
         Returns:
             Boolean value.
         """
-        expiration_date = datetime.timedelta(days=settings.ACCOUNT_ACTIVATION_DAYS)
-        return (self.reg_time + expiration_date) <= datetime.datetime.now()
+        return self.expires_at <= datetime.datetime.now()
     activation_key_expired.boolean = True
 
+    def expiration_days_left(self):
+        """
+        Returns the number of days, rounded up, until the activation key
+        expires, or setting ``ACCOUNT_ACTIVATION_DAYS`` if the profile has
+        no expiration time yet.
+        """
+        if self.expires_at is None:
+            return settings.ACCOUNT_ACTIVATION_DAYS
+        left = self.expires_at - datetime.datetime.now()
+        if left.seconds or left.microseconds:
+            return max(left.days + 1, 0)
+        return max(left.days, 0)
+
     def send_activation_email(self, site):
         """
         Send an activation email to the user associated with this
@@ -248,43 +1015,314 @@ class RegistrationProfile(models.Model):
         Args:
             ``site`` the above explained ``site``
         """
+        with timer('email.render'):
+            message = self.build_activation_email(site)
+        with timer('email.send'):
+            message.send()
+
+    def build_activation_email(self, site, connection=None):
+        """
+        Build the activation email sent by ``send_activation_email``
+        without sending it.
+
+        Depending on the setting ``REGISTRATION_EMAIL_TYPE`` the body is
+        rendered from ``registration/activation_email.txt`` (``TEXT``, the
+        default), ``registration/activation_email.html`` (``HTML``) or both
+        (``MULTI``).
+
+        Args:
+            ``site`` see ``send_activation_email``.
+            ``connection`` optional email backend instance the message
+                will be sent through.
+        Returns:
+            A ``django.core.mail.EmailMessage`` instance.
+        """
         email_type = getattr(settings, 'REGISTRATION_EMAIL_TYPE', 'TEXT')
         ctx_dict = getattr(settings, 'REGISTRATION_EMAIL_CTXT', {}).copy()
 
         ctx_dict.update({'activation_key': self.activation_key,
-                         'expiration_days': settings.ACCOUNT_ACTIVATION_DAYS,
+                         'expiration_days': self.expiration_days_left(),
                          'site': site})
 
-        subject = render_to_string('registration/activation_email_subject.txt',
-                                   ctx_dict)
+        subject = self.email_templates.render('subject', ctx_dict)
         # Email subject *must not* contain newlines
         subject = ''.join(subject.splitlines())
 
         if email_type.upper() == "HTML":
-            return self._sent_tml_email(subject, ctx_dict)
+            return self._build_html_email(subject, ctx_dict, connection)
         elif email_type.upper() == "MULTI":
-            return self._send_multi_email(subject, ctx_dict)
+            return self._build_multi_email(subject, ctx_dict, connection)
 
-        
-        message = render_to_string('registration/activation_email.txt',
-                                   ctx_dict)
+        message = self.email_templates.render('text', ctx_dict)
 
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [self.email])
+        return EmailMessage(subject, message, settings.DEFAULT_FROM_EMAIL,
+                            [self.email], connection=connection)
 
-    def _send_html_email(self, subject, context):
-        message = render_to_string('registration/activation_email.html',
-                                   context)
+    def _build_html_email(self, subject, context, connection):
+        message = self.email_templates.render('html', context)
 
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [self.email])
+        msg = EmailMessage(subject, message, settings.DEFAULT_FROM_EMAIL,
+                           [self.email], connection=connection)
+        msg.content_subtype = "html"
+        return msg
 
-    def _send_multi_email(self, subject, context):
-        text_content = render_to_string('registration/activation_email.txt',
-                                        context)
-        html_content = render_to_string('registration/activation_email.html',
-                                        context)
+    def _build_multi_email(self, subject, context, connection):
+        text_content = self.email_templates.render('text', context)
+        html_content = self.email_templates.render('html', context)
         msg = EmailMultiAlternatives(subject,
                                      text_content,
                                      settings.DEFAULT_FROM_EMAIL,
-                                     [self.email])
+                                     [self.email],
+                                     connection=connection)
         msg.attach_alternative(html_content, "text/html")
-        msg.send()
+        return msg
+
+
+setting_changed.connect(RegistrationProfile.email_templates.clear)
+
+models.signals.post_save.connect(negative_cache.discard_profile,
+                                 sender=RegistrationProfile)
+models.signals.class_prepared.connect(bloom.connect_prepared)
+bloom.connect_receivers()
+
+
+class OutboxEmailManager(models.Manager):
+    """
+    Custom manager for the ``OutboxEmail`` model, draining the outbox.
+
+    """
+    def due(self, now=None):
+        """
+        Returns the pending outbox emails whose next attempt is due.
+        """
+        return self.filter(status=self.model.PENDING,
+                           next_attempt__lte=now or datetime.datetime.now())
+
+    def claim(self, outbox_email, lease=None):
+        """
+        Claims ``outbox_email`` for sending, by delaying its next attempt
+        by ``lease`` seconds with a conditional ``UPDATE``, which only
+        matches it if no concurrent run claimed it first.
+
+        Args:
+            ``outbox_email`` the ``OutboxEmail`` instance, as loaded.
+            ``lease`` Default value is ``OUTBOX_LEASE``.
+        Returns:
+            ``True`` if the email was claimed, ``False`` otherwise.
+        """
+        lease_end = datetime.datetime.now() + datetime.timedelta(
+            seconds=lease or OUTBOX_LEASE)
+        if self.filter(pk=outbox_email.pk, status=self.model.PENDING,
+                       next_attempt=outbox_email.next_attempt).update(
+                next_attempt=lease_end):
+            outbox_email.next_attempt = lease_end
+            return True
+        return False
+
+    def send_due(self, site, batch_size=None, max_attempts=None,
+                 backoff=None, connection=None):
+        """
+        Sends the due activation emails, ``batch_size`` at a time, through
+        a single email backend connection. Sent emails are removed from the
+        outbox; failed ones are retried later (see ``OutboxEmail.failed``).
+
+        Each email is claimed (see ``claim``) before being sent, so that
+        overlapping runs, e.g. from cron, don't send it twice; an email
+        whose run dies while sending it is sent again once its lease is
+        over. Due emails whose profile was activated, revoked or has
+        expired since they were queued are deleted without being sent.
+
+        Args:
+            ``site`` see ``RegistrationProfile.send_activation_email``.
+            ``batch_size`` number of outbox rows loaded per query. Default
+                value is ``OUTBOX_BATCH_SIZE``.
+            ``max_attempts`` and ``backoff`` see ``OutboxEmail.failed``.
+            ``connection`` email backend instance to use; a new one is
+                created by default.
+        Returns:
+            Two-tuple containing the number of sent and failed emails.
+        """
+        batch_size = batch_size or OUTBOX_BATCH_SIZE
+        connection = connection or get_connection()
+        sent = failed = 0
+        live = {'profile__status': RegistrationProfile.PENDING,
+                'profile__expires_at__gt': datetime.datetime.now()}
+        self.due().exclude(**live).delete()
+        connection.open()
+        try:
+            while True:
+                batch = list(self.due().filter(**live).select_related(
+                    'profile')[:batch_size])
+                if not batch:
+                    break
+                delivered = []
+                for outbox_email in batch:
+                    if not self.claim(outbox_email):
+                        # Being sent by a concurrent run.
+                        continue
+                    try:
+                        message = outbox_email.profile.build_activation_email(
+                            site, connection=connection)
+                        message.send()
+                    except Exception, e:
+                        outbox_email.failed(e, max_attempts, backoff)
+                        failed += 1
+                        # The connection may be unusable after an error.
+                        connection.close()
+                        connection.open()
+                    else:
+                        delivered.append(outbox_email.pk)
+                self.filter(pk__in=delivered).delete()
+                sent += len(delivered)
+        finally:
+            connection.close()
+        return sent, failed
+
+
+class OutboxEmail(models.Model):
+    """
+    An activation email waiting to be sent, created instead of sending the
+    email synchronously when the setting ``REGISTRATION_EMAIL_OUTBOX`` is
+    ``True``. The outbox is drained by the ``sendregistrationemails``
+    management command.
+
+    Emails which keep failing are marked as ``DEAD`` after
+    ``OUTBOX_MAX_ATTEMPTS`` attempts and are not retried anymore.
+
+    """
+    PENDING = 0
+    DEAD = 1
+    STATUS_CHOICES = ((PENDING, _('pending')),
+                      (DEAD, _('dead')))
+
+    profile = models.ForeignKey(RegistrationProfile, related_name='outbox')
+    status = models.PositiveSmallIntegerField(_('status'),
+                                              choices=STATUS_CHOICES,
+                                              default=PENDING)
+    attempts = models.PositiveSmallIntegerField(_('attempts'), default=0)
+    next_attempt = models.DateTimeField(_('next attempt'),
+                                        default=datetime.datetime.now,
+                                        db_index=True)
+    last_error = models.CharField(_('last error'), max_length=255,
+                                  blank=True)
+
+    objects = OutboxEmailManager()
+
+    class Meta:
+        verbose_name = _('outbox email')
+        verbose_name_plural = _('outbox emails')
+
+    def __unicode__(self):
+        return u"Activation email for %s" % self.profile.email
+
+    def failed(self, error, max_attempts=None, backoff=None):
+        """
+        Records a failed delivery attempt. The next attempt is delayed
+        exponentially: ``backoff`` seconds after the first failure, twice
+        as much after the second one and so on. Once ``max_attempts``
+        attempts have failed the email is marked as ``DEAD``.
+
+        Args:
+            ``error`` the exception raised while sending.
+            ``max_attempts`` Default value is ``OUTBOX_MAX_ATTEMPTS``.
+            ``backoff`` Default value is ``OUTBOX_BACKOFF``.
+        """
+        max_attempts = max_attempts or OUTBOX_MAX_ATTEMPTS
+        if backoff is None:
+            backoff = OUTBOX_BACKOFF
+        self.attempts += 1
+        self.last_error = unicode(error)[:255]
+        if self.attempts >= max_attempts:
+            self.status = self.DEAD
+        else:
+            self.next_attempt = datetime.datetime.now() + \
+                datetime.timedelta(seconds=backoff * 2 ** (self.attempts - 1))
+        self.save()
+
+
+class ConsumedTokenManager(ChunkedManager):
+    """
+    Custom manager for the ``ConsumedToken`` model, activating accounts
+    from signed tokens (see ``registration.tokens``).
+
+    """
+    def activate_token(self, request, activation_key, callback, **kwargs):
+        """
+        Validate a signed activation token and call ``callback`` in order to
+        activate the corresponding user if valid, like
+        ``RegistrationManager.activate_user`` does for stored profiles.
+
+        The token must have been signed with this site's ``SECRET_KEY``
+        less than ``ACCOUNT_ACTIVATION_DAYS`` days ago, and must not have
+        been used yet: a ``ConsumedToken`` row is created for it in the
+        transaction ``callback`` runs in, and rolled back if activation
+        fails or raises so that the user can retry.
+
+        ``callback`` receives an unsaved ``RegistrationProfile`` carrying
+        the email address and the token as activation key.
+
+        Args:
+            ``request`` activate view request needed just for passing it to
+                ``callback``.
+            ``activation_key`` the signed token.
+            ``callback`` callable doing the activation process.
+            ``kwargs`` extra key arguments for callback.
+        Returns:
+            Two-tuple containing the new user/account instance and ``None`` on
+            success, falsy value and message error on failure.
+        """
+        max_age = settings.ACCOUNT_ACTIVATION_DAYS * 24 * 60 * 60
+        email = tokens.check_token(activation_key, max_age)
+        if email is None:
+            return False, INVALID_KEY_MESSAGE
+        try:
+            # The marker is inserted in the same transaction as the
+            # callback runs in, so that it is rolled back if the callback
+            # fails or raises, and concurrent attempts wait on it.
+            with transaction.commit_on_success(using=self.db):
+                consumed, created = self.get_or_create(
+                    token_hash=sha_constructor(activation_key).hexdigest())
+                if not created:
+                    raise _ActivationFailed((False, INVALID_KEY_MESSAGE))
+                profile = RegistrationProfile(email=email,
+                                              activation_key=activation_key)
+                account, errors = callback(request, profile, **kwargs)
+                if not account:
+                    raise _ActivationFailed((account, errors))
+        except _ActivationFailed, e:
+            return e.result
+        return account, errors
+
+    def expired(self):
+        """
+        Returns the consumed tokens which are too old to be valid anyway,
+        and thus can be deleted.
+        """
+        cutoff = datetime.datetime.now() - \
+            datetime.timedelta(days=settings.ACCOUNT_ACTIVATION_DAYS)
+        return self.filter(consumed_at__lte=cutoff)
+
+
+class ConsumedToken(models.Model):
+    """
+    Marks a signed activation token as used, so that it can't be used
+    twice. Only a hash of the token is stored. Markers older than
+    ``ACCOUNT_ACTIVATION_DAYS`` days are useless, since the tokens they
+    refer to have expired, and are deleted by the ``cleanupregistration``
+    management command.
+
+    """
+    token_hash = models.CharField(_('token hash'), max_length=40,
+                                  unique=True)
+    consumed_at = models.DateTimeField(_('consumed at'), auto_now_add=True,
+                                       db_index=True)
+
+    objects = ConsumedTokenManager()
+
+    class Meta:
+        verbose_name = _('consumed token')
+        verbose_name_plural = _('consumed tokens')
+
+    def __unicode__(self):
+        return self.token_hash
+
@@ -0,0 +1,108 @@
+"""
+A cache of activation keys known to be invalid (unknown, expired or
+already activated), consulted by
+``RegistrationManager.activate_user`` before querying the database, so
+that bots and link scanners replaying stale or made up keys don't cost
+a query each.
+
+The cache is configured by the ``REGISTRATION_NEGATIVE_CACHE`` setting:
+
+* If it isn't defined, a dedicated local-memory cache is used, holding
+  at most ``MAX_ENTRIES`` keys for ``TIMEOUT`` seconds.
+
+* If it is the name of a cache defined in the ``CACHES`` setting, that
+  cache is used, with its own size and timeout settings; keys are
+  prefixed with ``KEY_PREFIX``.
+
+* If it is ``None`` or ``False``, negative caching is disabled.
+
+Keys are removed from the cache whenever a ``RegistrationProfile``
+holding them is saved, or its activation fails. A key whose claim is
+lost to a concurrent activation isn't cached, since that activation may
+still fail.
+
+The default local-memory cache is private to each process: a key made
+valid again by another process, e.g. a profile set back to pending from
+the admin, stays rejected by this one for up to ``TIMEOUT`` seconds.
+Deployments running several processes should name a cache shared by
+all of them.
+
+"""
+from django.conf import settings
+from django.core.cache import get_cache
+from django.test.signals import setting_changed
+
+
+KEY_PREFIX = 'registration.invalid:'
+MAX_ENTRIES = 10000
+TIMEOUT = 60 * 60
+
+# The cache in use: ``None`` until first used, ``False`` if disabled.
+_cache = None
+
+
+def get_negative_cache():
+    """
+    Returns the configured cache, or ``None`` if negative caching is
+    disabled.
+    """
+    global _cache
+    if _cache is None:
+        alias = getattr(settings, 'REGISTRATION_NEGATIVE_CACHE', '')
+        if alias:
+            _cache = get_cache(alias)
+        elif alias == '':
+            _cache = get_cache(
+                'django.core.cache.backends.locmem.LocMemCache',
+                LOCATION='registration-negative-cache', TIMEOUT=TIMEOUT,
+                OPTIONS={'MAX_ENTRIES': MAX_ENTRIES})
+        else:
+            _cache = False
+    return _cache or None
+
+
+def is_invalid(activation_key):
+    """
+    Returns ``True`` if ``activation_key`` is known to be invalid.
+    """
+    cache = get_negative_cache()
+    return cache is not None and \
+        cache.get(KEY_PREFIX + activation_key) is not None
+
+
+def mark_invalid(activation_key):
+    """
+    Records ``activation_key`` as invalid.
+    """
+    cache = get_negative_cache()
+    if cache is not None:
+        cache.set(KEY_PREFIX + activation_key, 1)
+
+
+def discard(activation_key):
+    """
+    Forgets about ``activation_key``, which may have become valid.
+    """
+    cache = get_negative_cache()
+    if cache is not None:
+        cache.delete(KEY_PREFIX + activation_key)
+
+
+def discard_profile(sender, instance, **kwargs):
+    """
+    ``post_save`` receiver discarding the activation key of the saved
+    ``RegistrationProfile``.
+    """
+    discard(instance.activation_key)
+
+
+def reset(**kwargs):
+    """
+    Drops the cache in use, so that it is looked up again from settings
+    when next needed. Accepts any keyword arguments so that it can be
+    used as a signal receiver.
+    """
+    global _cache
+    _cache = None
+
+setting_changed.connect(reset)
@@ -0,0 +1,114 @@
+"""
+Token bucket rate limiting for the registration and activation views.
+
+Limits are configured by the ``REGISTRATION_RATE_LIMITS`` setting, a
+dictionary mapping bucket names to two-tuples ``(capacity, period)``:
+each client gets ``capacity`` tokens, refilled continuously at
+``capacity`` tokens per ``period`` seconds, and every request consumes
+one. The buckets are:
+
+``register_ip``
+    Registration form submissions per client IP address.
+
+``register_email``
+    Registration form submissions per (lower-cased) email address.
+
+``activate_ip``
+    Activation form submissions per client IP address.
+
+Buckets missing from the setting are not limited; by default nothing
+is. Bucket states are kept in the cache named by the
+``REGISTRATION_RATE_LIMIT_CACHE`` setting (``'default'`` by default),
+so checking a limit never touches the database. Updates are not atomic:
+under heavy concurrency a client may get slightly more than its share.
+
+The client IP address is taken from ``REMOTE_ADDR``; behind a reverse
+proxy, make sure it holds the real client address.
+
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.utils.hashcompat import md5_constructor
+
+
+KEY_PREFIX = 'registration.ratelimit:'
+
+
+class TokenBucket(object):
+    """
+    A token bucket holding up to ``capacity`` tokens, refilled at
+    ``capacity`` tokens per ``period`` seconds, whose state is stored in
+    ``cache`` for every client key.
+
+    """
+    def __init__(self, name, capacity, period, cache):
+        self.name = name
+        self.capacity = float(capacity)
+        self.period = float(period)
+        self.cache = cache
+
+    def consume(self, key, tokens=1, now=None):
+        """
+        Takes ``tokens`` tokens from the bucket of client ``key``. Returns
+        ``False``, taking nothing, if there aren't enough.
+        """
+        if now is None:
+            now = time.time()
+        # Keys are hashed as they may contain characters some cache
+        # backends don't accept.
+        cache_key = '%s%s:%s' % (KEY_PREFIX, self.name,
+                                 md5_constructor(key).hexdigest())
+        state = self.cache.get(cache_key)
+        if state is None:
+            level = self.capacity
+        else:
+            level, stamp = state
+            level = min(self.capacity, level + (now - stamp) *
+                        self.capacity / self.period)
+        allowed = level >= tokens
+        if allowed:
+            level -= tokens
+        # An untouched bucket is full again after ``period`` seconds.
+        self.cache.set(cache_key, (level, now), int(self.period) + 1)
+        return allowed
+
+
+def allow(name, key):
+    """
+    Consumes a token from the bucket ``name`` for client ``key``, returning
+    whether the request is allowed. Always ``True`` if the bucket isn't
+    configured.
+    """
+    limits = getattr(settings, 'REGISTRATION_RATE_LIMITS', None)
+    if not limits or name not in limits:
+        return True
+    capacity, period = limits[name]
+    cache = get_cache(getattr(settings, 'REGISTRATION_RATE_LIMIT_CACHE',
+                              'default'))
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return TokenBucket(name, capacity, period, cache).consume(key)
+
+
+def registration_allowed(request):
+    """
+    Checks the ``register_ip`` and ``register_email`` buckets for a
+    registration form submission; other requests are always allowed.
+    """
+    if request.method != 'POST':
+        return True
+    if not allow('register_ip', request.META.get('REMOTE_ADDR', '')):
+        return False
+    email = request.POST.get('email', '').strip().lower()
+    return not email or allow('register_email', email)
+
+
+def activation_allowed(request):
+    """
+    Checks the ``activate_ip`` bucket for an activation form submission;
+    other requests are always allowed.
+    """
+    return request.method != 'POST' or \
+        allow('activate_ip', request.META.get('REMOTE_ADDR', ''))
@@ -0,0 +1,77 @@
+"""
+Database schema which Django models can't describe: the unique index
+keeping the activation keys of pending profiles distinct.
+
+On PostgreSQL and SQLite the index is partial, restricted to the pending
+rows; other databases get a unique ``(activation_key, status)`` index.
+South installs get it from migration ``0014_unique_pending_key``, and
+``syncdb`` installs, test databases included, from the ``post_syncdb``
+handler of ``registration.management``.
+
+Also holds ``create_indexes``, which the South migrations use to build
+their indexes.
+
+"""
+PENDING_KEY_INDEX = 'registration_registrationprofile_pending_key_uniq'
+# ``connection.vendor`` of the databases supporting partial indexes.
+PARTIAL_INDEX_VENDORS = ('postgresql', 'sqlite')
+
+
+def index_exists(connection, table, name):
+    """
+    Returns whether the index ``name`` exists on ``table``. Only
+    PostgreSQL, SQLite and MySQL are supported; ``None`` is returned on
+    other databases.
+    """
+    if connection.vendor == 'postgresql':
+        sql = ('SELECT 1 FROM pg_indexes WHERE tablename = %s AND '
+               'indexname = %s')
+    elif connection.vendor == 'sqlite':
+        sql = ("SELECT 1 FROM sqlite_master WHERE type = 'index' AND "
+               "tbl_name = %s AND name = %s")
+    elif connection.vendor == 'mysql':
+        sql = ('SELECT 1 FROM information_schema.statistics WHERE '
+               'table_schema = DATABASE() AND table_name = %s AND '
+               'index_name = %s')
+    else:
+        return None
+    cursor = connection.cursor()
+    cursor.execute(sql, [table, name])
+    return cursor.fetchone() is not None
+
+
+def pending_key_index_sql(connection, table):
+    """
+    Returns the statement creating the unique index on the activation keys
+    of the pending profiles of ``table``.
+    """
+    qn = connection.ops.quote_name
+    if connection.vendor in PARTIAL_INDEX_VENDORS:
+        return 'CREATE UNIQUE INDEX %s ON %s (%s) WHERE %s = 0' % (
+            qn(PENDING_KEY_INDEX), qn(table), qn('activation_key'),
+            qn('status'))
+    return 'CREATE UNIQUE INDEX %s ON %s (%s, %s)' % (
+        qn(PENDING_KEY_INDEX), qn(table), qn('activation_key'),
+        qn('status'))
+
+
+def create_indexes(db, statements):
+    """
+    Executes the ``CREATE [UNIQUE] INDEX`` ``statements`` of a South
+    migration, ``db`` being South's ``south.db.db``.
+
+    On PostgreSQL the indexes are built ``CONCURRENTLY``, so that existing
+    installs with large tables don't hold a write lock on them while the
+    indexes are being built. ``CONCURRENTLY`` can't run inside a
+    transaction block, so the migration transaction is committed first and
+    a new one started afterwards; since South can't do that during a dry
+    run, migrations calling this set ``no_dry_run``.
+    """
+    if db.backend_name != 'postgres':
+        for sql in statements:
+            db.execute(sql)
+        return
+    db.commit_transaction()
+    for sql in statements:
+        db.execute(sql.replace(' INDEX ', ' INDEX CONCURRENTLY ', 1))
+    db.start_transaction()
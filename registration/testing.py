@@ -0,0 +1,175 @@
+"""
+Query count budgets for the registration code paths, and a test harness
+enforcing them.
+
+``QUERY_BUDGETS`` maps each code path to the maximum number of queries
+it may run in the scenario exercised by ``RegistrationQueryBudgetTests``.
+``assertQueryBudget`` fails when a block runs more queries than its
+budget, listing the SQL of every query it ran.
+
+Projects plugging their own forms and ``ACTIVATION_METHOD`` can run the
+same checks against their configuration::
+
+    from django.test import TestCase
+    from registration.testing import QUERY_BUDGETS
+    from registration.testing import RegistrationQueryBudgetTests
+
+    class QueryBudgetTests(RegistrationQueryBudgetTests, TestCase):
+        registration_data = {'email': 'alice@example.com'}
+        activation_data = {'username': 'alice', 'password1': 'secret',
+                           'password2': 'secret'}
+        # Our activation callback creates a user and its profile.
+        query_budgets = dict(QUERY_BUDGETS, activate_view=5)
+
+"""
+import datetime
+
+from django.contrib import admin
+from django.contrib.messages.storage import default_storage
+from django.contrib.sites.models import Site
+from django.core.signals import request_started
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.db import reset_queries
+from django.http import HttpRequest
+
+from registration.admin import RegistrationAdmin
+from registration.models import RegistrationProfile
+
+
+QUERY_BUDGETS = {
+    # Site lookup and profile insert, plus whatever the form validation
+    # runs.
+    'register_view': 2,
+    # Pending profile fetch and claim update, plus whatever the callback
+    # runs.
+    'activate_view': 2,
+    'create_profile': 1,
+    # Five expired profiles deleted two at a time: per chunk, loading the
+    # primary keys, deleting their outbox emails and deleting them; then
+    # finding there's nothing left.
+    'delete_expired': 10,
+    'delete_activated': 10,
+    # Loading the pending profiles in one chunk, recording when their
+    # emails were sent and finding there's nothing left (the Site lookup
+    # is cached).
+    'resend_activation_email': 3,
+}
+
+
+class _QueryBudgetContext(object):
+
+    def __init__(self, test_case, name, budget, connection):
+        self.test_case = test_case
+        self.name = name
+        self.budget = budget
+        self.connection = connection
+
+    def __enter__(self):
+        self.old_debug_cursor = self.connection.use_debug_cursor
+        self.connection.use_debug_cursor = True
+        self.start = len(self.connection.queries)
+        # Requests made with the test client would empty the query log.
+        request_started.disconnect(reset_queries)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.use_debug_cursor = self.old_debug_cursor
+        request_started.connect(reset_queries)
+        if exc_type is not None:
+            return
+        queries = self.connection.queries[self.start:]
+        if len(queries) > self.budget:
+            self.test_case.fail("%s ran %d queries, over its budget of %d:\n%s"
+                                % (self.name, len(queries), self.budget,
+                                   '\n'.join('%d. %s' % (i, query['sql'])
+                                             for i, query in
+                                             enumerate(queries, 1))))
+
+
+class QueryBudgetMixin(object):
+    """
+    ``TestCase`` mixin providing ``assertQueryBudget``, which checks the
+    code paths against the budgets in ``query_budgets``.
+    """
+    query_budgets = QUERY_BUDGETS
+
+    def assertQueryBudget(self, name, using='default'):
+        """
+        Returns a context manager failing the test if its block runs more
+        queries on database ``using`` than ``query_budgets[name]``.
+        """
+        return _QueryBudgetContext(self, name, self.query_budgets[name],
+                                   connections[using])
+
+
+class RegistrationQueryBudgetTests(QueryBudgetMixin):
+    """
+    ``TestCase`` mixin checking the query budgets of the registration
+    views, ``create_profile``, the purges and the admin actions, using the
+    project's backend, forms and activation method.
+
+    The views are requested through the URL patterns named
+    ``registration_register`` and ``registration_activate``, posting
+    ``registration_data`` and ``activation_data`` respectively.
+    """
+    registration_data = {'email': 'alice@example.com'}
+    activation_data = {}
+
+    def _create_profiles(self, count, **update):
+        site = Site.objects.get_current()
+        for i in range(count):
+            RegistrationProfile.objects.create_profile(
+                site, 'user%d@example.com' % i, send_email=False)
+        RegistrationProfile.objects.update(**update)
+
+    def _admin_request(self):
+        request = HttpRequest()
+        request.META = {'SERVER_NAME': 'testserver', 'SERVER_PORT': '80'}
+        request.session = {}
+        request._messages = default_storage(request)
+        return request
+
+    def test_register_view_budget(self):
+        Site.objects.clear_cache()
+        with self.assertQueryBudget('register_view'):
+            response = self.client.post(reverse('registration_register'),
+                                        data=self.registration_data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(RegistrationProfile.objects.count(), 1)
+
+    def test_activate_view_budget(self):
+        profile = RegistrationProfile.objects.create_profile(
+            Site.objects.get_current(), self.registration_data['email'],
+            send_email=False)
+        with self.assertQueryBudget('activate_view'):
+            self.client.post(reverse('registration_activate', kwargs={
+                'activation_key': profile.activation_key}),
+                data=self.activation_data)
+        self.assertEqual(RegistrationProfile.objects.get().status,
+                         RegistrationProfile.ACTIVATED)
+
+    def test_create_profile_budget(self):
+        site = Site.objects.get_current()
+        with self.assertQueryBudget('create_profile'):
+            RegistrationProfile.objects.create_profile(
+                site, 'alice@example.com', send_email=False)
+
+    def test_delete_expired_budget(self):
+        self._create_profiles(5, expires_at=datetime.datetime.now())
+        with self.assertQueryBudget('delete_expired'):
+            RegistrationProfile.objects.delete_expired(chunk_size=2)
+
+    def test_delete_activated_budget(self):
+        self._create_profiles(5, status=RegistrationProfile.ACTIVATED)
+        with self.assertQueryBudget('delete_activated'):
+            RegistrationProfile.objects.delete_activated(chunk_size=2)
+
+    def test_resend_activation_email_budget(self):
+        self._create_profiles(5)
+        model_admin = RegistrationAdmin(RegistrationProfile, admin.site)
+        request = self._admin_request()
+        Site.objects.get_current()
+        with self.assertQueryBudget('resend_activation_email'):
+            model_admin.resend_activation_email(
+                request, model_admin.queryset(request))
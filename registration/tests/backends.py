@@ -1,22 +1,36 @@
 import datetime
+import time
+from StringIO import StringIO
 
 from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.models import User
+from django.contrib.messages.storage import default_storage
 from django.contrib.sessions.middleware import SessionMiddleware
 from django.contrib.sites.models import Site
 from django.core import mail
+from django.core.cache import cache
+from django.core import management
 from django.core.exceptions import ImproperlyConfigured
 from django.core.handlers.wsgi import WSGIRequest
+from django.http import QueryDict
 from django.test import Client
 from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test.signals import setting_changed
 
 from registration import forms
+from registration import models
+from registration import ratelimit
 from registration import signals
+from registration import tokens
 from registration.admin import RegistrationAdmin
+from registration.admin import StateListFilter
 from registration.backends import get_backend
 from registration.backends.default import DefaultBackend
+from registration.backends.signed import SignedTokenBackend
 from registration.backends.simple import SimpleBackend
+from registration.models import ConsumedToken
 from registration.models import RegistrationProfile
 
 
@@ -104,6 +118,374 @@ class BackendRetrievalTests(TestCase):
         self.assertRaises(ImproperlyConfigured, get_backend,
                           'registration.backends.default.NonexistentBackend')
 
+    def test_get_backend_cached(self):
+        """
+        Verify that ``get_backend()`` reuses the resolved backend, and
+        that extra keyword arguments still reach a fresh instance.
+
+        """
+        path = 'registration.backends.default.DefaultBackend'
+        self.failUnless(get_backend(path) is get_backend(path))
+
+        backend = get_backend(path, activation_key='foo')
+        self.failIf(backend is get_backend(path))
+        self.assertEqual(backend.activation_key, 'foo')
+
+    def test_get_backend_cache_cleared(self):
+        """
+        Verify that the ``get_backend()`` cache is cleared when settings
+        change.
+
+        """
+        path = 'registration.backends.default.DefaultBackend'
+        backend = get_backend(path)
+        setting_changed.send(sender=self.__class__, setting='REGISTRATION_FORM',
+                             value=None)
+        self.failIf(get_backend(path) is backend)
+
+
+class RegistrationAdminTests(TestCase):
+    """
+    Test the admin actions of ``RegistrationAdmin``.
+
+    """
+    def setUp(self):
+        self.old_activation = getattr(settings, 'ACCOUNT_ACTIVATION_DAYS', None)
+        settings.ACCOUNT_ACTIVATION_DAYS = 7
+        self.admin = RegistrationAdmin(RegistrationProfile, admin.site)
+        self.request = _mock_request()
+        self.request._messages = default_storage(self.request)
+
+    def tearDown(self):
+        settings.ACCOUNT_ACTIVATION_DAYS = self.old_activation
+
+    def test_bulk_resend_activation_email(self):
+        """
+        Re-sending activation emails only sends them to pending profiles,
+        in batches, records when they were sent and reports how many were
+        sent.
+
+        """
+        site = Site.objects.get_current()
+        for i in range(5):
+            RegistrationProfile.objects.create_profile(
+                site, 'user%d@example.com' % i, send_email=False)
+        RegistrationProfile.objects.filter(email='user0@example.com').update(
+            status=RegistrationProfile.ACTIVATED)
+        RegistrationProfile.objects.filter(email='user1@example.com').update(
+            expires_at=datetime.datetime.now() - datetime.timedelta(days=1))
+
+        self.admin.resend_activation_email(self.request,
+                                           RegistrationProfile.objects.all())
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['user2@example.com', 'user3@example.com',
+                          'user4@example.com'])
+        self.assertEqual([unicode(message) for message in
+                          self.request._messages],
+                         [u'3 activation email(s) sent to the pending '
+                          u'profiles selected.'])
+        self.assertEqual(sorted(RegistrationProfile.objects.filter(
+            last_sent_at__isnull=False).values_list('email', flat=True)),
+                         ['user2@example.com', 'user3@example.com',
+                          'user4@example.com'])
+
+    def test_changelist_state(self):
+        """
+        The changelist queryset is annotated with the activation state of
+        every profile, which the admin displays and orders by.
+
+        """
+        site = Site.objects.get_current()
+        for i in range(3):
+            RegistrationProfile.objects.create_profile(
+                site, 'user%d@example.com' % i, send_email=False)
+        RegistrationProfile.objects.filter(email='user0@example.com').update(
+            status=RegistrationProfile.ACTIVATED)
+        RegistrationProfile.objects.filter(email='user1@example.com').update(
+            expires_at=datetime.datetime.now() - datetime.timedelta(days=1))
+
+        queryset = self.admin.queryset(self.request).order_by('state')
+        self.assertEqual([(profile.email, self.admin.state(profile))
+                          for profile in queryset],
+                         [('user0@example.com', 'activated'),
+                          ('user1@example.com', 'expired'),
+                          ('user2@example.com', 'pending')])
+
+    def test_revoke(self):
+        """
+        The ``revoke`` action revokes the activation keys of the selected
+        pending profiles, which can't be activated anymore.
+
+        """
+        site = Site.objects.get_current()
+        for i in range(3):
+            RegistrationProfile.objects.create_profile(
+                site, 'user%d@example.com' % i, send_email=False)
+        RegistrationProfile.objects.filter(email='user0@example.com').update(
+            status=RegistrationProfile.ACTIVATED)
+
+        self.admin.revoke(self.request, self.admin.queryset(self.request))
+        self.assertEqual([unicode(message) for message in
+                          self.request._messages],
+                         [u'2 activation key(s) revoked.'])
+        self.assertEqual(
+            sorted(RegistrationProfile.objects.revoked().values_list(
+                'email', flat=True)),
+            ['user1@example.com', 'user2@example.com'])
+        profile = RegistrationProfile.objects.get(email='user1@example.com')
+        self.failUnless(profile.activation_key_invalid())
+        self.assertEqual(RegistrationProfile.objects.with_state().get(
+            pk=profile.pk).state, 'revoked')
+        self.assertEqual(RegistrationProfile.objects.activate_user(
+            self.request, profile.activation_key, lambda request, profile:
+            (True, None))[0], False)
+
+    def test_state_list_filter(self):
+        """
+        ``StateListFilter`` filters the changelist by activation state.
+
+        """
+        site = Site.objects.get_current()
+        for i in range(2):
+            RegistrationProfile.objects.create_profile(
+                site, 'user%d@example.com' % i, send_email=False)
+        RegistrationProfile.objects.filter(email='user0@example.com').update(
+            expires_at=datetime.datetime.now() - datetime.timedelta(days=1))
+
+        for state, email in (('expired', 'user0@example.com'),
+                             ('pending', 'user1@example.com')):
+            list_filter = StateListFilter(self.request, {'state': state},
+                                          RegistrationProfile, self.admin)
+            queryset = list_filter.queryset(self.request,
+                                            self.admin.queryset(self.request))
+            self.assertEqual([profile.email for profile in queryset], [email])
+
+    def test_changelist_estimated_count(self):
+        """
+        The unfiltered changelist of a big table is counted from the
+        database statistics; filtered ones and small tables are counted
+        exactly.
+
+        """
+        RegistrationProfile.objects.create_profile(
+            Site.objects.get_current(), 'alice@example.com', send_email=False)
+        old_estimate = models.estimated_row_count
+        try:
+            models.estimated_row_count = lambda model, using: 10 ** 6
+            queryset = self.admin.queryset(self.request)
+            self.assertEqual(queryset.count(), 10 ** 6)
+            self.assertEqual(queryset.order_by('state').count(), 10 ** 6)
+            self.assertEqual(queryset.pending().count(), 1)
+            self.assertEqual(RegistrationProfile.objects.count(), 1)
+
+            models.estimated_row_count = lambda model, using: 10
+            self.assertEqual(queryset.count(), 1)
+        finally:
+            models.estimated_row_count = old_estimate
+        self.assertEqual(self.admin.queryset(self.request).count(), 1)
+
+
+class RateLimitTests(TestCase):
+    """
+    Test the rate limiting of registrations and activations.
+
+    """
+    backend = DefaultBackend()
+
+    def setUp(self):
+        self.old_limits = getattr(settings, 'REGISTRATION_RATE_LIMITS', None)
+        settings.REGISTRATION_RATE_LIMITS = {'register_ip': (2, 60),
+                                             'register_email': (1, 60),
+                                             'activate_ip': (1, 60)}
+        cache.clear()
+
+    def tearDown(self):
+        settings.REGISTRATION_RATE_LIMITS = self.old_limits
+
+    def _post_request(self, **data):
+        request = _mock_request()
+        request.method = 'POST'
+        request.POST = QueryDict('', mutable=True)
+        request.POST.update(data)
+        return request
+
+    def test_token_bucket(self):
+        """
+        A bucket allows ``capacity`` requests at once, then refills over
+        time.
+
+        """
+        bucket = ratelimit.TokenBucket('test', 2, 10, cache)
+        self.failUnless(bucket.consume('key', now=100))
+        self.failUnless(bucket.consume('key', now=100))
+        self.failIf(bucket.consume('key', now=100))
+        self.failUnless(bucket.consume('other', now=100))
+        self.failIf(bucket.consume('key', now=104))
+        self.failUnless(bucket.consume('key', now=105))
+
+    def test_registration_allowed(self):
+        """
+        Registration submissions are limited per IP address and per
+        email address; other requests aren't.
+
+        """
+        request = self._post_request(email='alice@example.com')
+        self.failUnless(self.backend.registration_rate_allowed(request))
+        request = self._post_request(email='Alice@example.com')
+        self.failIf(self.backend.registration_rate_allowed(request))
+        request = self._post_request(email='bob@example.com')
+        self.failIf(self.backend.registration_rate_allowed(request))
+        self.failUnless(
+            self.backend.registration_rate_allowed(_mock_request()))
+        self.failUnless(self.backend.registration_allowed(request))
+
+    def test_activation_allowed(self):
+        """
+        Activation submissions are limited per IP address.
+
+        """
+        self.failUnless(self.backend.activation_allowed(self._post_request()))
+        self.failIf(self.backend.activation_allowed(self._post_request()))
+        self.failUnless(self.backend.activation_allowed(_mock_request()))
+
+    def test_disabled(self):
+        """
+        Nothing is limited by default.
+
+        """
+        settings.REGISTRATION_RATE_LIMITS = None
+        for i in range(3):
+            self.failUnless(self.backend.registration_rate_allowed(
+                self._post_request(email='alice@example.com')))
+
+
+class SignedTokenBackendTests(TestCase):
+    """
+    Test the signed token registration backend.
+
+    """
+    def setUp(self):
+        self.old_activation = getattr(settings, 'ACCOUNT_ACTIVATION_DAYS', None)
+        settings.ACCOUNT_ACTIVATION_DAYS = 7
+        self.activated = []
+        self.backend = SignedTokenBackend(activation_method=self.activate)
+
+    def tearDown(self):
+        settings.ACCOUNT_ACTIVATION_DAYS = self.old_activation
+
+    def activate(self, request, profile, succeed=True, **kwargs):
+        if not succeed:
+            return False, u'Failed'
+        self.activated.append(profile.email)
+        return profile.email, None
+
+    def test_registration(self):
+        """
+        Registering sends an activation email carrying a signed token, and
+        stores nothing.
+
+        """
+        profile = self.backend.register(_mock_request(),
+                                        email='alice@example.com')
+        self.assertEqual(RegistrationProfile.objects.count(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.failUnless(profile.activation_key in mail.outbox[0].body)
+        self.assertEqual(tokens.check_token(profile.activation_key),
+                         'alice@example.com')
+
+    def test_activation(self):
+        """
+        A token can be used only once.
+
+        """
+        token = tokens.make_token('alice@example.com')
+        self.assertEqual(self.backend.activate(_mock_request(),
+                                               activation_key=token),
+                         ('alice@example.com', None))
+        self.assertEqual(self.activated, ['alice@example.com'])
+        account, errors = self.backend.activate(_mock_request(),
+                                                activation_key=token)
+        self.failIf(account)
+        self.assertEqual(self.activated, ['alice@example.com'])
+
+    def test_invalid_tokens(self):
+        """
+        Expired, tampered with and malformed tokens are rejected.
+
+        """
+        expired = tokens.make_token('alice@example.com', time.time() -
+            (settings.ACCOUNT_ACTIVATION_DAYS * 24 * 60 * 60 + 1))
+        token = tokens.make_token('alice@example.com')
+        tampered = tokens.make_token('bob@example.com').split(':')[0] + \
+            token[token.index(':'):]
+        for token in (expired, tampered, 'foo', 'a:b:c', u'\xe9:0:0'):
+            account, errors = self.backend.activate(_mock_request(),
+                                                    activation_key=token)
+            self.failIf(account)
+        self.assertEqual(self.activated, [])
+
+    def test_cleanup(self):
+        """
+        Consumed token markers are deleted once the tokens they refer to
+        have expired.
+
+        """
+        ConsumedToken.objects.create(token_hash='a' * 40)
+        ConsumedToken.objects.create(token_hash='b' * 40)
+        ConsumedToken.objects.filter(token_hash='a' * 40).update(
+            consumed_at=datetime.datetime.now() - datetime.timedelta(
+                days=settings.ACCOUNT_ACTIVATION_DAYS + 1))
+        management.call_command('cleanupregistration', stdout=StringIO())
+        self.assertEqual(ConsumedToken.objects.get().token_hash, 'b' * 40)
+
+
+class SignedTokenTransactionTests(TransactionTestCase):
+    """
+    Test that consuming a signed token is rolled back with the activation,
+    which ``TestCase`` can't show.
+
+    """
+    def setUp(self):
+        self.old_activation = getattr(settings, 'ACCOUNT_ACTIVATION_DAYS', None)
+        settings.ACCOUNT_ACTIVATION_DAYS = 7
+
+    def tearDown(self):
+        settings.ACCOUNT_ACTIVATION_DAYS = self.old_activation
+
+    def activate(self, request, profile, succeed=True):
+        if not succeed:
+            return False, u'Failed'
+        return profile.email, None
+
+    def test_activation_failure(self):
+        """
+        A failed activation doesn't consume the token.
+
+        """
+        token = tokens.make_token('alice@example.com')
+        self.assertEqual(ConsumedToken.objects.activate_token(
+            None, token, self.activate, succeed=False), (False, u'Failed'))
+        self.assertEqual(ConsumedToken.objects.count(), 0)
+        self.assertEqual(ConsumedToken.objects.activate_token(
+            None, token, self.activate), ('alice@example.com', None))
+
+    def test_callback_exception(self):
+        """
+        A callback raising an exception doesn't consume the token.
+
+        """
+        def fail(request, profile):
+            User.objects.create_user('alice', profile.email, 'secret')
+            raise ValueError
+        token = tokens.make_token('alice@example.com')
+        self.assertRaises(ValueError, ConsumedToken.objects.activate_token,
+                          None, token, fail)
+        self.assertEqual(ConsumedToken.objects.count(), 0)
+        self.assertEqual(User.objects.count(), 0)
+        self.assertEqual(ConsumedToken.objects.activate_token(
+            None, token, self.activate), ('alice@example.com', None))
+        self.assertEqual(ConsumedToken.objects.count(), 1)
+
 
 class DefaultRegistrationBackendTests(TestCase):
     """
@@ -204,10 +586,10 @@ class DefaultRegistrationBackendTests(TestCase):
         self.assertEqual(activated.username, valid_user.username)
         self.failUnless(activated.is_active)
 
-        # Fetch the profile again to verify its activation key has
-        # been reset.
+        # Fetch the profile again to verify it has been marked as
+        # activated.
         valid_profile = RegistrationProfile.objects.get(user=valid_user)
-        self.assertEqual(valid_profile.activation_key,
+        self.assertEqual(valid_profile.status,
                          RegistrationProfile.ACTIVATED)
 
     def test_invalid_activation(self):
@@ -347,7 +729,7 @@ class DefaultRegistrationBackendTests(TestCase):
                                             RegistrationProfile.objects.all())
         self.assertEqual(len(mail.outbox), 2) # One on registering, one more on the resend.
         
-        RegistrationProfile.objects.filter(user=alice).update(activation_key=RegistrationProfile.ACTIVATED)
+        RegistrationProfile.objects.filter(user=alice).update(status=RegistrationProfile.ACTIVATED)
         admin_class.resend_activation_email(_mock_request(),
                                             RegistrationProfile.objects.all())
         self.assertEqual(len(mail.outbox), 2) # No additional email because the account has activated.
@@ -371,7 +753,7 @@ class DefaultRegistrationBackendTests(TestCase):
                                             RegistrationProfile.objects.all())
         self.assertEqual(len(mail.outbox), 2) # One on registering, one more on the resend.
         
-        RegistrationProfile.objects.filter(user=alice).update(activation_key=RegistrationProfile.ACTIVATED)
+        RegistrationProfile.objects.filter(user=alice).update(status=RegistrationProfile.ACTIVATED)
         admin_class.resend_activation_email(_mock_request(),
                                             RegistrationProfile.objects.all())
         self.assertEqual(len(mail.outbox), 2) # No additional email because the account has activated.
@@ -1,7 +1,17 @@
 from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.core import management
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import CommandError
+from django.db.models import signals
+from django.dispatch.dispatcher import _make_id
 from django.test import TestCase
+from django.test.utils import override_settings
 
+from registration import bloom
 from registration import forms
+from registration.management.commands import rebuildbloomfilters
 
 
 class RegistrationFormTests(TestCase):
@@ -117,3 +127,219 @@ class RegistrationFormTests(TestCase):
         base_data['email'] = 'foo@example.com'
         form = forms.RegistrationFormNoFreeEmail(data=base_data)
         self.failUnless(form.is_valid())
+
+
+class UniquenessCheckerTests(TestCase):
+    """
+    Test ``UniquenessChecker`` and the forms using it.
+
+    """
+    def setUp(self):
+        User.objects.create_user('alice', 'alice@example.com', 'secret')
+
+    def test_is_taken(self):
+        """
+        ``is_taken()`` normalises the value and runs a single
+        case-insensitive ``exists()`` query on the field, finding rows of
+        any case.
+
+        """
+        checker = forms.UniquenessChecker('auth.User', 'email')
+        with self.assertNumQueries(1):
+            self.failUnless(checker.is_taken(' Alice@Example.com'))
+        self.failIf(checker.is_taken('bob@example.com'))
+        User.objects.create_user('Bob', 'Bob@Example.com', 'secret')
+        self.failUnless(checker.is_taken('bob@example.com'))
+        self.failUnless(forms.UniquenessChecker(
+            'auth.User', 'username', normalize=forms.normalize_username
+            ).is_taken('bob'))
+
+    def test_cache(self):
+        """
+        Results are cached when a cache is given, until forgotten.
+
+        """
+        checker = forms.UniquenessChecker(User, 'username', cache='default')
+        checker.forget('bob')
+        self.failIf(checker.is_taken('bob'))
+        User.objects.create_user('bob', 'bob@example.com', 'secret')
+        with self.assertNumQueries(0):
+            self.failIf(checker.is_taken('Bob'))
+        checker.forget('bob')
+        self.failUnless(checker.is_taken('bob'))
+        checker.forget('bob')
+
+    def test_forms(self):
+        """
+        ``UniqueEmailRegistrationForm`` and ``UniqueUsernameActivationForm``
+        reject the values already taken, whatever their case, and normalise
+        the others; usernames keep their case.
+
+        """
+        form = forms.UniqueEmailRegistrationForm(
+            data={'email': 'ALICE@example.com'})
+        self.failIf(form.is_valid())
+        self.assertEqual(form.errors['email'],
+                         [u"This email address is already in use. Please "
+                          u"supply a different email address."])
+        form = forms.UniqueEmailRegistrationForm(
+            data={'email': 'Bob@example.com'})
+        self.failUnless(form.is_valid())
+        self.assertEqual(form.cleaned_data['email'], 'bob@example.com')
+
+        form = forms.UniqueUsernameActivationForm(
+            data={'username': 'Alice', 'password1': 'foo', 'password2': 'foo'})
+        self.failIf(form.is_valid())
+        self.assertEqual(form.errors['username'],
+                         [u"A user with that username already exists."])
+        form = forms.UniqueUsernameActivationForm(
+            data={'username': 'Bob', 'password1': 'foo', 'password2': 'bar'})
+        self.failIf(form.is_valid())
+        self.assertEqual(form.errors['__all__'],
+                         [u"The two password fields didn't match."])
+        form = forms.UniqueUsernameActivationForm(
+            data={'username': 'Bob', 'password1': 'foo', 'password2': 'foo'})
+        self.failUnless(form.is_valid())
+        self.assertEqual(form.cleaned_data['username'], 'Bob')
+
+
+class BloomFilterTests(TestCase):
+    """
+    Test the Bloom filters consulted by ``UniquenessChecker``.
+
+    """
+    options = {'capacity': 1000, 'cache': 'default'}
+
+    def setUp(self):
+        User.objects.create_user('alice', 'Alice@Example.com', 'secret')
+        self.checker = forms.UniquenessChecker('auth.User', 'email')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_filter(self):
+        """
+        A filter holds the values added, and reports the others free with
+        about the requested false positive rate.
+
+        """
+        bloom_filter = bloom.BloomFilter(1000, error_rate=0.01)
+        self.assertEqual(bloom_filter.hashes, 7)
+        self.assertEqual(len(bloom_filter.bits), 1199)
+        for i in range(1000):
+            bloom_filter.add('user%d@example.com' % i)
+        self.failUnless('user999@example.com' in bloom_filter)
+        false_positives = sum(1 for i in range(1000, 11000)
+                              if 'user%d@example.com' % i in bloom_filter)
+        self.failUnless(false_positives < 200, false_positives)
+        self.assertEqual(len(bloom.BloomFilter(1000, max_bytes=100).bits),
+                         100)
+
+    def _rebuild(self):
+        rebuildbloomfilters.Command().handle(verbosity=0)
+
+    def test_free_values_skip_queries(self):
+        """
+        Hints report values missing from the filter free without querying
+        the database; values saved meanwhile are added.
+
+        """
+        with override_settings(REGISTRATION_BLOOM_FILTER=self.options):
+            self._rebuild()
+            bloom.reset()
+            self.failUnless(self.checker.might_be_taken('alice@example.com'))
+            with self.assertNumQueries(0):
+                self.failIf(self.checker.might_be_taken('bob@example.com'))
+            User.objects.create_user('bob', 'bob@example.com', 'secret')
+            self.failUnless(self.checker.might_be_taken('bob@example.com'))
+
+    def test_validation_queries(self):
+        """
+        ``is_taken`` looks up the values the filter reports free, since
+        values written without saving an instance are missing from it.
+
+        """
+        with override_settings(REGISTRATION_BLOOM_FILTER=self.options):
+            self._rebuild()
+            User.objects.filter(username='alice').update(
+                email='bob@example.com')
+            self.failIf(self.checker.might_be_taken('bob@example.com'))
+            with self.assertNumQueries(1):
+                self.failUnless(self.checker.is_taken('bob@example.com'))
+
+    def test_filtered_models_receivers(self):
+        """
+        Only saving instances of the filtered models adds values to the
+        filters.
+
+        """
+        def receivers(model):
+            return signals.post_save._live_receivers(_make_id(model))
+        self.failIf(bloom.record_saved in receivers(User))
+        with override_settings(REGISTRATION_BLOOM_FILTER=self.options):
+            self.failUnless(bloom.record_saved in receivers(User))
+            self.failIf(bloom.record_saved in receivers(Site))
+        self.failIf(bloom.record_saved in receivers(User))
+
+    def test_no_filter_built_on_requests(self):
+        """
+        Until the management command builds a filter, every value is looked
+        up in the database.
+
+        """
+        with override_settings(REGISTRATION_BLOOM_FILTER=self.options):
+            with self.assertNumQueries(1):
+                self.failIf(self.checker.might_be_taken('bob@example.com'))
+            self.assertEqual(bloom.get_filter(User, 'email').filter, None)
+
+    def test_other_processes(self):
+        """
+        Values saved by another process are found through the cache, as
+        well as filters rebuilt by the management command.
+
+        """
+        with override_settings(REGISTRATION_BLOOM_FILTER=self.options):
+            self._rebuild()
+            self.failIf(self.checker.might_be_taken('bob@example.com'))
+            # Another process saves bob.
+            bloom.reset()
+            User.objects.create_user('bob', 'bob@example.com', 'secret')
+            bloom.reset()
+            self.failUnless(self.checker.might_be_taken('bob@example.com'))
+
+            self.failIf(self.checker.might_be_taken('carol@example.com'))
+            User.objects.filter(username='bob').update(
+                email='carol@example.com')
+            # Another process rebuilds the filters.
+            bloom.TakenValues('auth.User.email', self.options).build()
+            self.failUnless(self.checker.might_be_taken('carol@example.com'))
+            self.assertEqual(bloom.get_filter(User, 'email').generation, 2)
+
+    def test_unstored_filter(self):
+        """
+        A filter the cache doesn't store, e.g. over its size limit, isn't
+        published as a new generation, and the command fails.
+
+        """
+        with override_settings(REGISTRATION_BLOOM_FILTER=self.options):
+            self._rebuild()
+            taken_values = bloom.get_filter(User, 'email')
+            cache_set = taken_values.cache.set
+            def set(key, value, *args, **kwargs):
+                if ':filter:' not in key:
+                    cache_set(key, value, *args, **kwargs)
+            taken_values.cache.set = set
+            self.assertRaises(ImproperlyConfigured, taken_values.build)
+            self.assertEqual(taken_values.generation, 1)
+            self.assertEqual(cache.get(taken_values._key('generation')), 1)
+
+    def test_rebuild_requires_cache(self):
+        """
+        Bloom filters, and the management command, refuse to work without
+        a shared cache.
+
+        """
+        with override_settings(REGISTRATION_BLOOM_FILTER={}):
+            self.assertRaises(ImproperlyConfigured, bloom.get_filters)
+            self.assertRaises(CommandError, rebuildbloomfilters.Command(
+                ).handle)
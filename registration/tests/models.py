@@ -1,14 +1,27 @@
 import datetime
+import os
 import re
+import tempfile
+from StringIO import StringIO
 
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.core import mail
 from django.core import management
+from django.db import IntegrityError
+from django.db import connection
+from django.db.models import signals
+from django.db.models.query import QuerySet
 from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test.signals import setting_changed
+from django.test.utils import override_settings
 from django.utils.hashcompat import sha_constructor
 
+from registration import benchmarks
+from registration import negative_cache
+from registration.models import OutboxEmail
 from registration.models import RegistrationProfile
 
 
@@ -44,6 +57,58 @@ class RegistrationModelTests(TestCase):
         self.assertEqual(unicode(profile),
                          "Registration information for alice")
 
+    def test_profile_creation_email(self):
+        """
+        Creating a registration profile sends an activation email
+        containing the activation key, unless ``send_email=False`` is
+        passed.
+        
+        """
+        profile = RegistrationProfile.objects.create_profile(
+            Site.objects.get_current(), 'alice@example.com')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['alice@example.com'])
+        self.failUnless(profile.activation_key in mail.outbox[0].body)
+
+        RegistrationProfile.objects.create_profile(
+            Site.objects.get_current(), 'bob@example.com', send_email=False)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_email_templates_cached(self):
+        """
+        Activation email templates are compiled once, unless
+        ``TEMPLATE_DEBUG`` is ``True``, and the cache is cleared when
+        settings change.
+        
+        """
+        templates = RegistrationProfile.email_templates
+        old_debug = settings.TEMPLATE_DEBUG
+        templates.clear()
+        try:
+            settings.TEMPLATE_DEBUG = True
+            self.failIf(templates.get('text') is templates.get('text'))
+
+            settings.TEMPLATE_DEBUG = False
+            template = templates.get('text')
+            self.failUnless(templates.get('text') is template)
+
+            setting_changed.send(sender=self.__class__,
+                                 setting='TEMPLATE_DIRS', value=())
+            self.failIf(templates.get('text') is template)
+        finally:
+            settings.TEMPLATE_DEBUG = old_debug
+            templates.clear()
+
+    def test_activation_key_indexed(self):
+        """
+        ``RegistrationProfile.activation_key`` is indexed, so that
+        activation lookups don't scan the whole profile table.
+        
+        """
+        indexes = connection.introspection.get_indexes(
+            connection.cursor(), RegistrationProfile._meta.db_table)
+        self.failUnless('activation_key' in indexes)
+
     def test_activation_email(self):
         """
         ``RegistrationProfile.send_activation_email`` sends an
@@ -129,7 +194,7 @@ class RegistrationModelTests(TestCase):
         self.failUnless(activated.is_active)
 
         profile = RegistrationProfile.objects.get(user=new_user)
-        self.assertEqual(profile.activation_key, RegistrationProfile.ACTIVATED)
+        self.assertEqual(profile.status, RegistrationProfile.ACTIVATED)
 
     def test_expired_activation(self):
         """
@@ -152,7 +217,7 @@ class RegistrationModelTests(TestCase):
         self.failIf(new_user.is_active)
 
         profile = RegistrationProfile.objects.get(user=new_user)
-        self.assertNotEqual(profile.activation_key, RegistrationProfile.ACTIVATED)
+        self.assertNotEqual(profile.status, RegistrationProfile.ACTIVATED)
 
     def test_activation_invalid_key(self):
         """
@@ -223,3 +288,809 @@ class RegistrationModelTests(TestCase):
         management.call_command('cleanupregistration')
         self.assertEqual(RegistrationProfile.objects.count(), 1)
         self.assertRaises(User.DoesNotExist, User.objects.get, username='bob')
+
+    def test_delete_expired_chunks(self):
+        """
+        ``RegistrationProfile.objects.delete_expired()`` deletes only
+        expired profiles, whatever the chunk size, and returns how many
+        were deleted.
+        
+        """
+        for i in range(5):
+            RegistrationProfile.objects.create_profile(
+                Site.objects.get_current(), 'user%d@example.com' % i,
+                send_email=False)
+        expired = RegistrationProfile.objects.all()[:3].values_list('pk',
+                                                                    flat=True)
+        RegistrationProfile.objects.filter(pk__in=list(expired)).update(
+            expires_at=datetime.datetime.now() - datetime.timedelta(days=1))
+
+        self.assertEqual(
+            RegistrationProfile.objects.delete_expired(chunk_size=2), 3)
+        self.assertEqual(RegistrationProfile.objects.count(), 2)
+        self.assertEqual(RegistrationProfile.objects.delete_expired(), 0)
+
+    def test_delete_chunks_by_primary_key(self):
+        """
+        Profiles and their outbox emails are deleted by primary key, without
+        loading them.
+        
+        """
+        for i in range(3):
+            profile = RegistrationProfile.objects.create_profile(
+                Site.objects.get_current(), 'user%d@example.com' % i,
+                send_email=False)
+            OutboxEmail.objects.create(profile=profile)
+        RegistrationProfile.objects.update(
+            status=RegistrationProfile.ACTIVATED)
+        self.assertEqual(RegistrationProfile.objects.fast_delete_fields(),
+                         [OutboxEmail._meta.get_field('profile')])
+        # Loading the primary keys, deleting the outbox emails, then the
+        # profiles, and finding there's nothing left.
+        with self.assertNumQueries(4):
+            self.assertEqual(RegistrationProfile.objects.delete_activated(), 3)
+        self.assertEqual(OutboxEmail.objects.count(), 0)
+        self.assertEqual(RegistrationProfile.objects.count(), 0)
+
+    def test_delete_chunks_with_receivers(self):
+        """
+        Profiles go through Django's deletion collector, sending the
+        deletion signals, when receivers listen to them.
+        
+        """
+        deleted = []
+
+        def receiver(sender, instance, **kwargs):
+            deleted.append(instance.email)
+        for i in range(3):
+            RegistrationProfile.objects.create_profile(
+                Site.objects.get_current(), 'user%d@example.com' % i,
+                send_email=False)
+        RegistrationProfile.objects.update(
+            status=RegistrationProfile.ACTIVATED)
+        signals.pre_delete.connect(receiver, sender=OutboxEmail)
+        try:
+            self.assertEqual(RegistrationProfile.objects.fast_delete_fields(),
+                             None)
+            self.assertEqual(RegistrationProfile.objects.delete_activated(
+                chunk_size=2), 3)
+        finally:
+            signals.pre_delete.disconnect(receiver, sender=OutboxEmail)
+        self.assertEqual(RegistrationProfile.objects.count(), 0)
+        signals.post_delete.connect(receiver, sender=RegistrationProfile)
+        try:
+            RegistrationProfile.objects.create_profile(
+                Site.objects.get_current(), 'alice@example.com',
+                send_email=False)
+            RegistrationProfile.objects.update(
+                status=RegistrationProfile.ACTIVATED)
+            self.assertEqual(RegistrationProfile.objects.delete_activated(),
+                             1)
+        finally:
+            signals.post_delete.disconnect(receiver,
+                                           sender=RegistrationProfile)
+        self.assertEqual(deleted, ['alice@example.com'])
+
+    def test_delete_activated_queryset(self):
+        """
+        ``RegistrationProfile.objects.delete_activated()`` only considers
+        the profiles in the given queryset.
+        
+        """
+        for i in range(4):
+            RegistrationProfile.objects.create_profile(
+                Site.objects.get_current(), 'user%d@example.com' % i,
+                send_email=False)
+        RegistrationProfile.objects.update(
+            status=RegistrationProfile.ACTIVATED)
+        queryset = RegistrationProfile.objects.exclude(
+            email='user0@example.com')
+
+        self.assertEqual(
+            RegistrationProfile.objects.delete_activated(queryset,
+                                                         chunk_size=1), 3)
+        self.assertEqual(RegistrationProfile.objects.get().email,
+                         'user0@example.com')
+
+    def test_activation_claim(self):
+        """
+        ``activate_user()`` claims the key with a conditional ``UPDATE``
+        before calling the callback, so the key can't be activated twice,
+        even concurrently.
+        
+        """
+        profile = RegistrationProfile.objects.create_profile(
+            Site.objects.get_current(), 'alice@example.com', send_email=False)
+        key = profile.activation_key
+        activate = RegistrationProfile.objects.activate_user
+        with self.assertNumQueries(2):
+            self.assertEqual(activate(None, key, lambda request, profile:
+                                      (profile.email, None)),
+                             ('alice@example.com', None))
+        self.assertEqual(RegistrationProfile.objects.get().status,
+                         RegistrationProfile.ACTIVATED)
+        self.assertEqual(activate(None, key, lambda request, profile:
+                                  (True, None))[0], False)
+
+        profile = RegistrationProfile.objects.create_profile(
+            Site.objects.get_current(), 'bob@example.com', send_email=False)
+        def concurrent(request, profile):
+            # A second activation of the same key while the first one is
+            # still running.
+            return activate(None, profile.activation_key,
+                            lambda request, profile: (True, None))[0], None
+        self.assertEqual(activate(None, profile.activation_key, concurrent),
+                         (False, None))
+
+    def test_expiration_override(self):
+        """
+        ``create_profile()`` and ``bulk_create_profiles()`` store the
+        expiration time of the new profiles in ``expires_at``, after
+        ``ACCOUNT_ACTIVATION_DAYS`` days unless overridden, and the
+        activation email tells the number of days left.
+        
+        """
+        site = Site.objects.get_current()
+        default = RegistrationProfile.objects.create_profile(
+            site, 'alice@example.com')
+        short = RegistrationProfile.objects.create_profile(
+            site, 'bob@example.com', expiration_days=1)
+        bulk = RegistrationProfile.objects.bulk_create_profiles(
+            site, ['carol@example.com'], send_email=False,
+            expiration_days=0)[0]
+
+        self.assertEqual(default.expiration_days_left(),
+                         settings.ACCOUNT_ACTIVATION_DAYS)
+        self.assertEqual(short.expiration_days_left(), 1)
+        self.failIf(short.activation_key_expired())
+        self.assertEqual(
+            list(RegistrationProfile.objects.expired().values_list(
+                'email', flat=True)), [bulk.email])
+        self.failUnless(RegistrationProfile.objects.get(
+            email=bulk.email).activation_key_expired())
+        self.failUnless('within 1 days' in mail.outbox[1].body)
+
+    def test_queryset_states(self):
+        """
+        ``pending()``, ``expired()`` and ``activated()`` filter the profiles
+        by state and ``with_state()`` annotates them with it, all in the
+        database; the manager methods accept any profile queryset.
+        
+        """
+        site = Site.objects.get_current()
+        for i in range(4):
+            RegistrationProfile.objects.create_profile(
+                site, 'user%d@example.com' % i, send_email=False)
+        RegistrationProfile.objects.filter(
+            email__in=['user0@example.com', 'user1@example.com']).update(
+            status=RegistrationProfile.ACTIVATED)
+        RegistrationProfile.objects.filter(
+            email__in=['user1@example.com', 'user2@example.com']).update(
+            expires_at=datetime.datetime.now() - datetime.timedelta(days=1))
+
+        emails = lambda queryset: sorted(queryset.values_list('email',
+                                                              flat=True))
+        self.assertEqual(emails(RegistrationProfile.objects.pending()),
+                         ['user3@example.com'])
+        self.assertEqual(emails(RegistrationProfile.objects.expired()),
+                         ['user1@example.com', 'user2@example.com'])
+        self.assertEqual(emails(RegistrationProfile.objects.activated()),
+                         ['user0@example.com', 'user1@example.com'])
+        self.assertEqual(
+            emails(RegistrationProfile.objects.all().expired().activated()),
+            ['user1@example.com'])
+        self.assertEqual(
+            dict((profile.email, profile.state) for profile in
+                 RegistrationProfile.objects.with_state()),
+            {'user0@example.com': 'activated',
+             'user1@example.com': 'activated',
+             'user2@example.com': 'expired',
+             'user3@example.com': 'pending'})
+
+        queryset = QuerySet(RegistrationProfile).exclude(
+            email='user3@example.com')
+        self.assertEqual(
+            RegistrationProfile.objects.pending_profiles(queryset).count(), 0)
+
+    def test_bulk_create_profiles(self):
+        """
+        ``RegistrationProfile.objects.bulk_create_profiles()`` creates a
+        profile per new email, normalising and de-duplicating them, and
+        sends their activation emails, as well as those of the pending
+        profiles which were never sent one.
+        
+        """
+        site = Site.objects.get_current()
+        RegistrationProfile.objects.create_profile(site, 'alice@example.com',
+                                                   send_email=False)
+        profiles = RegistrationProfile.objects.bulk_create_profiles(
+            site, [' Alice@example.com', 'bob@example.com', 'BOB@example.com ',
+                   'carol@example.com', 'dave@example.com'], batch_size=2)
+
+        self.assertEqual([profile.email for profile in profiles],
+                         ['bob@example.com', 'alice@example.com',
+                          'carol@example.com', 'dave@example.com'])
+        self.assertEqual(RegistrationProfile.objects.count(), 4)
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(RegistrationProfile.objects.filter(
+            last_sent_at=None).count(), 0)
+        for profile in profiles:
+            self.failUnless(re.match('^[a-f0-9]{40}$',
+                                     profile.activation_key))
+        self.assertEqual(len(set(profile.activation_key
+                                 for profile in profiles)), 4)
+
+        # Running it again doesn't create duplicates.
+        self.assertEqual(RegistrationProfile.objects.bulk_create_profiles(
+            site, ['bob@example.com', 'erin@example.com'],
+            send_email=False)[0].email, 'erin@example.com')
+        self.assertEqual(RegistrationProfile.objects.count(), 5)
+        self.assertEqual(len(mail.outbox), 4)
+
+        # Emails which failed to be sent are sent by the next run.
+        def failing(site, profiles):
+            raise IOError
+        RegistrationProfile.objects.send_activation_emails = failing
+        try:
+            self.assertRaises(IOError,
+                              RegistrationProfile.objects.bulk_create_profiles,
+                              site, ['frank@example.com'])
+        finally:
+            del RegistrationProfile.objects.send_activation_emails
+        self.assertEqual(
+            [profile.email for profile in
+             RegistrationProfile.objects.bulk_create_profiles(
+                site, ['bob@example.com', 'erin@example.com',
+                       'frank@example.com'])],
+            ['erin@example.com', 'frank@example.com'])
+        self.assertEqual(RegistrationProfile.objects.count(), 6)
+        self.assertEqual(len(mail.outbox), 6)
+
+    def _create_expired_profiles(self, count):
+        for i in range(count):
+            RegistrationProfile.objects.create_profile(
+                Site.objects.get_current(), 'user%d@example.com' % i,
+                send_email=False)
+        RegistrationProfile.objects.update(
+            expires_at=datetime.datetime.now() - datetime.timedelta(days=1))
+
+    def test_management_command_statistics(self):
+        """
+        The ``cleanupregistration`` management command deletes in
+        batches and reports per-phase statistics; ``--dry-run`` only
+        counts.
+        
+        """
+        self._create_expired_profiles(3)
+        out = StringIO()
+        management.call_command('cleanupregistration', dry_run=True,
+                                stdout=out)
+        self.assertEqual(RegistrationProfile.objects.count(), 3)
+        self.failUnless(out.getvalue().startswith(
+            'expired: 3 to delete'))
+
+        out = StringIO()
+        management.call_command('cleanupregistration', batch_size=2,
+                                stdout=out)
+        self.assertEqual(RegistrationProfile.objects.count(), 0)
+        self.failUnless(out.getvalue().startswith(
+            'expired: 3 deleted'))
+
+    def test_management_command_resume(self):
+        """
+        When the ``cleanupregistration`` management command runs out of
+        time it stores its progress in the checkpoint file, and the next
+        run resumes from it.
+        
+        """
+        self._create_expired_profiles(3)
+        fd, checkpoint = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(checkpoint)
+
+        management.call_command('cleanupregistration', batch_size=1,
+                                max_runtime=0, checkpoint=checkpoint,
+                                stdout=StringIO())
+        self.assertEqual(RegistrationProfile.objects.count(), 2)
+        self.failUnless(os.path.exists(checkpoint))
+
+        management.call_command('cleanupregistration', batch_size=1,
+                                checkpoint=checkpoint, stdout=StringIO())
+        self.assertEqual(RegistrationProfile.objects.count(), 0)
+        self.failIf(os.path.exists(checkpoint))
+
+    def test_management_command_stopped(self):
+        """
+        When the ``cleanupregistration`` management command runs out of
+        time without a checkpoint file it reports where it stopped.
+        
+        """
+        self._create_expired_profiles(3)
+        out = StringIO()
+        management.call_command('cleanupregistration', batch_size=1,
+                                max_runtime=0, stdout=out)
+        self.assertEqual(RegistrationProfile.objects.count(), 2)
+        self.failUnless('Stopped after 0 seconds in the expired phase, '
+                        'after primary key ' in out.getvalue())
+
+    def test_import_invites_command(self):
+        """
+        The ``importinvites`` management command invites the valid emails
+        of a CSV file, chunk by chunk, and can be run again without
+        creating duplicates.
+        
+        """
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.write(fd, 'email,name\n'
+                     'alice@example.com,Alice\n'
+                     ' Bob@Example.com ,Bob\n'
+                     'not an email,Nobody\n'
+                     '\n'
+                     'carol@example.com,Carol\n')
+        os.close(fd)
+        try:
+            stdout = StringIO()
+            management.call_command('importinvites', path, batch_size=2,
+                                    stdout=stdout)
+            self.assertEqual(
+                sorted(RegistrationProfile.objects.values_list('email',
+                                                               flat=True)),
+                ['alice@example.com', 'bob@example.com',
+                 'carol@example.com'])
+            self.assertEqual(len(mail.outbox), 3)
+            self.assertEqual(stdout.getvalue().splitlines()[-1],
+                             "6 read, 3 invited, 3 invalid")
+
+            management.call_command('importinvites', path, stdout=StringIO())
+            self.assertEqual(RegistrationProfile.objects.count(), 3)
+            self.assertEqual(len(mail.outbox), 3)
+        finally:
+            os.remove(path)
+
+    def test_register_profile(self):
+        """
+        ``register_profile()`` creates a profile per registration, unless
+        ``REGISTRATION_UNIQUE_PENDING`` is ``True``: then registering an
+        email again reuses its pending profile, resending the activation
+        email after the cooldown and rotating the key once expired.
+        
+        """
+        site = Site.objects.get_current()
+        register = RegistrationProfile.objects.register_profile
+        register(site, 'alice@example.com')
+        register(site, 'alice@example.com')
+        self.assertEqual(RegistrationProfile.objects.count(), 2)
+        RegistrationProfile.objects.all().delete()
+        mail.outbox = []
+
+        with override_settings(REGISTRATION_UNIQUE_PENDING=True):
+            profile = register(site, ' Alice@example.com')
+            self.assertEqual(profile.pending_email, 'alice@example.com')
+            self.assertEqual(len(mail.outbox), 1)
+
+            # Within the cooldown.
+            self.assertEqual(register(site, 'alice@example.com').pk,
+                             profile.pk)
+            self.assertEqual(len(mail.outbox), 1)
+
+            # After the cooldown, the same key is sent again.
+            again = register(site, 'alice@example.com', cooldown=0)
+            self.assertEqual(again.activation_key, profile.activation_key)
+            self.assertEqual(len(mail.outbox), 2)
+
+            # Once expired, the key is rotated.
+            RegistrationProfile.objects.update(
+                expires_at=datetime.datetime.now())
+            rotated = register(site, 'alice@example.com')
+            self.assertEqual(rotated.pk, profile.pk)
+            self.assertNotEqual(rotated.activation_key, profile.activation_key)
+            self.failIf(rotated.activation_key_expired())
+            self.assertEqual(len(mail.outbox), 3)
+            self.failUnless(rotated.activation_key in mail.outbox[2].body)
+            self.assertEqual(RegistrationProfile.objects.count(), 1)
+
+            # Activating the profile frees the email.
+            RegistrationProfile.objects.activate_user(
+                None, rotated.activation_key,
+                lambda request, profile: (True, None))
+            self.assertEqual(RegistrationProfile.objects.get().pending_email,
+                             None)
+            self.assertNotEqual(register(site, 'alice@example.com').pk,
+                                profile.pk)
+            self.assertEqual(RegistrationProfile.objects.count(), 2)
+
+    def test_unique_pending_other_paths(self):
+        """
+        When ``REGISTRATION_UNIQUE_PENDING`` is ``True``,
+        ``create_profile()`` goes through ``register_profile()`` and
+        ``bulk_create_profiles()`` sets ``pending_email``, so registering
+        an invited email reuses its profile, and inviting it again once
+        expired rotates its key.
+        
+        """
+        site = Site.objects.get_current()
+        manager = RegistrationProfile.objects
+        with override_settings(REGISTRATION_UNIQUE_PENDING=True):
+            profile = manager.create_profile(site, 'alice@example.com')
+            self.assertEqual(manager.create_profile(
+                site, 'alice@example.com').pk, profile.pk)
+
+            manager.bulk_create_profiles(site, ['Bob@example.com',
+                                                'alice@example.com'])
+            self.assertEqual(manager.get(email='bob@example.com').pending_email,
+                             'bob@example.com')
+            manager.register_profile(site, 'bob@example.com')
+            self.assertEqual(manager.count(), 2)
+            self.assertEqual(len(mail.outbox), 2)
+
+            manager.update(expires_at=datetime.datetime.now())
+            self.assertEqual(manager.bulk_create_profiles(
+                site, ['bob@example.com']), [])
+            self.assertEqual(manager.count(), 2)
+            self.failIf(manager.get(email='bob@example.com'
+                                    ).activation_key_expired())
+            self.assertEqual(len(mail.outbox), 3)
+
+    def test_register_profile_concurrent(self):
+        """
+        The unique ``pending_email`` makes a registration which lost the
+        race to insert the profile of an email reuse the winner's one.
+        
+        """
+        site = Site.objects.get_current()
+        winner = RegistrationProfile.objects.create(
+            email='alice@example.com', pending_email='alice@example.com',
+            activation_key='a' * 40, last_sent_at=datetime.datetime.now())
+        old_get = RegistrationProfile.objects.get
+        lookups = []
+
+        def get(**kwargs):
+            # The first lookup runs before the winner's insert.
+            lookups.append(kwargs)
+            if len(lookups) == 1:
+                raise RegistrationProfile.DoesNotExist
+            return old_get(**kwargs)
+        RegistrationProfile.objects.get = get
+        try:
+            with override_settings(REGISTRATION_UNIQUE_PENDING=True):
+                profile = RegistrationProfile.objects.register_profile(
+                    site, 'alice@example.com')
+        finally:
+            del RegistrationProfile.objects.get
+        self.assertEqual(profile.pk, winner.pk)
+        self.assertEqual(RegistrationProfile.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class NegativeCacheTests(TestCase):
+    """
+    Test the cache of invalid activation keys.
+    
+    """
+    def setUp(self):
+        self.old_activation = getattr(settings, 'ACCOUNT_ACTIVATION_DAYS', None)
+        settings.ACCOUNT_ACTIVATION_DAYS = 7
+        negative_cache.get_negative_cache().clear()
+
+    def tearDown(self):
+        settings.ACCOUNT_ACTIVATION_DAYS = self.old_activation
+
+    def activate(self, activation_key):
+        return RegistrationProfile.objects.activate_user(
+            None, activation_key, lambda request, profile: (profile, None))
+
+    def test_unknown_key(self):
+        """
+        Unknown keys are looked up in the database only once.
+        
+        """
+        activation_key = sha_constructor('foo').hexdigest()
+        self.failIf(self.activate(activation_key)[0])
+        self.assertNumQueries(0, self.activate, activation_key)
+
+    def test_activated_key(self):
+        """
+        Once used, a key is rejected without querying the database.
+        
+        """
+        profile = RegistrationProfile.objects.create_profile(
+            Site.objects.get_current(), 'alice@example.com', send_email=False)
+        self.failUnless(self.activate(profile.activation_key)[0])
+        self.failUnless(negative_cache.is_invalid(profile.activation_key))
+        self.assertNumQueries(0, self.activate, profile.activation_key)
+
+    def test_saved_key_discarded(self):
+        """
+        Saving a profile removes its key from the cache.
+        
+        """
+        activation_key = sha_constructor('foo').hexdigest()
+        self.failIf(self.activate(activation_key)[0])
+        RegistrationProfile.objects.create(email='alice@example.com',
+                                           activation_key=activation_key)
+        self.failIf(negative_cache.is_invalid(activation_key))
+        self.failUnless(self.activate(activation_key)[0])
+
+    def test_lost_claim_not_cached(self):
+        """
+        A key whose claim is lost to a concurrent activation, which may
+        still fail, isn't cached as invalid.
+        
+        """
+        profile = RegistrationProfile.objects.create_profile(
+            Site.objects.get_current(), 'alice@example.com', send_email=False)
+        pending = RegistrationProfile.objects.pending
+        lookups = []
+
+        def concurrent_pending():
+            # A concurrent request claims the key between the lookup of
+            # the profile and its claim.
+            if lookups:
+                RegistrationProfile.objects.filter(pk=profile.pk).update(
+                    status=RegistrationProfile.ACTIVATED)
+            lookups.append(True)
+            return pending()
+        RegistrationProfile.objects.pending = concurrent_pending
+        try:
+            self.failIf(self.activate(profile.activation_key)[0])
+        finally:
+            del RegistrationProfile.objects.pending
+        self.failIf(negative_cache.is_invalid(profile.activation_key))
+
+    def test_disabled(self):
+        """
+        Setting ``REGISTRATION_NEGATIVE_CACHE`` to ``None`` disables the
+        cache.
+        
+        """
+        old_cache = getattr(settings, 'REGISTRATION_NEGATIVE_CACHE', '')
+        settings.REGISTRATION_NEGATIVE_CACHE = None
+        negative_cache.reset()
+        try:
+            activation_key = sha_constructor('foo').hexdigest()
+            self.activate(activation_key)
+            self.assertNumQueries(1, self.activate, activation_key)
+        finally:
+            settings.REGISTRATION_NEGATIVE_CACHE = old_cache
+            negative_cache.reset()
+
+
+class _FailingEmailBackend(object):
+    """
+    Email backend whose deliveries always fail.
+    
+    """
+    def __init__(self, **kwargs):
+        pass
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        raise IOError('Connection refused')
+
+
+class RegistrationOutboxTests(TestCase):
+    """
+    Test the activation email outbox.
+    
+    """
+    def setUp(self):
+        self.old_activation = getattr(settings, 'ACCOUNT_ACTIVATION_DAYS', None)
+        self.old_outbox = getattr(settings, 'REGISTRATION_EMAIL_OUTBOX', False)
+        settings.ACCOUNT_ACTIVATION_DAYS = 7
+        settings.REGISTRATION_EMAIL_OUTBOX = True
+        self.site = Site.objects.get_current()
+
+    def tearDown(self):
+        settings.ACCOUNT_ACTIVATION_DAYS = self.old_activation
+        settings.REGISTRATION_EMAIL_OUTBOX = self.old_outbox
+
+    def test_profile_creation_queues_email(self):
+        """
+        In outbox mode, creating a profile queues the activation email
+        instead of sending it.
+        
+        """
+        profile = RegistrationProfile.objects.create_profile(
+            self.site, 'alice@example.com')
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.get().profile, profile)
+
+        RegistrationProfile.objects.create_profile(
+            self.site, 'bob@example.com', send_email=False)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+    def test_bulk_create_profiles_queues_emails(self):
+        """
+        In outbox mode, ``bulk_create_profiles()`` queues an activation
+        email per new profile.
+        
+        """
+        RegistrationProfile.objects.bulk_create_profiles(
+            self.site, ['alice@example.com', 'bob@example.com'])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            sorted(OutboxEmail.objects.values_list('profile__email',
+                                                   flat=True)),
+            ['alice@example.com', 'bob@example.com'])
+
+    def test_send_due(self):
+        """
+        ``OutboxEmail.objects.send_due()`` sends the queued emails and
+        removes them from the outbox.
+        
+        """
+        for email in ('alice@example.com', 'bob@example.com'):
+            RegistrationProfile.objects.create_profile(self.site, email)
+
+        self.assertEqual(OutboxEmail.objects.send_due(self.site,
+                                                      batch_size=1), (2, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['alice@example.com', 'bob@example.com'])
+        self.assertEqual(OutboxEmail.objects.count(), 0)
+
+    def test_send_due_dead_profiles(self):
+        """
+        Queued emails of profiles activated, revoked or expired since are
+        deleted without being sent.
+        
+        """
+        for email in ('alice@example.com', 'bob@example.com',
+                      'carol@example.com', 'dave@example.com'):
+            RegistrationProfile.objects.create_profile(self.site, email)
+        profiles = RegistrationProfile.objects
+        profiles.filter(email='alice@example.com').update(
+            status=RegistrationProfile.ACTIVATED)
+        profiles.filter(email='bob@example.com').update(
+            status=RegistrationProfile.REVOKED)
+        profiles.filter(email='carol@example.com').update(
+            expires_at=datetime.datetime.now() - datetime.timedelta(days=1))
+
+        self.assertEqual(OutboxEmail.objects.send_due(self.site), (1, 0))
+        self.assertEqual([message.to[0] for message in mail.outbox],
+                         ['dave@example.com'])
+        self.assertEqual(OutboxEmail.objects.count(), 0)
+
+    def test_send_due_claims(self):
+        """
+        Each email is claimed before being sent, so that concurrent runs
+        don't send it twice.
+        
+        """
+        for email in ('alice@example.com', 'bob@example.com'):
+            RegistrationProfile.objects.create_profile(self.site, email)
+        stale = OutboxEmail.objects.get(profile__email='alice@example.com')
+        self.failUnless(OutboxEmail.objects.claim(
+            OutboxEmail.objects.get(pk=stale.pk)))
+        self.failIf(OutboxEmail.objects.claim(stale))
+
+        # Alice's email is being sent by another run.
+        self.assertEqual(OutboxEmail.objects.send_due(self.site), (1, 0))
+        self.assertEqual([message.to[0] for message in mail.outbox],
+                         ['bob@example.com'])
+
+        # Its lease is over.
+        OutboxEmail.objects.update(next_attempt=datetime.datetime.now())
+        self.assertEqual(OutboxEmail.objects.send_due(self.site), (1, 0))
+        self.assertEqual(OutboxEmail.objects.count(), 0)
+
+    def test_send_due_failure(self):
+        """
+        Failed emails are retried with an increasing delay, then marked
+        as dead.
+        
+        """
+        RegistrationProfile.objects.create_profile(self.site,
+                                                   'alice@example.com')
+        connection = _FailingEmailBackend()
+
+        self.assertEqual(OutboxEmail.objects.send_due(
+            self.site, max_attempts=2, connection=connection), (0, 1))
+        outbox_email = OutboxEmail.objects.get()
+        self.assertEqual(outbox_email.attempts, 1)
+        self.assertEqual(outbox_email.status, OutboxEmail.PENDING)
+        self.failUnless(outbox_email.next_attempt > datetime.datetime.now())
+        self.assertEqual(outbox_email.last_error, 'Connection refused')
+
+        # Not due yet.
+        self.assertEqual(OutboxEmail.objects.send_due(
+            self.site, max_attempts=2, connection=connection), (0, 0))
+
+        OutboxEmail.objects.update(next_attempt=datetime.datetime.now())
+        OutboxEmail.objects.send_due(self.site, max_attempts=2,
+                                     connection=connection)
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.DEAD)
+
+    def test_management_command(self):
+        """
+        The ``sendregistrationemails`` management command drains the
+        outbox.
+        
+        """
+        RegistrationProfile.objects.create_profile(self.site,
+                                                   'alice@example.com')
+        out = StringIO()
+        management.call_command('sendregistrationemails', stdout=out)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(out.getvalue(), '1 sent, 0 failed\n')
+
+
+
+class BenchmarkTests(TestCase):
+    """
+    Test that the benchmarks run, on tiny data sizes.
+    
+    """
+    def test_run(self):
+        """
+        ``registration.benchmarks.run()`` returns the measurements of
+        every benchmark, per table size for the database ones.
+        
+        """
+        results = benchmarks.run(sizes=[20, 40], iterations=2)
+        self.assertEqual(sorted(results),
+                         sorted(name for name, bench in
+                                benchmarks.BENCHMARKS +
+                                benchmarks.TABLE_BENCHMARKS))
+        self.assertEqual(sorted(results['create_profile']), ['20', '40'])
+        self.assertEqual(results['delete_expired']['40']['deleted'], 4)
+        self.assertEqual(RegistrationProfile.objects.count(), 0)
+
+
+class ActivationTransactionTests(TransactionTestCase):
+    """
+    Test that ``activate_user()`` rolls its claim back when the callback
+    fails, which ``TestCase`` can't, running each test in a transaction.
+
+    """
+    def setUp(self):
+        self.profile = RegistrationProfile.objects.create_profile(
+            Site.objects.get_current(), 'alice@example.com', send_email=False)
+
+    def test_failed_callback(self):
+        """
+        A callback returning a falsy account or raising leaves the profile
+        pending, and whatever it wrote is rolled back.
+
+        """
+        key = self.profile.activation_key
+        activate = RegistrationProfile.objects.activate_user
+
+        def failing(request, profile):
+            User.objects.create_user('alice', profile.email, 'secret')
+            return False, 'failed'
+        self.assertEqual(activate(None, key, failing), (False, 'failed'))
+
+        def raising(request, profile):
+            User.objects.create_user('alice', profile.email, 'secret')
+            raise ValueError
+        self.assertRaises(ValueError, activate, None, key, raising)
+        self.assertEqual(User.objects.count(), 0)
+        self.assertEqual(RegistrationProfile.objects.pending().count(), 1)
+        self.failIf(negative_cache.is_invalid(key))
+
+        self.assertEqual(activate(None, key, lambda request, profile:
+                                  (profile.email, None))[0],
+                         'alice@example.com')
+        self.assertEqual(RegistrationProfile.objects.pending().count(), 0)
+
+    def test_unique_pending_key(self):
+        """
+        Pending profiles can't share an activation key, while the key of an
+        activated profile may be reused.
+
+        """
+        key = self.profile.activation_key
+        bob = RegistrationProfile.objects.create_profile(
+            Site.objects.get_current(), 'bob@example.com', send_email=False)
+        profiles = RegistrationProfile.objects.filter(pk=bob.pk)
+        self.assertRaises(IntegrityError, profiles.update, activation_key=key)
+        RegistrationProfile.objects.filter(pk=self.profile.pk).update(
+            status=RegistrationProfile.ACTIVATED)
+        profiles.update(activation_key=key)
+        self.assertEqual(RegistrationProfile.objects.filter(
+            activation_key=key).count(), 2)
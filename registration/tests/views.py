@@ -1,13 +1,23 @@
 import datetime
+import socket
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
 from django.core import mail
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
 
 from registration import forms
+from registration import instrumentation
+from registration import views
+from registration.backends import get_backend
+from registration.benchmarks import views as bench_views
 from registration.models import RegistrationProfile
+from registration.testing import RegistrationQueryBudgetTests
 
 
 class RegistrationViewTests(TestCase):
@@ -244,3 +254,233 @@ class RegistrationViewTests(TestCase):
         self.assertEqual(response.context['foo'], 'bar')
         # Callables in extra_context are called to obtain the value.
         self.assertEqual(response.context['callable'], 'called')
+
+
+class RateLimitViewTests(TestCase):
+    """
+    Test the rate limiting of the views.
+
+    """
+    urls = 'registration.tests.urls'
+
+    def setUp(self):
+        self.old_limits = getattr(settings, 'REGISTRATION_RATE_LIMITS', None)
+        settings.REGISTRATION_RATE_LIMITS = {'register_ip': (1, 60),
+                                             'activate_ip': (1, 60)}
+        cache.clear()
+
+    def tearDown(self):
+        settings.REGISTRATION_RATE_LIMITS = self.old_limits
+
+    def test_activation_view_limited(self):
+        """
+        Too many activation submissions get a 429 response.
+
+        """
+        url = reverse('registration_activate',
+                      kwargs={'activation_key': 'foo'})
+        self.assertNotEqual(self.client.post(url, data={}).status_code, 429)
+        self.assertEqual(self.client.post(url, data={}).status_code, 429)
+
+    def test_registration_view_limited(self):
+        """
+        Too many registration submissions get a 429 response.
+
+        """
+        url = reverse('registration_register')
+        self.client.post(url, data={'email': 'alice@example.com'})
+        response = self.client.post(url, data={'email': 'alice@example.com'})
+        self.assertEqual(response.status_code, 429)
+
+
+
+class RecordingSink(object):
+    """
+    Timing sink remembering the names of the timed phases.
+
+    """
+    events = []
+
+    def timing(self, name, seconds):
+        self.events.append(name)
+
+
+class InstrumentationTests(TestCase):
+    """
+    Test the timing instrumentation of the views.
+
+    """
+    urls = 'registration.tests.urls'
+
+    def setUp(self):
+        RecordingSink.events = []
+
+    def test_no_sink(self):
+        """
+        Without a configured sink, ``timer`` returns a shared no-op
+        context manager.
+
+        """
+        with override_settings(REGISTRATION_TIMING_SINK=None):
+            self.failUnless(instrumentation.timer('a') is
+                            instrumentation.timer('b'))
+
+    def test_phases(self):
+        """
+        Registering and activating report the time spent in each phase to
+        the configured sink.
+
+        """
+        test_settings = dict(bench_views.SETTINGS,
+                             REGISTRATION_TIMING_SINK=
+                                 'registration.tests.views.RecordingSink')
+        del test_settings['ROOT_URLCONF']
+        with override_settings(**test_settings):
+            self.client.post(reverse('registration_register'),
+                             data={'email': 'alice@example.com'})
+            self.assertEqual(RecordingSink.events,
+                             ['register.allowed', 'register.form',
+                              'register.site', 'email.render', 'email.send',
+                              'register.backend'])
+
+            RecordingSink.events = []
+            self.client.post(reverse('registration_activate', kwargs={
+                'activation_key':
+                    RegistrationProfile.objects.get().activation_key}))
+            self.assertEqual(RecordingSink.events,
+                             ['activate.allowed', 'activate.form',
+                              'activate.callback', 'activate.backend'])
+
+    def test_statsd_sink(self):
+        """
+        ``StatsdSink`` sends statsd timers over UDP.
+
+        """
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        try:
+            sink = instrumentation.StatsdSink('127.0.0.1',
+                                              server.getsockname()[1],
+                                              'signup')
+            sink.timing('register.form', 0.0123)
+            self.assertEqual(server.recv(1024), 'signup.register.form:12|ms')
+        finally:
+            server.close()
+
+
+class QueryBudgetTests(RegistrationQueryBudgetTests, TestCase):
+    """
+    Test the query budgets of the registration code paths, with the forms
+    and activation method used by the benchmarks.
+
+    """
+    urls = 'registration.tests.urls'
+
+    def setUp(self):
+        self.settings_override = override_settings(**dict(
+            bench_views.SETTINGS, ROOT_URLCONF=self.urls))
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def test_budget_exceeded(self):
+        """
+        A block running more queries than its budget fails the test,
+        listing the queries.
+
+        """
+        try:
+            with self.assertQueryBudget('create_profile'):
+                RegistrationProfile.objects.count()
+                RegistrationProfile.objects.exists()
+        except AssertionError, e:
+            self.failUnless(str(e).startswith(
+                "create_profile ran 2 queries, over its budget of 1:\n1. "
+                "SELECT COUNT(*)"), str(e))
+        else:
+            self.fail("The budget wasn't enforced.")
+
+
+class ClassBasedViewTests(TestCase):
+    """
+    Test ``RegisterView`` and ``ActivateView``.
+
+    """
+    urls = 'registration.benchmarks.urls'
+
+    def setUp(self):
+        self.settings_override = override_settings(**bench_views.SETTINGS)
+        self.settings_override.enable()
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def test_bound_backend(self):
+        """
+        A backend instance given to ``as_view()`` handles every request,
+        and subclasses can override single phases.
+
+        """
+        backend = get_backend('registration.backends.default.DefaultBackend')
+        registered = []
+
+        class RecordingRegisterView(views.RegisterView):
+            def register(self, form):
+                registered.append((form.cleaned_data['email'],
+                                   self.backend is backend))
+                return super(RecordingRegisterView, self).register(form)
+
+        view = RecordingRegisterView.as_view(backend=backend)
+        for email in ('alice@example.com', 'bob@example.com'):
+            response = view(self.factory.post('/', {'email': email}))
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(registered, [('alice@example.com', True),
+                                      ('bob@example.com', True)])
+        self.assertEqual(RegistrationProfile.objects.count(), 2)
+
+        profile = RegistrationProfile.objects.all()[0]
+        view = views.ActivateView.as_view(backend=backend,
+                                          success_url='/activated/')
+        response = view(self.factory.post('/'),
+                        activation_key=profile.activation_key)
+        self.assertEqual(response['Location'], '/activated/')
+        self.assertEqual(RegistrationProfile.objects.activated().count(), 1)
+
+    def test_lazy_extra_context(self):
+        """
+        Callables in ``extra_context`` are only called when rendering.
+
+        """
+        calls = []
+
+        def callable_value():
+            calls.append(1)
+            return 'called'
+        view = views.RegisterView.as_view(
+            backend='registration.backends.default.DefaultBackend',
+            extra_context={'callable': callable_value})
+        self.assertEqual(calls, [])
+        response = view(self.factory.post('/', {'email': 'alice@example.com'}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(calls, [])
+        response = view(self.factory.get('/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(calls, [1])
+
+    def test_activate_form_class(self):
+        """
+        The ``activate`` view accepts a ``form_class`` argument.
+
+        """
+        profile = RegistrationProfile.objects.create_profile(
+            Site.objects.get_current(), 'alice@example.com', send_email=False)
+        response = views.activate(
+            self.factory.get('/'),
+            backend='registration.backends.default.DefaultBackend',
+            form_class=forms.UniqueUsernameActivationForm,
+            activation_key=profile.activation_key)
+        self.assertEqual(response.status_code, 200)
+        self.failUnless('name="username"' in response.content)
@@ -0,0 +1,63 @@
+"""
+Signed, timestamped activation tokens carrying an email address, used
+by ``registration.backends.signed.SignedTokenBackend`` instead of
+storing a ``RegistrationProfile`` for every registration.
+
+A token looks like ``<email>:<timestamp>:<signature>``, where the email
+is URL-safe base64 encoded (without padding), the timestamp is the
+creation time in seconds, base 36 encoded, and the signature is an HMAC
+of both, keyed on ``SECRET_KEY``.
+
+"""
+import base64
+import time
+
+from django.utils.crypto import constant_time_compare
+from django.utils.crypto import salted_hmac
+from django.utils.http import base36_to_int
+from django.utils.http import int_to_base36
+
+
+KEY_SALT = 'registration.tokens'
+
+
+def _signature(value):
+    return salted_hmac(KEY_SALT, value).hexdigest()
+
+
+def make_token(email, timestamp=None):
+    """
+    Returns a token for ``email`` created at ``timestamp`` (now by
+    default).
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    if isinstance(email, unicode):
+        email = email.encode('utf-8')
+    value = '%s:%s' % (base64.urlsafe_b64encode(email).rstrip('='),
+                       int_to_base36(int(timestamp)))
+    return '%s:%s' % (value, _signature(value))
+
+
+def check_token(token, max_age=None):
+    """
+    Validates ``token`` and returns the email address it carries, or
+    ``None`` if the token is malformed, its signature doesn't match or it
+    is older than ``max_age`` seconds.
+    """
+    try:
+        token = str(token)
+        value, signature = token.rsplit(':', 1)
+        encoded, timestamp = value.split(':')
+        timestamp = base36_to_int(timestamp)
+    except (ValueError, UnicodeError):
+        return None
+    if not constant_time_compare(signature, _signature(value)):
+        return None
+    if max_age is not None and time.time() - timestamp > max_age:
+        return None
+    try:
+        email = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+        return email.decode('utf-8')
+    except (TypeError, UnicodeError):
+        return None
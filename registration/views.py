@@ -4,16 +4,207 @@ Views which allow users to create and activate accounts.
 """
 
 
+from django.http import HttpResponse
 from django.shortcuts import redirect
 from django.shortcuts import render_to_response
 from django.template import RequestContext
+from django.views.generic import View
 
 from registration.backends import get_backend
+from registration.instrumentation import timer
 
 import logging
 
 LOG = logging.getLogger(__name__)
 
+
+class HttpResponseTooManyRequests(HttpResponse):
+    status_code = 429
+
+
+class BackendView(View):
+    """
+    Base class of the class-based registration views, which delegate
+    their work to a registration backend.
+
+    ``backend`` is either a backend instance, bound once for all the
+    requests when the URLconf is loaded, or the dotted Python import path
+    to a backend class, resolved on each request through ``get_backend``,
+    which caches the instance per process and follows settings changes.
+
+    The values in ``extra_context`` are added to the template context;
+    callables among them are only called when a template is rendered.
+    """
+    backend = None
+    activation_method = None
+    form_class = None
+    success_url = None
+    template_name = None
+    extra_context = None
+
+    def get_backend(self):
+        """
+        Returns the backend instance handling the request.
+        """
+        if isinstance(self.backend, basestring):
+            return get_backend(self.backend,
+                               activation_method=self.activation_method)
+        return self.backend
+
+    def dispatch(self, request, *args, **kwargs):
+        self.request = request
+        self.backend = self.get_backend()
+        response = self.check_allowed()
+        if response is not None:
+            return response
+        return super(BackendView, self).dispatch(request, *args, **kwargs)
+
+    def check_allowed(self):
+        """
+        Returns a response if the request isn't allowed, ``None``
+        otherwise.
+        """
+        return None
+
+    def render(self, context):
+        """
+        Renders ``template_name`` with ``context`` and ``extra_context``.
+        """
+        context_instance = RequestContext(self.request)
+        for key, value in (self.extra_context or {}).items():
+            context_instance[key] = callable(value) and value() or value
+        return render_to_response(self.template_name, context,
+                                  context_instance=context_instance)
+
+
+class ActivateView(BackendView):
+    """
+    Class-based version of the ``activate`` view, which documents its
+    behaviour and arguments. Each phase is a method which subclasses can
+    override: ``check_allowed``, ``get_form_class``, ``activate`` and
+    ``success_redirect``.
+    """
+    template_name = 'registration/activate.html'
+
+    def check_allowed(self):
+        activation_allowed = getattr(self.backend, 'activation_allowed', None)
+        if activation_allowed is not None:
+            with timer('activate.allowed'):
+                allowed = activation_allowed(self.request)
+            if not allowed:
+                return HttpResponseTooManyRequests()
+
+    def get_form_class(self):
+        """
+        Returns the activation form class, or ``None`` if there's none.
+        """
+        if self.form_class is not None:
+            return self.form_class
+        return self.backend.get_activation_form_class(self.request)
+
+    def get(self, request, *args, **kwargs):
+        form_class = self.get_form_class()
+        if form_class is not None:
+            kwargs['form'] = form_class()
+        return self.render(kwargs)
+
+    def post(self, request, *args, **kwargs):
+        form_class = self.get_form_class()
+        form = form_class and form_class(data=request.POST,
+                                          files=request.FILES)
+        kwargs['form'] = form
+        with timer('activate.form'):
+            valid = not form or form.is_valid()
+        if valid:
+            with timer('activate.backend'):
+                account, errors = self.activate(**kwargs)
+            if account:
+                return self.success_redirect(account)
+            if errors and form:
+                form._errors['__all__'] = errors
+        return self.render(kwargs)
+
+    def activate(self, **kwargs):
+        """
+        Activates the account, given the keyword arguments captured from
+        the URL and the ``form``, returning the backend's ``activate()``
+        two-tuple.
+        """
+        return self.backend.activate(self.request, **kwargs)
+
+    def success_redirect(self, account):
+        """
+        Redirects to ``success_url``, or to the backend's
+        ``post_activation_redirect()``.
+        """
+        if self.success_url is not None:
+            return redirect(self.success_url)
+        to, args, kwargs = self.backend.post_activation_redirect(self.request,
+                                                                 account)
+        return redirect(to, *args, **kwargs)
+
+
+class RegisterView(BackendView):
+    """
+    Class-based version of the ``register`` view, which documents its
+    behaviour and arguments. Each phase is a method which subclasses can
+    override: ``check_allowed``, ``get_form_class``, ``register`` and
+    ``success_redirect``.
+    """
+    disallowed_url = 'registration_disallowed'
+    template_name = 'registration/registration_form.html'
+
+    def check_allowed(self):
+        rate_allowed = getattr(self.backend, 'registration_rate_allowed',
+                               None)
+        with timer('register.allowed'):
+            allowed = self.backend.registration_allowed(self.request)
+            limited = allowed and rate_allowed is not None and \
+                not rate_allowed(self.request)
+        if not allowed:
+            return redirect(self.disallowed_url)
+        if limited:
+            return HttpResponseTooManyRequests()
+
+    def get_form_class(self):
+        """
+        Returns the registration form class.
+        """
+        if self.form_class is not None:
+            return self.form_class
+        return self.backend.get_form_class(self.request)
+
+    def get(self, request, *args, **kwargs):
+        return self.render({'form': self.get_form_class()()})
+
+    def post(self, request, *args, **kwargs):
+        form = self.get_form_class()(data=request.POST, files=request.FILES)
+        with timer('register.form'):
+            valid = form.is_valid()
+        if valid:
+            with timer('register.backend'):
+                new_profile = self.register(form)
+            return self.success_redirect(new_profile)
+        return self.render({'form': form})
+
+    def register(self, form):
+        """
+        Registers the valid ``form``, returning the new profile.
+        """
+        return self.backend.register(self.request, **form.cleaned_data)
+
+    def success_redirect(self, new_profile):
+        """
+        Redirects to ``success_url``, or to the backend's
+        ``post_registration_redirect()``.
+        """
+        if self.success_url is not None:
+            return redirect(self.success_url)
+        to, args, kwargs = self.backend.post_registration_redirect(
+            self.request, new_profile)
+        return redirect(to, *args, **kwargs)
+
+
 def activate(request, backend, form_class=None, activation_method=None,
              template_name='registration/activate.html',
              success_url=None, extra_context=None, **kwargs):
@@ -40,6 +231,10 @@ def activate(request, backend, form_class=None, activation_method=None,
     ``registration/activate.html`` to display an error message; to
     override thise, pass the argument ``template_name`` (see below).
 
+    If the backend defines an ``activation_allowed()`` method, it will be
+    called first, passing the ``HttpRequest``; if it returns ``False`` an
+    empty response with status code 429 (Too Many Requests) is returned.
+
     **Arguments**
 
     ``backend``
@@ -86,39 +281,11 @@ def activate(request, backend, form_class=None, activation_method=None,
     registration/activate.html or ``template_name`` keyword argument.
     
     """
-    backend = get_backend(backend, activation_method=activation_method,
-            **kwargs)
-    if form_class is None:
-        activation_form = backend.get_activation_form_class(request)
-    if request.method == 'POST':
-        form = activation_form and activation_form(data=request.POST,
-                files=request.FILES)
-        kwargs['form'] = form
-        if not form or form.is_valid():
-            account, errors = backend.activate(request, **kwargs)
-
-            if account:
-                if success_url is None:
-                    to, args, kwargs = backend.post_activation_redirect(request,
-                            account)
-                    return redirect(to, *args, **kwargs)
-                else:
-                    return redirect(success_url)
-            if errors:
-                form._errors['__all__'] = errors
-
-    if extra_context is None:
-        extra_context = {}
-    context = RequestContext(request)
-    for key, value in extra_context.items():
-        context[key] = callable(value) and value() or value
-
-    if activation_form is not None and 'form' not in kwargs:
-        kwargs['form'] = activation_form()
-
-    return render_to_response(template_name,
-                            kwargs,
-                            context_instance=context)
+    return ActivateView.as_view(
+        backend=get_backend(backend, activation_method=activation_method),
+        form_class=form_class, template_name=template_name,
+        success_url=success_url, extra_context=extra_context)(request,
+                                                              **kwargs)
 
 
 def register(request, backend, success_url=None, form_class=None,
@@ -139,6 +306,11 @@ def register(request, backend, success_url=None, form_class=None,
        ``registration_disallowed``. To override this, see the list of
        optional arguments for this view (below).
 
+       If the backend also defines a ``registration_rate_allowed()``
+       method, it is then called the same way; if it returns ``False``
+       an empty response with status code 429 (Too Many Requests) is
+       returned.
+
     2. The form to use for account registration will be obtained by
        calling the backend's ``get_form_class()`` method, passing the
        ``HttpRequest``. To override this, see the list of optional
@@ -204,31 +376,7 @@ def register(request, backend, success_url=None, form_class=None,
     argument.
     
     """
-    backend = get_backend(backend, **kwargs)
-    if not backend.registration_allowed(request):
-        return redirect(disallowed_url)
-    if form_class is None:
-        form_class = backend.get_form_class(request)
-
-    if request.method == 'POST':
-        form = form_class(data=request.POST, files=request.FILES)
-        if form.is_valid():
-            new_profile = backend.register(request, **form.cleaned_data)
-            if success_url is None:
-                to, args, kwargs = backend.post_registration_redirect(request,
-                        new_profile)
-                return redirect(to, *args, **kwargs)
-            else:
-                return redirect(success_url)
-    else:
-        form = form_class()
-    
-    if extra_context is None:
-        extra_context = {}
-    context = RequestContext(request)
-    for key, value in extra_context.items():
-        context[key] = callable(value) and value() or value
-
-    return render_to_response(template_name,
-                              {'form': form},
-                              context_instance=context)
+    return RegisterView.as_view(
+        backend=get_backend(backend, **kwargs), success_url=success_url,
+        form_class=form_class, disallowed_url=disallowed_url,
+        template_name=template_name, extra_context=extra_context)(request)